@@ -1,65 +1,562 @@
+import math
 import os
+import sys
+import time
 from datetime import datetime, timedelta, timezone
-from flask import Flask, jsonify, request
-import psycopg2
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional
+from flask import Flask, Response, g, jsonify, request
+import psycopg2.errors
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from cache import ResponseCache, cached
+from downsample import lttb_indices
+from db import PoolTimeout, Statement, fetch_statement, fetch_statement_rows, rows_to_dicts, stream_statement
+from formats import ARROW_MIMETYPE, FORMATS, arrow_ipc, columnar, stream_arrow, stream_json_rows
+from live import HubFull, PriceHub
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from common import freshness, metrics
+from common.shm_ring import RingReader, TornRead, ns_to_datetime
+
 DB_URL = os.environ["DATABASE_URL"]
 
+# Where /ohlcv/1m reads candles from:
+#   ohlcv_1m  buckets aggregated from public.ticks (default)
+#   candles   native exchange candles in public.candles (sql/candles.sql)
+OHLCV_SOURCE = os.getenv("OHLCV_SOURCE", "ohlcv_1m").strip().lower()
+if OHLCV_SOURCE == "candles":
+    OHLCV_TABLE, OHLCV_FILTER = "public.candles", "and granularity = 60"
+else:
+    OHLCV_TABLE, OHLCV_FILTER = "public.ohlcv_1m", ""
+
+# TRACK_FRESHNESS=1 (sql/freshness.sql): ticks also carry when ingest received
+# them and when they were committed; /prices/latest adds per-stage lags.
+TICK_COLS = "symbol, event_time, price, volume, source" + (
+    ", received_at, committed_at" if freshness.track_freshness() else ""
+)
+
+# Fixed queries, PREPAREd once per pooled connection. Per-endpoint timeouts
+# can be overridden with STATEMENT_TIMEOUT_MS_<NAME>.
+LATEST_PRICES = Statement(
+    "latest_prices",
+    f"""
+    select distinct on (symbol)
+      {TICK_COLS}
+    from public.ticks
+    where symbol = any(%s)
+    order by symbol, event_time desc;
+    """,
+    ["text[]"],
+    timeout_ms=2000,
+)
+
+PRICE_HISTORY = Statement(
+    "price_history",
+    f"""
+    select {TICK_COLS}
+    from public.ticks
+    where symbol = %s and event_time >= %s
+    order by event_time asc;
+    """,
+    ["text", "timestamptz"],
+    timeout_ms=10000,
+)
+
+# Keyset pages: rows strictly after the last event_time / bucket of the
+# previous page, still bounded by the requested window.
+PRICE_HISTORY_PAGE = Statement(
+    "price_history_page",
+    f"""
+    select {TICK_COLS}
+    from public.ticks
+    where symbol = %s and event_time >= %s and event_time > %s
+    order by event_time asc
+    limit %s;
+    """,
+    ["text", "timestamptz", "timestamptz", "integer"],
+    timeout_ms=10000,
+)
+
+OHLCV_1M = Statement(
+    "ohlcv_1m",
+    f"""
+    select symbol, bucket as time, open, high, low, close, volume
+    from {OHLCV_TABLE}
+    where symbol = %s {OHLCV_FILTER} and bucket >= %s
+    order by bucket asc;
+    """,
+    ["text", "timestamptz"],
+    timeout_ms=10000,
+)
+
+OHLCV_1M_PAGE = Statement(
+    "ohlcv_1m_page",
+    f"""
+    select symbol, bucket as time, open, high, low, close, volume
+    from {OHLCV_TABLE}
+    where symbol = %s {OHLCV_FILTER} and bucket >= %s and bucket > %s
+    order by bucket asc
+    limit %s;
+    """,
+    ["text", "timestamptz", "timestamptz", "integer"],
+    timeout_ms=10000,
+)
+
+# 1m buckets re-aggregated to coarser bars: first open, max high, min low,
+# last close, summed volume. Bars are aligned to the UTC epoch grid.
+OHLCV_RESAMPLED = Statement(
+    "ohlcv_resampled",
+    f"""
+    select symbol,
+      date_bin(%s, bucket, timestamptz '2000-01-01 00:00:00+00') as time,
+      (array_agg(open order by bucket asc))[1] as open,
+      max(high) as high,
+      min(low) as low,
+      (array_agg(close order by bucket desc))[1] as close,
+      sum(volume) as volume
+    from {OHLCV_TABLE}
+    where symbol = %s {OHLCV_FILTER} and bucket >= %s
+    group by symbol, 2
+    order by 2 asc;
+    """,
+    ["interval", "text", "timestamptz"],
+    timeout_ms=10000,
+)
+
+# OHLCV_ROLLUPS=1 (with OHLCV_SOURCE=candles): public.candles also holds the
+# coarser bars the ingester rolls up (ingest/rollup.py), so /ohlcv reads every
+# interval with a range scan instead of re-aggregating 1m buckets. Only the
+# Binance websocket symbols (BTCUSDT, ...) are rolled up, and only at
+# ROLLUP_GRANULARITIES; other symbols / intervals (e.g. the 1m-only Coinbase
+# backfill of BTCUSD) fall back to OHLCV_RESAMPLED.
+OHLCV_ROLLUPS = OHLCV_SOURCE == "candles" and os.getenv("OHLCV_ROLLUPS", "0").strip().lower() in ("1", "true", "yes")
+
+OHLCV_BARS = Statement(
+    "ohlcv_bars",
+    """
+    select symbol, bucket as time, open, high, low, close, volume
+    from public.candles
+    where symbol = %s and granularity = %s and bucket >= %s
+    order by bucket asc;
+    """,
+    ["text", "integer", "timestamptz"],
+    timeout_ms=10000,
+)
+
+INTERVALS = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "15m": timedelta(minutes=15),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# Windows at least this long stream from a server-side cursor (json / arrow).
+STREAM_MIN_MINUTES = int(os.getenv("STREAM_MIN_MINUTES", "1440"))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "5000"))
+MAX_PAGE_ROWS = int(os.getenv("MAX_PAGE_ROWS", "50000"))
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Responses are cached until the next CACHE_ALIGN_SECONDS boundary (when a
+# new 1m bucket lands) and served with strong ETags. CACHE_ENABLED=0 disables.
+CACHE_ALIGN_SECONDS = int(os.getenv("CACHE_ALIGN_SECONDS", "60"))
+response_cache = (
+    ResponseCache(
+        max_bytes=int(os.getenv("CACHE_MAX_MB", "32")) * 1024 * 1024,
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+    )
+    if os.getenv("CACHE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+    else None
+)
+
+# /stream/prices: Server-Sent Events fed by LISTEN on the tick writer's
+# NOTIFY channel. Each open stream holds one server thread.
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+live_hub = PriceHub(
+    DB_URL,
+    channel=os.getenv("LIVE_CHANNEL", "ticks"),
+    max_subscribers=int(os.getenv("LIVE_MAX_SUBSCRIBERS", "500")),
+)
+
+# Shared-memory ring written by ingest/ws_stream.py (SHM_RING_PATH). When it
+# is fresh and covers the whole window, /prices/latest, /prices/history and
+# 1m candles are answered from it; older ranges still go to the database.
+SHM_RING_PATH = os.getenv("SHM_RING_PATH")
+ring = RingReader(SHM_RING_PATH, max_age_seconds=float(os.getenv("SHM_RING_MAX_AGE", "60"))) if SHM_RING_PATH else None
+
+# Served on /metrics (Prometheus text). `path` is the route rule, so
+# /ohlcv?interval=5m and /ohlcv?interval=1h share one series. Latency is
+# until the response object is ready: for streamed bodies, the first byte.
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "Request latency", ["path", "method", "status"])
+RESPONSE_ROWS = metrics.histogram(
+    "api_response_rows", "Rows in a response built by the view (cache hits excluded)", ["path"], buckets=metrics.ROW_BUCKETS
+)
+CACHE_RESULTS = metrics.counter("api_cache_total", "Cached responses served, by X-Cache result", ["path", "result"])
+DB_ERRORS = metrics.counter("api_db_errors_total", "Requests failed by the database", ["kind"])
+
 app = Flask(__name__)
 
-def fetch_all(query: str, params: tuple = ()):
-    with psycopg2.connect(DB_URL) as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            rows = cur.fetchall()
-            cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, r)) for r in rows]
+def route_path() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def start_timer():
+    g.t0 = time.perf_counter()
+
+@app.after_request
+def observe_request(resp):
+    path = route_path()
+    t0 = g.get("t0")
+    if t0 is not None:
+        REQUEST_SECONDS.labels(path=path, method=request.method, status=str(resp.status_code)).observe(time.perf_counter() - t0)
+    cache = resp.headers.get("X-Cache")
+    if cache:
+        CACHE_RESULTS.labels(path=path, result=cache).inc()
+    return resp
+
+def count_rows(n: int) -> None:
+    RESPONSE_ROWS.labels(path=route_path()).observe(n)
+
+def counted(chunks):
+    """Pass stream_statement() chunks through, counting rows once the stream ends."""
+    # resolved now: the body is iterated after the request context is gone
+    hist = RESPONSE_ROWS.labels(path=route_path())
+
+    def gen():
+        n = 0
+        for cols, rows in chunks:
+            n += len(rows)
+            yield cols, rows
+        hist.observe(n)
+
+    return gen()
+
+def symbol_list():
+    symbols = request.args.get("symbols", "BTCUSD,ETHUSD,SOLUSD")
+    return [s.strip().upper() for s in symbols.split(",") if s.strip()]
+
+def symbol_arg():
+    return request.args.get("symbol", "BTCUSD").upper()
+
+def minutes_arg(default: int) -> int:
+    return int(request.args.get("minutes", default))
+
+class BadParam(ValueError):
+    pass
+
+def format_arg() -> str:
+    fmt = request.args.get("format", "json").lower()
+    if fmt not in FORMATS:
+        raise BadParam(f"format must be one of {FORMATS}")
+    return fmt
+
+def page_args():
+    """(limit, after) for keyset pagination; limit is None when not paging."""
+    limit = request.args.get("limit")
+    if limit is None:
+        return None, None
+    limit = min(max(1, int(limit)), MAX_PAGE_ROWS)
+    after = request.args.get("after")
+    if not after:
+        return limit, EPOCH
+    try:
+        # an unencoded "+" in the offset arrives as a space
+        after_dt = datetime.fromisoformat(after.replace("Z", "+00:00").replace(" ", "+"))
+    except ValueError:
+        raise BadParam("after must be an ISO-8601 timestamp (use next_after from the previous page)")
+    if after_dt.tzinfo is None:
+        after_dt = after_dt.replace(tzinfo=timezone.utc)
+    return limit, after_dt
+
+def window_cache_key(default_minutes: int):
+    return (
+        symbol_arg(),
+        minutes_arg(default_minutes),
+        request.args.get("format", "json").lower(),
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("stream"),
+    )
+
+def trim_page(rows, time_idx: int, limit: int):
+    """
+    Cut a full page back to a timestamp boundary so rows sharing the last
+    timestamp are never split across pages. Returns (rows, next_after).
+    A page that is all one timestamp cannot be cut (the next page would
+    skip the rest of it), so that asks for a larger limit instead.
+    """
+    if len(rows) < limit:
+        return rows, None
+    last = rows[-1][time_idx]
+    k = len(rows)
+    while k > 0 and rows[k - 1][time_idx] == last:
+        k -= 1
+    if k == 0:
+        raise BadParam(f"{limit} or more rows share the timestamp {last.isoformat()}; retry this page with a larger limit")
+    rows = rows[:k]
+    return rows, rows[-1][time_idx].astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+def _num(x) -> Optional[Decimal]:
+    # same JSON shape as numeric columns read from Postgres; NaN (no volume) is NULL
+    x = float(x)
+    return None if math.isnan(x) else Decimal(repr(x))
+
+def ring_read(read, *args):
+    """read(*args) on the ring; None (use the DB) when the writer keeps the slot busy."""
+    try:
+        return read(*args)
+    except TornRead:
+        return None
+
+def ring_ticks(symbol: str, since: datetime):
+    """PRICE_HISTORY-shaped (cols, rows) from the ring, or None to use the DB."""
+    if ring is None:
+        return None
+    ticks = ring_read(ring.ticks_since, symbol, since)
+    if ticks is None:
+        return None
+    source = ring.source
+    rows = [(symbol, ns_to_datetime(t), _num(p), _num(v), source) for t, p, v in ticks.tolist()]
+    return ["symbol", "event_time", "price", "volume", "source"], rows
+
+def ring_candles(symbol: str, since: datetime):
+    """OHLCV_1M-shaped (cols, rows) from the ring, or None to use the DB."""
+    # the ring aggregates ticks, so it only stands in for ohlcv_1m
+    if ring is None or OHLCV_SOURCE != "ohlcv_1m":
+        return None
+    candles = ring_read(ring.candles_since, symbol, since)
+    if candles is None:
+        return None
+    rows = [
+        (symbol, datetime.fromtimestamp(b, tz=timezone.utc), _num(o), _num(h), _num(l), _num(c), _num(v))
+        for b, o, h, l, c, v, _ in candles.tolist()
+    ]
+    return ["symbol", "time", "open", "high", "low", "close", "volume"], rows
+
+def render_rows(fmt: str, cols, rows, paged: bool = False, next_after=None):
+    count_rows(len(rows))
+    if fmt == "arrow":
+        resp = Response(arrow_ipc(cols, rows), mimetype=ARROW_MIMETYPE)
+        if paged:
+            resp.headers["X-Next-After"] = next_after or ""
+        return resp
+    body = columnar(cols, rows) if fmt == "columnar" else {"data": rows_to_dicts(cols, rows)}
+    if paged:
+        body["next_after"] = next_after
+    return jsonify(body)
+
+def serve_window(stmt: Statement, page_stmt: Statement, symbol: str, minutes: int, time_col: str, from_ring=None):
+    """
+    Shared body of the windowed endpoints:
+      ?limit=N[&after=ts]      keyset page, returns next_after
+      from_ring(symbol, since) answers the window (short, recent windows)
+      minutes >= STREAM_MIN_MINUTES or ?stream=1
+                               json / arrow streamed from a named cursor
+      otherwise                one fetch, rendered as json / columnar / arrow
+    Columnar is never streamed (a column cannot be closed before the last row).
+    """
+    fmt = format_arg()
+    since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+
+    limit, after = page_args()
+    if limit is not None:
+        cols, rows = fetch_statement_rows(page_stmt, (symbol, since, after, limit))
+        rows, next_after = trim_page(rows, cols.index(time_col), limit)
+        return render_rows(fmt, cols, rows, paged=True, next_after=next_after)
+
+    hit = from_ring(symbol, since) if from_ring is not None else None
+    if hit is not None:
+        resp = render_rows(fmt, *hit)
+        resp.headers["X-Data-Source"] = "ring"
+        return resp
+
+    if fmt != "columnar" and (minutes >= STREAM_MIN_MINUTES or request.args.get("stream") == "1"):
+        pg_types = []
+        chunks = counted(stream_statement(stmt, (symbol, since), STREAM_CHUNK_ROWS, pg_types))
+        if fmt == "arrow":
+            return Response(stream_arrow(chunks, pg_types), mimetype=ARROW_MIMETYPE)
+        return Response(stream_json_rows(chunks, app.json.dumps), mimetype="application/json")
+
+    cols, rows = fetch_statement_rows(stmt, (symbol, since))
+    return render_rows(fmt, cols, rows)
+
+def floor_time(t: datetime, step: timedelta) -> datetime:
+    return EPOCH + ((t - EPOCH) // step) * step
+
+def downsample_rows(cols, rows, max_points: int):
+    """LTTB on the close series; keeps the whole bar at each chosen index."""
+    if len(rows) <= max_points:
+        return rows
+    ti, ci = cols.index("time"), cols.index("close")
+    xs = [r[ti].timestamp() for r in rows]
+    ys = [float(r[ci]) for r in rows]
+    return [rows[i] for i in lttb_indices(xs, ys, max_points)]
+
+@app.errorhandler(BadParam)
+def bad_param(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    DB_ERRORS.labels(kind="pool_timeout").inc()
+    return jsonify({"error": "database busy", "detail": str(e)}), 503
+
+@app.errorhandler(HubFull)
+def hub_full(e):
+    return jsonify({"error": "too many live streams", "detail": str(e)}), 503
+
+@app.errorhandler(psycopg2.errors.QueryCanceled)
+def query_canceled(e):
+    DB_ERRORS.labels(kind="query_canceled").inc()
+    return jsonify({"error": "query timed out"}), 504
 
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status":"ok"})
 
+@app.route("/metrics", methods=["GET"])
+def metrics_text():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# lag_s and the `api` freshness stage are measured per request, so with
+# TRACK_FRESHNESS the latest prices are not served from the response cache
 @app.route("/prices/latest", methods=["GET"])
+@cached(None if freshness.track_freshness() else response_cache, lambda: tuple(sorted(set(symbol_list()))), CACHE_ALIGN_SECONDS)
 def latest_prices():
-    symbols = request.args.get("symbols", "BTCUSD,ETHUSD,SOLUSD")
-    sym_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
-    q = """
-    select distinct on (symbol)
-      symbol, event_time, price, volume, source
-    from public.ticks
-    where symbol = any(%s)
-    order by symbol, event_time desc;
+    sym_list = symbol_list()
+    data, missing = [], []
+    for s in dict.fromkeys(sym_list):
+        t = ring_read(ring.latest_tick, s) if ring is not None else None
+        if t is None:
+            missing.append(s)
+        else:
+            data.append({"symbol": s, "event_time": t[0], "price": _num(t[1]), "volume": _num(t[2]), "source": ring.source})
+    if missing:
+        data.extend(fetch_statement(LATEST_PRICES, (missing,)))
+    data.sort(key=lambda r: r["symbol"])
+    if freshness.track_freshness():
+        add_lags(data)
+    count_rows(len(data))
+    return jsonify({"data": data})
+
+def add_lags(data) -> None:
+    """Per-stage lag of each latest tick (ring ticks carry no ingest timestamps)."""
+    served = freshness.now()
+    for r in data:
+        received, committed = r.setdefault("received_at", None), r.setdefault("committed_at", None)
+        r["lag_s"] = freshness.row_lags(r["event_time"], received, committed)
+        freshness.observe("api", freshness.lag_seconds(served, committed))
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+@app.route("/stream/prices", methods=["GET"])
+def stream_prices():
+    """
+    Push feed of the newest tick per symbol (?symbols=BTCUSD,ETHUSD).
+    Starts with a snapshot, then one `tick` event per update; a client that
+    reads slowly gets only the latest value per symbol, never a backlog.
     """
-    return jsonify({"data": fetch_all(q, (sym_list,))})
+    sym_list = symbol_list()
+    sub = live_hub.subscribe(sym_list)
+    try:
+        snapshot = live_hub.snapshot(sym_list)
+        missing = [s for s in sym_list if s not in snapshot]
+        if missing:
+            for r in fetch_statement(LATEST_PRICES, (missing,)):
+                snapshot[r["symbol"]] = {
+                    "symbol": r["symbol"],
+                    "event_time": r["event_time"].isoformat(),
+                    # floats like the NOTIFY payloads; volume may be NULL
+                    "price": float(r["price"]),
+                    "volume": float(r["volume"]) if r["volume"] is not None else None,
+                }
+    except Exception:
+        live_hub.unsubscribe(sub)
+        raise
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            for tick in snapshot.values():
+                yield sse("tick", tick)
+            while True:
+                ticks = sub.get(LIVE_HEARTBEAT_SECONDS)
+                if not ticks:
+                    # comment line; also how a closed client gets noticed
+                    yield ": keepalive\n\n"
+                for tick in ticks:
+                    yield sse("tick", tick)
+        finally:
+            live_hub.unsubscribe(sub)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/prices/history", methods=["GET"])
+@cached(response_cache, lambda: window_cache_key(60), CACHE_ALIGN_SECONDS)
 def price_history():
-    symbol = request.args.get("symbol", "BTCUSD").upper()
-    minutes = int(request.args.get("minutes", 60))
-    since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    q = """
-    select symbol, event_time, price, volume, source
-    from public.ticks
-    where symbol = %s and event_time >= %s
-    order by event_time asc;
-    """
-    return jsonify({"data": fetch_all(q, (symbol, since))})
+    return serve_window(PRICE_HISTORY, PRICE_HISTORY_PAGE, symbol_arg(), minutes_arg(60), "event_time", ring_ticks)
 
 @app.route("/ohlcv/1m", methods=["GET"])
+@cached(response_cache, lambda: window_cache_key(120), CACHE_ALIGN_SECONDS)
 def ohlcv_1m():
-    symbol = request.args.get("symbol", "BTCUSD").upper()
-    minutes = int(request.args.get("minutes", 120))
-    since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    q = """
-    select symbol, bucket as time, open, high, low, close, volume
-    from public.ohlcv_1m
-    where symbol = %s and bucket >= %s
-    order by bucket asc;
+    return serve_window(OHLCV_1M, OHLCV_1M_PAGE, symbol_arg(), minutes_arg(120), "time", ring_candles)
+
+@app.route("/ohlcv", methods=["GET"])
+@cached(
+    response_cache,
+    lambda: (
+        symbol_arg(),
+        minutes_arg(120),
+        request.args.get("interval", "1m"),
+        request.args.get("max_points"),
+        request.args.get("format", "json").lower(),
+    ),
+    CACHE_ALIGN_SECONDS,
+)
+def ohlcv():
+    """
+    ?interval=1m|5m|15m|1h|1d  server-side re-aggregation of 1m buckets
+                               (stored rollups with OHLCV_ROLLUPS=1)
+    ?max_points=N              LTTB-downsample the close series to N bars
     """
-    return jsonify({"data": fetch_all(q, (symbol, since))})
+    symbol = symbol_arg()
+    minutes = minutes_arg(120)
+    fmt = format_arg()
+    interval = request.args.get("interval", "1m")
+    if interval not in INTERVALS:
+        raise BadParam(f"interval must be one of {list(INTERVALS)}")
+    step = INTERVALS[interval]
+    max_points = request.args.get("max_points")
+    if max_points is not None:
+        max_points = int(max_points)
+        if max_points < 3:
+            raise BadParam("max_points must be >= 3")
+
+    # start on a bar boundary so the first bar is not partial
+    since = floor_time(datetime.now(timezone.utc) - timedelta(minutes=minutes), step)
+    if interval == "1m":
+        cols, rows = ring_candles(symbol, since) or fetch_statement_rows(OHLCV_1M, (symbol, since))
+    else:
+        rows = []
+        if OHLCV_ROLLUPS:
+            cols, rows = fetch_statement_rows(OHLCV_BARS, (symbol, int(step.total_seconds()), since))
+        # rollups that start after `since` (rolled up only since the ingester
+        # came up, or not at all) would cut the window short
+        if not rows or rows[0][cols.index("time")] > since:
+            cols, rows = fetch_statement_rows(OHLCV_RESAMPLED, (step, symbol, since))
+
+    if max_points is not None:
+        rows = downsample_rows(cols, rows, max_points)
+    return render_rows(fmt, cols, rows)
 
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=8000, debug=True)
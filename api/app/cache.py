@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Hashable, NamedTuple, Optional, Tuple
+
+from flask import Response, request
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: str
+    mimetype: str
+    expires_at: float
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+
+def next_boundary(align_seconds: int, grace_seconds: float = 0.0, now: Optional[float] = None) -> float:
+    """Epoch seconds of the next multiple of align_seconds (+ grace for late writes)."""
+    now = time.time() if now is None else now
+    return (int(now // align_seconds) + 1) * align_seconds + grace_seconds
+
+
+# Set by _respond(); every other header of the view's response is kept.
+_OWN_HEADERS = {"content-type", "content-length", "etag", "cache-control", "x-cache"}
+
+
+class ResponseCache:
+    """
+    In-process LRU of serialized response bodies, capped by total body bytes
+    and entry count. Entries expire at an absolute time (a bucket boundary)
+    rather than after a fixed TTL.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entries: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.time():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+        self,
+        key: Hashable,
+        body: bytes,
+        mimetype: str,
+        expires_at: float,
+        headers: Tuple[Tuple[str, str], ...] = (),
+    ) -> CacheEntry:
+        entry = CacheEntry(body, hashlib.sha1(body).hexdigest(), mimetype, expires_at, headers)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = entry
+            self._bytes += len(body)
+            while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        self._bytes -= len(entry.body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _respond(entry: CacheEntry, status: str) -> Response:
+    max_age = max(0, int(entry.expires_at - time.time()))
+    if request.if_none_match.contains(entry.etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(entry.body, mimetype=entry.mimetype)
+    resp.headers.extend(entry.headers)
+    resp.set_etag(entry.etag)
+    resp.headers["Cache-Control"] = f"public, max-age={max_age}"
+    resp.headers["X-Cache"] = status
+    return resp
+
+
+def cached(
+    cache: Optional[ResponseCache],
+    key_fn: Callable[[], Hashable],
+    align_seconds: int = 60,
+    grace_seconds: float = 2.0,
+):
+    """
+    Cache a view's 200 body until the next align_seconds boundary.
+    Responses carry a strong ETag; a matching If-None-Match gets 304 without
+    re-running the view or re-serializing the payload.
+    Pass cache=None to disable.
+    """
+
+    def deco(view):
+        if cache is None:
+            return view
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (view.__name__, key_fn())
+            entry = cache.get(key)
+            if entry is not None:
+                return _respond(entry, "HIT")
+
+            resp = view(*args, **kwargs)
+            if not isinstance(resp, Response) or resp.status_code != 200 or resp.is_streamed:
+                return resp
+            entry = cache.put(
+                key,
+                resp.get_data(),
+                resp.mimetype,
+                next_boundary(align_seconds, grace_seconds),
+                tuple((k, v) for k, v in resp.headers.items() if k.lower() not in _OWN_HEADERS),
+            )
+            return _respond(entry, "MISS")
+
+        return wrapper
+
+    return deco
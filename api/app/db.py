@@ -0,0 +1,250 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+
+def _env_int(name: str, default: int) -> int:
+    v = os.getenv(name)
+    if not v:
+        return default
+    try:
+        return int(v)
+    except ValueError:
+        return default
+
+
+DB_POOL_MIN = _env_int("DB_POOL_MIN", 1)
+DB_POOL_MAX = _env_int("DB_POOL_MAX", 10)
+# Seconds a request waits for a free connection before failing with 503.
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 5)
+# Server-side prepared statements. Turn off (DB_PREPARE=0) behind a
+# transaction-mode pooler such as pgbouncer / Supabase port 6543.
+DB_PREPARE = os.getenv("DB_PREPARE", "1").strip().lower() not in ("0", "false", "no")
+DEFAULT_STATEMENT_TIMEOUT_MS = _env_int("STATEMENT_TIMEOUT_MS", 5000)
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has PREPAREd."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class Statement:
+    """
+    A fixed query with its own statement_timeout.
+
+    sql uses %s placeholders; the PREPARE form is derived by numbering them
+    ($1, $2, ...) and needs one Postgres type per parameter.
+    """
+
+    def __init__(self, name: str, sql: str, param_types: Sequence[str], timeout_ms: Optional[int] = None):
+        self.name = name
+        self.sql = sql
+        self.param_types = tuple(param_types)
+        self.timeout_ms = _env_int(
+            f"STATEMENT_TIMEOUT_MS_{name.upper()}",
+            timeout_ms if timeout_ms is not None else DEFAULT_STATEMENT_TIMEOUT_MS,
+        )
+
+        counter = iter(range(1, len(self.param_types) + 1))
+        body = re.sub(r"%s", lambda _: f"${next(counter)}", sql.strip().rstrip(";"))
+        self.prepare_sql = f"PREPARE {name} ({', '.join(self.param_types)}) AS {body}"
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(self.param_types))})"
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool that keeps up to maxconn connections open (LIFO reuse)
+    and makes callers wait for a free one. psycopg2's own pools close every
+    connection above minconn on return, which brings back connect churn.
+    """
+
+    def __init__(self, dsn: str, minconn: int, maxconn: int, timeout: float):
+        self.dsn = dsn
+        self.maxconn = max(1, minconn, maxconn)
+        self.timeout = timeout
+        self._idle: List[PreparingConnection] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        for _ in range(max(0, minconn)):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self) -> PreparingConnection:
+        return psycopg2.connect(self.dsn, connection_factory=PreparingConnection)
+
+    def getconn(self) -> PreparingConnection:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"no database connection free after {self.timeout:g}s")
+                self._cond.wait(remaining)
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn: PreparingConnection, close: bool = False) -> None:
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        with self._cond:
+            if close or conn.closed:
+                if not conn.closed:
+                    conn.close()
+                self._size -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self) -> None:
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max": self.maxconn}
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ["DATABASE_URL"], DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+    return _pool
+
+
+@contextmanager
+def connection(timeout_ms: Optional[int] = None) -> Iterator[PreparingConnection]:
+    """
+    Borrow a pooled connection for one transaction. statement_timeout is set
+    with SET LOCAL, so it ends with the transaction. Broken connections are
+    discarded instead of being returned to the pool.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms or DEFAULT_STATEMENT_TIMEOUT_MS,))
+        yield conn
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def rows_to_dicts(cols: Sequence[str], rows: List[tuple]) -> List[Dict[str, Any]]:
+    # map/zip/dict all run in C; no per-row Python frame.
+    return list(map(dict, map(zip, repeat(cols), rows)))
+
+
+def _execute_prepared(conn: PreparingConnection, cur, stmt: Statement, params: tuple) -> None:
+    if stmt.name not in conn.prepared:
+        cur.execute(stmt.prepare_sql)
+        conn.prepared.add(stmt.name)
+    cur.execute(stmt.execute_sql, params)
+
+
+def fetch_statement_rows(stmt: Statement, params: tuple = ()) -> Tuple[List[str], List[tuple]]:
+    """(column names, row tuples) without building per-row dicts."""
+    with connection(stmt.timeout_ms) as conn:
+        with conn.cursor() as cur:
+            if DB_PREPARE:
+                _execute_prepared(conn, cur, stmt, params)
+            else:
+                cur.execute(stmt.sql, params)
+            rows = cur.fetchall()
+            cols = [d[0] for d in cur.description]
+    return cols, rows
+
+
+def fetch_statement(stmt: Statement, params: tuple = ()) -> List[Dict[str, Any]]:
+    cols, rows = fetch_statement_rows(stmt, params)
+    return rows_to_dicts(cols, rows)
+
+
+def stream_statement(
+    stmt: Statement,
+    params: tuple = (),
+    chunk_rows: int = 5000,
+    pg_types: Optional[List[int]] = None,
+) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """
+    Yield (columns, rows) chunks from a server-side (named) cursor, so memory
+    stays at one chunk whatever the window size. The pooled connection is held
+    until the generator is exhausted or closed. Always yields at least once.
+    statement_timeout applies to each FETCH, not to the whole stream.
+    pg_types, if given, is filled with the columns' type OIDs before the
+    first chunk is yielded.
+    """
+    with connection(stmt.timeout_ms) as conn:
+        with conn.cursor(name=f"{stmt.name}_stream") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(stmt.sql, params)
+            rows = cur.fetchmany(chunk_rows)
+            cols = [d[0] for d in cur.description]
+            if pg_types is not None:
+                pg_types[:] = [d[1] for d in cur.description]
+            yield cols, rows
+            while len(rows) == chunk_rows:
+                rows = cur.fetchmany(chunk_rows)
+                if rows:
+                    yield cols, rows
+
+
+def fetch_all(query: str, params: tuple = (), timeout_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Ad-hoc query on a pooled connection (no PREPARE)."""
+    with connection(timeout_ms) as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cols = [d[0] for d in cur.description]
+    return rows_to_dicts(cols, rows)
+
+
+def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
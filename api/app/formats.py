@@ -0,0 +1,130 @@
+import io
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+FORMATS = ("json", "columnar", "arrow")
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+def _pyarrow():
+    # Optional dependency: only needed for ?format=arrow.
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise RuntimeError("format=arrow needs pyarrow (pip install pyarrow)") from e
+    return pa
+
+
+# Postgres type OID -> Arrow type, for the column types of the statements
+# served here; other types are inferred from the values
+_PG_ARROW = {
+    16: lambda pa: pa.bool_(),
+    20: lambda pa: pa.int64(),
+    21: lambda pa: pa.int64(),
+    23: lambda pa: pa.int64(),
+    25: lambda pa: pa.string(),
+    700: lambda pa: pa.float64(),
+    701: lambda pa: pa.float64(),
+    1043: lambda pa: pa.string(),
+    1114: lambda pa: pa.timestamp("us"),
+    1184: lambda pa: pa.timestamp("us", tz="UTC"),
+    1700: lambda pa: pa.float64(),  # numeric ships as float64, see _to_arrow
+}
+
+
+def arrow_schema(pa, cols: Sequence[str], pg_types: Sequence[int]):
+    """Schema from the columns' Postgres types, or None if one of them is not mapped."""
+    if len(pg_types) != len(cols) or any(t not in _PG_ARROW for t in pg_types):
+        return None
+    return pa.schema([(c, _PG_ARROW[t](pa)) for c, t in zip(cols, pg_types)])
+
+
+def columnar(cols: Sequence[str], rows: List[tuple]) -> Dict[str, Any]:
+    """{"columns": [...], "data": {col: [values...]}}; key names appear once."""
+    if rows:
+        data = {c: list(v) for c, v in zip(cols, zip(*rows))}
+    else:
+        data = {c: [] for c in cols}
+    return {"columns": list(cols), "data": data}
+
+
+def _arrow_batch(pa, cols: Sequence[str], rows: List[tuple], schema=None):
+    columns = list(zip(*rows)) if rows else [() for _ in cols]
+    if schema is not None:
+        arrays = [_to_arrow(pa, list(v), f.type) for v, f in zip(columns, schema)]
+        return pa.record_batch(arrays, schema=schema)
+    arrays = [_to_arrow(pa, list(v)) for v in columns]
+    return pa.record_batch(arrays, names=list(cols))
+
+
+def _to_arrow(pa, values: List[Any], type_=None):
+    arr = pa.array(values)
+    # numeric columns arrive as Decimal; ship them as float64
+    if pa.types.is_decimal(arr.type):
+        arr = arr.cast(pa.float64())
+    if type_ is not None and arr.type != type_:
+        arr = pa.nulls(len(values), type=type_) if pa.types.is_null(arr.type) else arr.cast(type_)
+    return arr
+
+
+def arrow_ipc(cols: Sequence[str], rows: List[tuple]) -> bytes:
+    pa = _pyarrow()
+    batch = _arrow_batch(pa, cols, rows)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def stream_arrow(
+    chunks: Iterable[Tuple[Sequence[str], List[tuple]]],
+    pg_types: Optional[Sequence[int]] = None,
+) -> Iterator[bytes]:
+    """
+    Arrow IPC stream, one record batch per chunk. The schema comes from
+    pg_types (read once the first chunk is in, see db.stream_statement);
+    without them the first chunk fixes it, and a column that is all NULL
+    there cannot take values later.
+    """
+    pa = _pyarrow()
+    buf = io.BytesIO()
+    writer = None
+    schema = None
+    for cols, rows in chunks:
+        if writer is None and pg_types:
+            schema = arrow_schema(pa, cols, pg_types)
+        batch = _arrow_batch(pa, cols, rows, schema)
+        if writer is None:
+            schema = batch.schema
+            writer = pa.ipc.new_stream(buf, schema)
+        writer.write_batch(batch)
+        yield _drain(buf)
+    if writer is not None:
+        writer.close()
+        yield _drain(buf)
+
+
+def _drain(buf: io.BytesIO) -> bytes:
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate(0)
+    return data
+
+
+def stream_json_rows(
+    chunks: Iterable[Tuple[Sequence[str], List[tuple]]],
+    dumps: Callable[[Any], str],
+    extra: Optional[Dict[str, Any]] = None,
+) -> Iterator[str]:
+    """{"data": [row, row, ...]} written chunk by chunk."""
+    yield '{"data":['
+    first = True
+    for cols, rows in chunks:
+        if not rows:
+            continue
+        part = ",".join(dumps(dict(zip(cols, r))) for r in rows)
+        yield part if first else "," + part
+        first = False
+    yield "]"
+    for k, v in (extra or {}).items():
+        yield f",{dumps(k)}:{dumps(v)}"
+    yield "}"
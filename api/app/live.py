@@ -0,0 +1,164 @@
+import json
+import select
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+
+# One tick as pushed to subscribers:
+#   {"symbol": ..., "event_time": ISO-8601, "price": float, "volume": float or None}
+Tick = Dict[str, Any]
+
+
+class HubFull(Exception):
+    """LIVE_MAX_SUBSCRIBERS streams are already open."""
+
+
+class Subscription:
+    """
+    One subscriber's mailbox. It holds only the newest tick per symbol, so a
+    consumer that falls behind gets the latest value when it catches up
+    instead of an ever-growing backlog.
+    """
+
+    def __init__(self, symbols: Optional[Iterable[str]]):
+        self.symbols = set(symbols) if symbols else None
+        self._pending: Dict[str, Tick] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.coalesced = 0
+
+    def offer(self, tick: Tick) -> None:
+        if self.symbols is not None and tick["symbol"] not in self.symbols:
+            return
+        with self._lock:
+            if tick["symbol"] in self._pending:
+                self.coalesced += 1
+            self._pending[tick["symbol"]] = tick
+            self._ready.set()
+
+    def get(self, timeout: float) -> List[Tick]:
+        """Newest pending tick per symbol; [] if nothing arrived within timeout."""
+        if not self._ready.wait(timeout):
+            return []
+        with self._lock:
+            ticks = list(self._pending.values())
+            self._pending = {}
+            self._ready.clear()
+        return ticks
+
+
+def _from_notify(payload: str) -> List[Tick]:
+    # compact payload written by ingest/tick_writer.py: [{"s","t","p","v"}, ...]
+    return [
+        {"symbol": t["s"], "event_time": t["t"], "price": float(t["p"]), "volume": float(t["v"]) if t["v"] is not None else None}
+        for t in json.loads(payload)
+    ]
+
+
+class PriceHub:
+    """
+    Fans one upstream feed out to every open /stream/prices client.
+
+    The feed is Postgres LISTEN on `channel` (the tick writer NOTIFYs after
+    each committed batch) on a dedicated connection outside the request pool,
+    so the number of dashboards no longer drives query load. Code running in
+    the same process can also call publish() directly.
+
+    The listener starts with the first subscriber and reconnects with backoff.
+    """
+
+    def __init__(self, dsn: str, channel: str = "ticks", max_subscribers: int = 500):
+        self.dsn = dsn
+        self.channel = channel
+        self.max_subscribers = max_subscribers
+        self._subs: List[Subscription] = []
+        self._latest: Dict[str, Tick] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.received = 0
+        self.reconnects = 0
+
+    # ---------------- SUBSCRIBERS ---------------- #
+
+    def subscribe(self, symbols: Optional[Iterable[str]] = None) -> Subscription:
+        sub = Subscription(symbols)
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                raise HubFull(f"{self.max_subscribers} live streams already open")
+            self._subs.append(sub)
+        self._ensure_listener()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def snapshot(self, symbols: Iterable[str]) -> Dict[str, Tick]:
+        """Last tick seen by the hub for each of `symbols` that it has seen."""
+        with self._lock:
+            return {s: self._latest[s] for s in symbols if s in self._latest}
+
+    def publish(self, ticks: Iterable[Tick]) -> None:
+        with self._lock:
+            subs = list(self._subs)
+            for t in ticks:
+                prev = self._latest.get(t["symbol"])
+                if prev is None or t["event_time"] >= prev["event_time"]:
+                    self._latest[t["symbol"]] = t
+                self.received += 1
+                for sub in subs:
+                    sub.offer(t)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subs),
+                "max_subscribers": self.max_subscribers,
+                "received": self.received,
+                "coalesced": sum(s.coalesced for s in self._subs),
+                "reconnects": self.reconnects,
+                "listening": self._thread is not None and self._thread.is_alive(),
+            }
+
+    # ---------------- LISTENER ---------------- #
+
+    def _ensure_listener(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name="price-hub", daemon=True)
+                self._thread.start()
+
+    def _listen_forever(self) -> None:
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(self.channel)))
+                backoff = 1.0
+                while True:
+                    # wake periodically so a dead socket is noticed by poll()
+                    select.select([conn], [], [], 30.0)
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        try:
+                            self.publish(_from_notify(note.payload))
+                        except (ValueError, KeyError, TypeError) as e:
+                            print("live: bad NOTIFY payload:", e)
+            except Exception as e:
+                print(f"live: LISTEN {self.channel} failed ({e}); reconnecting in {backoff:.0f}s")
+                with self._lock:
+                    self.reconnects += 1
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
@@ -0,0 +1,419 @@
+"""
+Benchmark suite for the hot paths: ingest, API, features and inference.
+
+  python bench/run.py                                  everything, results in bench/results/<commit>.json
+  python bench/run.py --only ingest,features --out /tmp/b.json
+  python bench/run.py --compare bench/results/<old commit>.json
+
+Needs a local Postgres you can write to in BENCH_DATABASE_URL (or
+DATABASE_URL). Every input is synthetic and seeded from a fixed RNG:
+
+  ingest    insert_ticks (COPY + staging merge) into a temp copy of
+            public.ticks at several batch sizes, fresh and duplicate rows;
+            ws_stream.on_message msgs/s into an unstarted TickWriter queue,
+            with and without the shared-memory ring
+  api       p50 / p99 of /prices/latest, /prices/history and /ohlcv/1m with
+            BENCH_CLIENTS concurrent clients, against the Flask app in a
+            subprocess, with the response cache off and on. Ticks and candles
+            are seeded under BENCH* symbols with source='bench' and deleted
+            afterwards; /ohlcv/1m reads public.candles (sql/candles.sql)
+  features  add_features / make_target on BENCH_FEATURE_ROWS rows
+  predict   predict.py cold (a fresh interpreter per call) and warm
+            (predict() in-process) on the committed ml/data and ml/models
+
+Results are one flat {name: {"value", "unit"}} map plus the commit and
+machine they ran on, so two files can be diffed with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "ingest"))
+sys.path.insert(0, str(ROOT / "ml"))
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SUITES = ("ingest", "api", "features", "predict")
+
+SEED = 7
+BENCH_SOURCE = "bench"
+BENCH_SYMBOLS = ["BENCHA", "BENCHB", "BENCHC"]
+BENCH_TABLE = "bench_ticks"
+
+INSERT_ROWS = int(os.getenv("BENCH_INSERT_ROWS", "100000"))
+INSERT_BATCHES = [100, 1_000, 10_000]
+WS_MESSAGES = int(os.getenv("BENCH_WS_MESSAGES", "200000"))
+API_CLIENTS = int(os.getenv("BENCH_CLIENTS", "16"))
+API_REQUESTS = int(os.getenv("BENCH_API_REQUESTS", "2000"))
+FEATURE_ROWS = int(os.getenv("BENCH_FEATURE_ROWS", "1000000"))
+PREDICT_COLD_RUNS = int(os.getenv("BENCH_PREDICT_COLD_RUNS", "5"))
+PREDICT_WARM_RUNS = int(os.getenv("BENCH_PREDICT_WARM_RUNS", "200"))
+REPEATS = 3
+
+
+class Results:
+    def __init__(self):
+        self.values: Dict[str, dict] = {}
+
+    def add(self, name: str, value: float, unit: str) -> None:
+        self.values[name] = {"value": float(value), "unit": unit}
+        print(f"  {name:<52} {value:>14,.3f} {unit}")
+
+
+def best_of(fn: Callable[[], None], repeats: int = REPEATS) -> float:
+    """Fastest wall time of `repeats` calls, in seconds."""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def percentiles(samples: List[float], name: str, results: Results) -> None:
+    ms = np.asarray(samples) * 1000.0
+    results.add(f"{name}.p50_ms", np.percentile(ms, 50), "ms")
+    results.add(f"{name}.p99_ms", np.percentile(ms, 99), "ms")
+
+
+def db_url() -> str:
+    url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("Missing BENCH_DATABASE_URL (or DATABASE_URL)")
+    return url
+
+
+# ---------------- INGEST ---------------- #
+
+def synth_ticks(n: int, start: datetime, step: timedelta, symbols=BENCH_SYMBOLS):
+    """(event_time, symbol, price, volume) random walks, one row per symbol per step."""
+    rng = np.random.default_rng(SEED)
+    per = -(-n // len(symbols))
+    rows = []
+    for s in symbols:
+        price = 100.0 * np.exp(np.cumsum(rng.normal(0, 1e-4, per)))
+        volume = rng.exponential(1.0, per)
+        rows.extend((start + i * step, s, float(price[i]), float(volume[i])) for i in range(per))
+    return rows[:n]
+
+
+def bench_insert_ticks(conn, results: Results) -> None:
+    from bulk_load import copy_ticks
+
+    rows = synth_ticks(INSERT_ROWS, datetime(2024, 1, 1, tzinfo=timezone.utc), timedelta(seconds=1))
+    for batch in INSERT_BATCHES:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            cur.execute(f"CREATE TEMP TABLE {BENCH_TABLE} (LIKE public.ticks INCLUDING ALL)")
+        conn.commit()
+        # insert_ticks() is copy_ticks() into public.ticks; same path, temp table
+        for label in ("fresh", "duplicate"):
+            t0 = time.perf_counter()
+            for i in range(0, len(rows), batch):
+                copy_ticks(conn, rows[i : i + batch], source=BENCH_SOURCE, table=BENCH_TABLE)
+            dt = time.perf_counter() - t0
+            results.add(f"ingest.insert_ticks.batch_{batch}.{label}.rows_per_s", len(rows) / dt, "rows/s")
+
+
+def binance_messages(n: int) -> List[str]:
+    rng = np.random.default_rng(SEED)
+    prices = 100.0 * np.exp(np.cumsum(rng.normal(0, 1e-4, n)))
+    t0 = 1_700_000_000_000
+    return [
+        json.dumps({"stream": "x", "data": {"s": BENCH_SYMBOLS[i % 3], "c": f"{prices[i]:.2f}", "v": "12.5", "E": t0 + i}})
+        for i in range(n)
+    ]
+
+
+def bench_on_message(results: Results) -> None:
+    # The writer is never started: submit() only enqueues, so this is the
+    # per-message cost on the websocket thread (parse + enqueue [+ ring]).
+    os.environ["DATABASE_URL"] = db_url()
+    os.environ["WRITER_QUEUE_MAX"] = str(WS_MESSAGES + 1)
+    os.environ.pop("SHM_RING_PATH", None)
+    import ws_stream
+    from common.shm_ring import RingWriter
+    from tick_writer import TickWriter
+
+    messages = binance_messages(WS_MESSAGES)
+
+    def run(label: str) -> None:
+        ws_stream.writer = TickWriter.from_env(ws_stream.DB_URL)
+        t0 = time.perf_counter()
+        for m in messages:
+            ws_stream.on_message(None, m)
+        dt = time.perf_counter() - t0
+        results.add(f"ingest.on_message.{label}.msgs_per_s", len(messages) / dt, "msgs/s")
+
+    run("queue")
+    with tempfile.TemporaryDirectory() as tmp:
+        ws_stream.ring = RingWriter(str(Path(tmp) / "bench.ring"), source="binance")
+        try:
+            run("queue_ring")
+        finally:
+            ws_stream.ring.close()
+            ws_stream.ring = None
+
+
+def bench_ingest(results: Results) -> None:
+    with psycopg2.connect(db_url()) as conn:
+        bench_insert_ticks(conn, results)
+    bench_on_message(results)
+
+
+# ---------------- API ---------------- #
+
+def seed_api_data(conn) -> None:
+    from bulk_load import copy_ticks
+    from candle_sink import upsert_candles
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    # 2h of 1s ticks and 1d of 1m candles per symbol, ending now
+    ticks = synth_ticks(2 * 3600 * len(BENCH_SYMBOLS), now - timedelta(hours=2), timedelta(seconds=1))
+    copy_ticks(conn, ticks, source=BENCH_SOURCE)
+    start = now.replace(second=0) - timedelta(days=1)
+    candles = [
+        (t, s, p, p * 1.001, p * 0.999, p, v)
+        for t, s, p, v in synth_ticks(1440 * len(BENCH_SYMBOLS), start, timedelta(minutes=1))
+    ]
+    upsert_candles(conn, candles, granularity=60, source=BENCH_SOURCE)
+
+
+def clear_api_data(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("delete from public.ticks where source = %s", (BENCH_SOURCE,))
+        cur.execute("delete from public.candles where source = %s", (BENCH_SOURCE,))
+    conn.commit()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(port: int, cache: bool) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=db_url(),
+        OHLCV_SOURCE="candles",
+        CACHE_ENABLED="1" if cache else "0",
+        DB_POOL_MAX=str(max(API_CLIENTS, 10)),
+    )
+    env.pop("SHM_RING_PATH", None)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1", "--port", str(port), "--no-reload"],
+        cwd=ROOT / "api" / "app",
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("API exited on startup")
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("API did not come up in 30s")
+
+
+def load(url: str, n: int, clients: int) -> List[float]:
+    """Latency of n GETs of url spread over `clients` threads."""
+    def one(_):
+        t0 = time.perf_counter()
+        with urllib.request.urlopen(url, timeout=30) as r:
+            r.read()
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(clients)))  # warm up connections and the pool
+        return list(pool.map(one, range(n)))
+
+
+API_ENDPOINTS = {
+    "prices_latest": "/prices/latest?symbols=" + ",".join(BENCH_SYMBOLS),
+    "prices_history": f"/prices/history?symbol={BENCH_SYMBOLS[0]}&minutes=60",
+    "ohlcv_1m": f"/ohlcv/1m?symbol={BENCH_SYMBOLS[0]}&minutes=720",
+}
+
+
+def bench_api(results: Results) -> None:
+    with psycopg2.connect(db_url()) as conn:
+        clear_api_data(conn)
+        seed_api_data(conn)
+        try:
+            for cache in (False, True):
+                port = free_port()
+                proc = start_api(port, cache)
+                try:
+                    for name, path in API_ENDPOINTS.items():
+                        t0 = time.perf_counter()
+                        samples = load(f"http://127.0.0.1:{port}{path}", API_REQUESTS, API_CLIENTS)
+                        label = f"api.{name}.{'cached' if cache else 'uncached'}"
+                        percentiles(samples, label, results)
+                        results.add(f"{label}.req_per_s", len(samples) / (time.perf_counter() - t0), "req/s")
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=10)
+        finally:
+            clear_api_data(conn)
+
+
+# ---------------- FEATURES ---------------- #
+
+def synth_candles(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(SEED)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    return pd.DataFrame(
+        {
+            "bucket": pd.date_range("2020-01-01", periods=n, freq="1min", tz="UTC"),
+            "open": close,
+            "high": close * 1.001,
+            "low": close * 0.999,
+            "close": close,
+            "volume": rng.exponential(10.0, n),
+        }
+    )
+
+
+def bench_features(results: Results) -> None:
+    from features import add_features
+    from train_forecast import make_target
+
+    df = synth_candles(FEATURE_ROWS)
+    featured = add_features(df)
+    dt = best_of(lambda: add_features(df))
+    results.add(f"features.add_features.rows_{FEATURE_ROWS}.s", dt, "s")
+    results.add("features.add_features.rows_per_s", FEATURE_ROWS / dt, "rows/s")
+    dt = best_of(lambda: make_target(featured, horizon=60, mode="D", thr=0.0035))
+    results.add(f"features.make_target.rows_{FEATURE_ROWS}.s", dt, "s")
+    results.add("features.make_target.rows_per_s", FEATURE_ROWS / dt, "rows/s")
+
+
+# ---------------- PREDICT ---------------- #
+
+PREDICT_ARGS = ("BTCUSD", 60, "D", 0.0035)
+
+
+def bench_predict(results: Results) -> None:
+    symbol, horizon, mode, thr = PREDICT_ARGS
+    cmd = [sys.executable, str(ROOT / "ml" / "predict.py"), symbol, str(horizon), "--mode", mode, "--thr", str(thr)]
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    cold = []
+    for _ in range(PREDICT_COLD_RUNS):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, check=True, env=env, stdout=subprocess.DEVNULL)
+        cold.append(time.perf_counter() - t0)
+    percentiles(cold, "predict.cold", results)
+
+    from predict import predict
+
+    predict(symbol, horizon, mode, thr)  # imports and page cache
+    warm = []
+    for _ in range(PREDICT_WARM_RUNS):
+        t0 = time.perf_counter()
+        predict(symbol, horizon, mode, thr)
+        warm.append(time.perf_counter() - t0)
+    percentiles(warm, "predict.warm", results)
+
+
+# ---------------- DRIVER ---------------- #
+
+BENCHES = {
+    "ingest": bench_ingest,
+    "api": bench_api,
+    "features": bench_features,
+    "predict": bench_predict,
+}
+
+
+def git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(old_path: Path, new: dict) -> None:
+    old = json.loads(old_path.read_text())
+    print(f"\nvs {old.get('commit')} ({old_path})")
+    for name, v in new["results"].items():
+        before = old["results"].get(name)
+        if before is None or before["value"] == 0:
+            continue
+        ratio = v["value"] / before["value"]
+        print(f"  {name:<52} {before['value']:>14,.3f} -> {v['value']:>14,.3f} {v['unit']:<7} x{ratio:.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", type=str, default=",".join(SUITES), help=f"comma-separated subset of {','.join(SUITES)}")
+    parser.add_argument("--out", type=str, default=None, help="default: bench/results/<commit>.json")
+    parser.add_argument("--compare", type=str, default=None, help="earlier results file to print ratios against")
+    args = parser.parse_args(argv)
+    args.only = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(args.only) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s) {sorted(unknown)}; choose from {SUITES}")
+    return args
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    results = Results()
+    for suite in args.only:
+        print(f"⏱  {suite}")
+        BENCHES[suite](results)
+
+    out = {
+        "commit": commit,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "machine": machine(),
+        "suites": args.only,
+        "results": results.values,
+    }
+    out_path = Path(args.out) if args.out else RESULTS_DIR / f"{commit}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(out, indent=2))
+    print(f"💾 {out_path}")
+    if args.compare:
+        compare(Path(args.compare), out)
+
+
+if __name__ == "__main__":
+    main()
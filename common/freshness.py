@@ -0,0 +1,66 @@
+"""
+Data-freshness tracing: how long each pipeline stage holds a tick or a
+candle between the exchange and a served response / prediction.
+
+Stages (freshness_lag_seconds{stage=...}, see common/metrics.py):
+
+  exchange   exchange event_time -> received by the ingester
+  queue      received -> the tick writer picked up its batch
+  commit     batch picked up -> committed to public.ticks
+  backfill   REST candles received -> committed (backfill_engine.py)
+  api        committed -> served by the API (newest row of a response)
+  export     1m bucket closed -> in the exported parquet (ml/export_ohlcv.py)
+  predict    1m bucket closed -> prediction served (predict.py / predict_server.py)
+
+With TRACK_FRESHNESS=1 (after running sql/freshness.sql) the ingesters also
+store received_at on every tick and candle; committed_at is stamped by the
+database (column default / upsert). The API then returns both columns and
+per-row lags. Without it the histograms still work from in-process clocks.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from common import metrics
+
+
+def track_freshness() -> bool:
+    """TRACK_FRESHNESS=1; read on each call, so a .env loaded after import still counts."""
+    return os.getenv("TRACK_FRESHNESS", "0").strip().lower() in ("1", "true", "yes")
+
+
+# seconds; from sub-millisecond queueing up to hours-old exports
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 3600.0, 14400.0)
+
+LAG = metrics.histogram("freshness_lag_seconds", "Time a tick / candle spent in each pipeline stage", ["stage"], buckets=LAG_BUCKETS)
+
+BUCKET = timedelta(minutes=1)
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def lag_seconds(later: Optional[datetime], earlier: Optional[datetime]) -> Optional[float]:
+    if later is None or earlier is None:
+        return None
+    return (later - earlier).total_seconds()
+
+
+def observe(stage: str, seconds: Optional[float]) -> None:
+    if seconds is not None:
+        LAG.labels(stage=stage).observe(max(0.0, seconds))
+
+
+def bucket_close(bucket: datetime) -> datetime:
+    """When a 1m candle starting at `bucket` stops changing."""
+    return bucket + BUCKET
+
+
+def row_lags(event_time: datetime, received_at: Optional[datetime], committed_at: Optional[datetime]) -> Dict[str, Optional[float]]:
+    """Per-stage lag of one stored tick, in seconds (None where a timestamp is missing)."""
+    return {
+        "exchange": lag_seconds(received_at, event_time),
+        "ingest": lag_seconds(committed_at, received_at),
+        "total": lag_seconds(committed_at, event_time),
+    }
@@ -0,0 +1,351 @@
+"""
+Fixed-size, memory-mapped ring buffers of recent ticks and 1m candles,
+one slot per symbol, shared between the ingest process (single writer) and
+API processes (readers).
+
+File layout (all little-endian, aligned):
+
+  header   magic, version, geometry, heartbeat_ns, source
+  slot[i]  symbol, seq, since_ns, ticks_written, candles_written,
+           ticks[TICK_CAPACITY], candles[CANDLE_CAPACITY]
+
+Each slot is guarded by a seqlock: the writer bumps `seq` to an odd value,
+writes, then bumps it back to even. Readers copy what they need and retry
+if `seq` was odd or changed underneath them, so they never return a torn
+write and never block the writer.
+
+Put the file on tmpfs (/dev/shm on Linux) so it never touches disk.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"CPRING1"
+VERSION = 2
+
+TICK_DTYPE = np.dtype(
+    [("t_ns", "<i8"), ("price", "<f8"), ("volume", "<f8")],
+    align=True,
+)
+CANDLE_DTYPE = np.dtype(
+    [
+        ("bucket_s", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<f8"),
+        ("last_ns", "<i8"),  # event time of the tick that set close
+    ],
+    align=True,
+)
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("n_slots", "<u4"),
+        ("tick_capacity", "<u4"),
+        ("candle_capacity", "<u4"),
+        ("heartbeat_ns", "<i8"),
+        ("source", "S16"),
+    ],
+    align=True,
+)
+HEADER_BYTES = 64  # header is padded to this so slots stay 64-byte aligned
+
+
+def slot_dtype(tick_capacity: int, candle_capacity: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("symbol", "S16"),
+            ("seq", "<u8"),
+            ("since_ns", "<i8"),
+            ("ticks_written", "<u8"),
+            ("candles_written", "<u8"),
+            ("ticks", TICK_DTYPE, (tick_capacity,)),
+            ("candles", CANDLE_DTYPE, (candle_capacity,)),
+        ],
+        align=True,
+    )
+
+
+class TornRead(Exception):
+    """The writer kept a slot busy for every retry."""
+
+
+def _ns(dt: datetime) -> int:
+    return int(dt.timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+
+
+def ns_to_datetime(ns: int) -> datetime:
+    return datetime.fromtimestamp(ns // 1_000_000_000, tz=timezone.utc).replace(
+        microsecond=(ns % 1_000_000_000) // 1000
+    )
+
+
+def _tail(ring: np.ndarray, written: int) -> np.ndarray:
+    """Copy of the retained entries of a ring, oldest first."""
+    cap = len(ring)
+    if written <= cap:
+        return ring[:written].copy()
+    head = written % cap
+    return np.concatenate((ring[head:], ring[:head]))
+
+
+class RingWriter:
+    """
+    Single writer. Opening resets every slot, so whatever a slot holds is
+    contiguous from its since_ns: readers can tell whether a window is
+    complete without asking the database.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        n_slots: int = 32,
+        tick_capacity: int = 4096,
+        candle_capacity: int = 1440,
+        source: str = "",
+    ):
+        self.path = path
+        self._slot_dtype = slot_dtype(tick_capacity, candle_capacity)
+        size = HEADER_BYTES + n_slots * self._slot_dtype.itemsize
+
+        if not self._matches(path, n_slots, tick_capacity, candle_capacity, size):
+            # new inode: readers holding the old mapping keep a valid (stale)
+            # view and re-open when they notice the inode change
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.truncate(size)
+            os.replace(tmp, path)
+
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+        self._header = self._mm[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0:1]
+        self._slots = self._mm[HEADER_BYTES:].view(self._slot_dtype)
+        self._index = {}
+
+        for i in range(n_slots):
+            self._begin(i)
+            self._slots["symbol"][i] = b""
+            self._slots["since_ns"][i] = 0
+            self._slots["ticks_written"][i] = 0
+            self._slots["candles_written"][i] = 0
+            self._end(i)
+
+        h = self._header
+        h["version"] = VERSION
+        h["n_slots"] = n_slots
+        h["tick_capacity"] = tick_capacity
+        h["candle_capacity"] = candle_capacity
+        h["source"] = source.encode()[:16]
+        h["heartbeat_ns"] = time.time_ns()
+        h["magic"] = MAGIC  # last: readers ignore the file until this is set
+
+    @staticmethod
+    def _matches(path: str, n_slots: int, tick_capacity: int, candle_capacity: int, size: int) -> bool:
+        try:
+            if os.path.getsize(path) != size:
+                return False
+            h = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+        except (OSError, IndexError):
+            return False
+        return (
+            h["magic"] == MAGIC
+            and h["version"] == VERSION
+            and (h["n_slots"], h["tick_capacity"], h["candle_capacity"]) == (n_slots, tick_capacity, candle_capacity)
+        )
+
+    # ---------------- SEQLOCK ---------------- #
+
+    def _begin(self, i: int) -> None:
+        self._slots["seq"][i] += 1  # odd: write in progress
+
+    def _end(self, i: int) -> None:
+        self._slots["seq"][i] += 1  # even: consistent
+
+    def _slot(self, symbol: str) -> int:
+        i = self._index.get(symbol)
+        if i is not None:
+            return i
+        i = len(self._index)
+        if i >= len(self._slots):
+            raise ValueError(f"ring {self.path} has no free slot for {symbol}")
+        self._begin(i)
+        self._slots["symbol"][i] = symbol.encode()[:16]
+        self._slots["since_ns"][i] = time.time_ns()
+        self._end(i)
+        self._index[symbol] = i
+        return i
+
+    # ---------------- WRITES ---------------- #
+
+    def add_tick(self, symbol: str, event_time: datetime, price: float, volume: Optional[float] = None) -> None:
+        """Append a tick and fold it into its 1m candle; volume None is stored as NaN (unknown)."""
+        i = self._slot(symbol)
+        t_ns = _ns(event_time)
+        volume = float("nan") if volume is None else volume
+        bucket_s = (t_ns // 1_000_000_000) // 60 * 60
+        slot = self._slots[i]
+        ticks, candles = slot["ticks"], slot["candles"]
+
+        self._begin(i)
+        n = int(slot["ticks_written"])
+        ticks[n % len(ticks)] = (t_ns, price, volume)
+        slot["ticks_written"] = n + 1
+
+        k = self._find_candle(slot, bucket_s)
+        if k is None:
+            if self._append_candle(slot, bucket_s):
+                candles[(int(slot["candles_written"]) - 1) % len(candles)] = (
+                    bucket_s, price, price, price, price, volume, t_ns,
+                )
+        else:
+            c = candles[k]
+            c["high"] = max(c["high"], price)
+            c["low"] = min(c["low"], price)
+            if t_ns >= c["last_ns"]:  # an out-of-order tick does not move close
+                c["close"] = price
+                c["last_ns"] = t_ns
+            c["volume"] += volume  # NaN once any tick had no volume
+        self._end(i)
+        self._header["heartbeat_ns"] = time.time_ns()
+
+    @staticmethod
+    def _find_candle(slot, bucket_s: int) -> Optional[int]:
+        """Ring index of bucket_s if retained (late ticks look back a few buckets)."""
+        candles = slot["candles"]
+        n = int(slot["candles_written"])
+        cap = len(candles)
+        for back in range(1, min(n, 5) + 1):
+            k = (n - back) % cap
+            b = int(candles[k]["bucket_s"])
+            if b == bucket_s:
+                return k
+            if b < bucket_s:
+                return None
+        return None
+
+    @staticmethod
+    def _append_candle(slot, bucket_s: int) -> bool:
+        """Reserve the next candle position unless bucket_s is older than the newest one."""
+        candles = slot["candles"]
+        n = int(slot["candles_written"])
+        if n and int(candles[(n - 1) % len(candles)]["bucket_s"]) > bucket_s:
+            return False
+        slot["candles_written"] = n + 1
+        return True
+
+    def close(self) -> None:
+        self._mm.flush()
+        del self._mm
+
+
+class RingReader:
+    """
+    Read side, safe to use from many threads. The file is opened lazily and
+    re-opened when the writer replaces it; every call returns None when the
+    ring is missing, stale (no write for max_age_seconds) or cannot answer.
+    """
+
+    def __init__(self, path: str, max_age_seconds: float = 60.0, retries: int = 100):
+        self.path = path
+        self.max_age_ns = int(max_age_seconds * 1e9)
+        self.retries = retries
+        self._ino = None
+        self._header = None
+        self._slots = None
+
+    def _open(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if st.st_ino == self._ino and self._slots is not None:
+            return True
+        mm = np.memmap(self.path, dtype=np.uint8, mode="r", shape=(st.st_size,))
+        header = mm[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0:1]
+        if header["magic"][0] != MAGIC or header["version"][0] != VERSION:
+            return False
+        dt = slot_dtype(int(header["tick_capacity"][0]), int(header["candle_capacity"][0]))
+        n_slots = int(header["n_slots"][0])
+        if st.st_size < HEADER_BYTES + n_slots * dt.itemsize:
+            return False
+        self._header = header
+        self._slots = mm[HEADER_BYTES:HEADER_BYTES + n_slots * dt.itemsize].view(dt)
+        self._ino = st.st_ino
+        return True
+
+    def _live(self) -> bool:
+        if not self._open():
+            return False
+        return time.time_ns() - int(self._header["heartbeat_ns"][0]) <= self.max_age_ns
+
+    @property
+    def source(self) -> str:
+        return self._header["source"][0].decode() if self._open() else ""
+
+    def _find(self, symbol: str) -> Optional[int]:
+        hits = np.flatnonzero(self._slots["symbol"] == symbol.encode())
+        return int(hits[0]) if len(hits) else None
+
+    def _consistent(self, i: int, read):
+        seqs = self._slots["seq"]
+        for attempt in range(self.retries):
+            s1 = int(seqs[i])
+            if s1 & 1 == 0:
+                out = read(self._slots[i])
+                if int(seqs[i]) == s1:
+                    return out
+            if attempt > 10:
+                time.sleep(0)
+        raise TornRead(f"{self.path}: slot {i} busy after {self.retries} tries")
+
+    def latest_tick(self, symbol: str) -> Optional[Tuple[datetime, float, float]]:
+        """(event_time, price, volume) of the newest tick, or None."""
+        if not self._live():
+            return None
+        i = self._find(symbol)
+        if i is None:
+            return None
+
+        def read(slot):
+            n = int(slot["ticks_written"])
+            return slot["ticks"][(n - 1) % len(slot["ticks"])].copy() if n else None
+
+        t = self._consistent(i, read)
+        if t is None:
+            return None
+        return ns_to_datetime(int(t["t_ns"])), float(t["price"]), float(t["volume"])
+
+    def ticks_since(self, symbol: str, since: datetime) -> Optional[np.ndarray]:
+        """TICK_DTYPE array with t_ns >= since, or None unless the ring holds the whole window."""
+        return self._window(symbol, _ns(since), "ticks", "ticks_written", "t_ns", 1)
+
+    def candles_since(self, symbol: str, since: datetime) -> Optional[np.ndarray]:
+        """CANDLE_DTYPE array with bucket >= since, or None unless the ring holds the whole window."""
+        return self._window(symbol, _ns(since), "candles", "candles_written", "bucket_s", 1_000_000_000)
+
+    def _window(self, symbol: str, since_ns: int, field: str, count: str, key: str, unit: int):
+        if not self._live():
+            return None
+        i = self._find(symbol)
+        if i is None:
+            return None
+
+        def read(slot):
+            n = int(slot[count])
+            ring = slot[field]
+            if n > len(ring):
+                # wrapped: complete only if the oldest retained entry is old enough
+                oldest = int(ring[n % len(ring)][key]) * unit
+                if oldest > since_ns:
+                    return None
+            elif int(slot["since_ns"]) > since_ns:
+                return None
+            data = _tail(ring, n)
+            return data[np.searchsorted(data[key] * unit, since_ns):]
+
+        return self._consistent(i, read)
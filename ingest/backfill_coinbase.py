@@ -1,14 +1,24 @@
 import os
-import time
+import sys
 import requests
 import psycopg2
-from psycopg2.extras import execute_values
 from datetime import datetime, timedelta, timezone
-from typing import List, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from backfill_engine import run_backfill
+from bulk_load import LoadResult, copy_ticks
+from candle_sink import coinbase_to_candles, make_sink_writer
+from rate_limit import TokenBucket
+from watermarks import incremental_start, read_watermark, save_watermark
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import metrics
 
 # ---------------- CONFIG ---------------- #
 
-COINBASE_BASE = "https://api.exchange.coinbase.com"
+# COINBASE_BASE=http://127.0.0.1:9443 for ingest/fake_exchange.py
+COINBASE_BASE = os.getenv("COINBASE_BASE", "https://api.exchange.coinbase.com").rstrip("/")
 MAX_CANDLES_PER_REQUEST = 300
 
 DB_CONFIG = {
@@ -47,70 +57,52 @@ def symbol_to_product_id(symbol: str) -> str:
 
 # ---------------- COINBASE ---------------- #
 
-def fetch_candles(product_id: str, start: datetime, end: datetime, granularity: int):
+def fetch_candles(
+    product_id: str,
+    start: datetime,
+    end: datetime,
+    granularity: int,
+    session: Optional[requests.Session] = None,
+):
     url = f"{COINBASE_BASE}/products/{product_id}/candles"
     params = {"start": iso_z(start), "end": iso_z(end), "granularity": granularity}
-    r = requests.get(url, params=params, timeout=30)
+    r = (session or requests).get(url, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
 
 # ---------------- DATABASE ---------------- #
 
-def insert_ticks(conn, rows) -> int:
+def insert_ticks(conn, rows, received_at: Optional[datetime] = None) -> LoadResult:
     """
     rows: List[(ts_utc, symbol, price_close, volume)]
-    Dedup via ON CONFLICT. This assumes you have a UNIQUE index compatible with (symbol,event_time,price)
+    COPY into a staging table, then merge with ON CONFLICT DO NOTHING so rows
+    already covered by a unique index (e.g. (symbol, event_time, price)) are skipped.
     """
-    if not rows:
-        return 0
-
-    sql = """
-    INSERT INTO public.ticks (event_time, symbol, price, volume, source)
-    VALUES %s
-    ON CONFLICT (symbol, event_time, price) DO NOTHING;
-    """
-
-    with conn.cursor() as cur:
-        execute_values(
-            cur,
-            sql,
-            [(t, s, p, v, "coinbase") for (t, s, p, v) in rows],
-            page_size=1000,
-        )
-    conn.commit()
-    return len(rows)
+    return copy_ticks(conn, rows, source="coinbase", received_at=received_at)
 
 # ---------------- BACKFILL ---------------- #
 
+def make_limiter() -> TokenBucket:
+    """Shared by every fetch worker. Coinbase public endpoints allow ~10 req/s per IP."""
+    rate = float(os.getenv("COINBASE_RPS", "8"))
+    burst = int(os.getenv("COINBASE_BURST", "8"))
+    return TokenBucket(rate=rate, burst=burst)
+
 def backfill_product(conn, symbol: str, product_id: str, start: datetime, end: datetime, granularity: int):
     print(f"Backfilling {symbol} ({product_id}) @ {granularity}s")
     chunks = chunk_range(start, end, granularity)
     print(f"Total chunks: {len(chunks)} (max {MAX_CANDLES_PER_REQUEST} candles per chunk)")
 
-    total_inserted = 0
-
-    for i, (t1, t2) in enumerate(chunks, 1):
-        candles = fetch_candles(product_id, t1, t2, granularity)
-
-        rows = []
-        for c in candles:
-            # Coinbase candle format: [time, low, high, open, close, volume]
-            ts = datetime.fromtimestamp(c[0], tz=timezone.utc)
-            price = float(c[4])   # close
-            volume = float(c[5])
-            rows.append((ts, symbol, price, volume))
-
-        inserted = insert_ticks(conn, rows)
-        total_inserted += inserted
-
-        print(
-            f"Chunk {i}/{len(chunks)} {iso_z(t1)} → {iso_z(t2)} | "
-            f"candles={len(rows)} | attempted_insert={inserted}"
-        )
-
-        time.sleep(0.35)  # Coinbase rate safety
-
-    print(f"Done {symbol}: total_attempted_insert={total_inserted}")
+    run_backfill(
+        conn,
+        [(symbol, product_id, chunks)],
+        granularity,
+        fetch_fn=fetch_candles,
+        insert_fn=make_sink_writer(os.getenv("SINK", "ticks").strip().lower(), granularity, insert_ticks),
+        workers=int(os.getenv("BACKFILL_WORKERS", "4")),
+        limiter=make_limiter(),
+        to_rows=coinbase_to_candles,
+    )
 
 # ---------------- MAIN ---------------- #
 
@@ -118,6 +110,8 @@ def main():
     # Read symbols:
     # Prefer SYMBOLS="BTCUSD,ETHUSD,SOLUSD"
     # Fallback to SYMBOL="BTCUSD"
+    metrics.serve_from_env()
+
     symbols_env = os.getenv("SYMBOLS")
     if symbols_env and symbols_env.strip():
         symbols = [s.strip().upper() for s in symbols_env.split(",") if s.strip()]
@@ -127,6 +121,16 @@ def main():
     granularity = int(os.getenv("GRANULARITY", "60"))
     days = int(os.getenv("BACKFILL_DAYS", "1"))
 
+    # INCREMENTAL=1: start each symbol at its high-water mark minus
+    # OVERLAP_CANDLES (late corrections), capped at BACKFILL_DAYS back.
+    incremental = os.getenv("INCREMENTAL", "0").strip().lower() in ("1", "true", "yes")
+    overlap = int(os.getenv("OVERLAP_CANDLES", "3"))
+
+    # SINK=ticks (close/volume into public.ticks), candles (full OHLCV into
+    # public.candles, see sql/candles.sql) or both.
+    sink = os.getenv("SINK", "ticks").strip().lower()
+    write_rows = make_sink_writer(sink, granularity, insert_ticks)
+
     now = datetime.now(timezone.utc)
 
     start_env = os.getenv("START")
@@ -135,18 +139,54 @@ def main():
     if start_env and end_env:
         start = datetime.fromisoformat(start_env.replace("Z", "+00:00"))
         end = datetime.fromisoformat(end_env.replace("Z", "+00:00"))
+        incremental = False
     else:
         end = now
         start = now - timedelta(days=days)
 
-    print(f"Window: {iso_z(start)} → {iso_z(end)} | granularity={granularity}s | symbols={symbols}")
+    print(
+        f"Window: {iso_z(start)} → {iso_z(end)} | granularity={granularity}s | symbols={symbols}"
+        + (f" | incremental (overlap={overlap} candles)" if incremental else "")
+    )
 
     conn = psycopg2.connect(**DB_CONFIG)
     try:
+        jobs = []
         for symbol in symbols:
             product_id = symbol_to_product_id(symbol)
-            print(f"\n=== {symbol} ({product_id}) ===")
-            backfill_product(conn, symbol, product_id, start, end, granularity)
+            sym_start = start
+            if incremental:
+                mark = read_watermark(conn, symbol, granularity, sink=sink)
+                sym_start = incremental_start(mark, end, days, granularity, overlap)
+                print(f"  {symbol}: high_water={iso_z(mark) if mark else None} → fetching from {iso_z(sym_start)}")
+            jobs.append((symbol, product_id, chunk_range(sym_start, end, granularity)))
+
+        # newest candle time written per symbol (writer thread only)
+        high_water = {}
+
+        def insert_and_track(conn, rows, received_at=None):
+            res = write_rows(conn, rows, received_at=received_at)
+            for row in rows:
+                ts, sym = row[0], row[1]
+                if sym not in high_water or ts > high_water[sym]:
+                    high_water[sym] = ts
+            return res
+
+        # Chunks of all symbols are fetched concurrently on BACKFILL_WORKERS threads
+        # under one shared rate limiter; a single writer thread does the inserts.
+        run_backfill(
+            conn,
+            jobs,
+            granularity,
+            fetch_fn=fetch_candles,
+            insert_fn=insert_and_track,
+            workers=int(os.getenv("BACKFILL_WORKERS", "4")),
+            limiter=make_limiter(),
+            to_rows=coinbase_to_candles,
+        )
+
+        for symbol, ts in high_water.items():
+            save_watermark(conn, symbol, granularity, ts)
     finally:
         conn.close()
 
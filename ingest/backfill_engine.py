@@ -0,0 +1,209 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from bulk_load import LoadResult
+from rate_limit import TokenBucket, parse_retry_after
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import freshness, metrics
+
+# fetch_fn(product_id, start, end, granularity, session) -> candles
+FetchFn = Callable[[str, datetime, datetime, int, requests.Session], List[List[Any]]]
+# insert_fn(conn, rows, received_at=...) -> LoadResult(attempted, inserted); rows
+# come from to_rows, received_at is when their chunk was fetched
+InsertFn = Callable[..., LoadResult]
+
+# (symbol, product_id, [(chunk_start, chunk_end), ...])
+Job = Tuple[str, str, List[Tuple[datetime, datetime]]]
+
+MAX_THROTTLED_RETRIES = 20
+
+_STOP = object()
+
+FETCH_SECONDS = metrics.histogram("backfill_fetch_seconds", "Latency of one successful candle request")
+CANDLES_FETCHED = metrics.counter("backfill_candles_fetched_total", "Candles received from the exchange", ["symbol"])
+HTTP_RETRIES = metrics.counter("backfill_http_retries_total", "Candle requests retried, by reason", ["reason"])
+FETCH_FAILURES = metrics.counter("backfill_fetch_failures_total", "Chunks given up on after max_attempts")
+# shared with tick_writer.py
+ROWS_WRITTEN = metrics.counter("ingest_rows_written_total", "Rows committed to the database", ["component"])
+INSERT_SECONDS = metrics.histogram("ingest_insert_batch_seconds", "Latency of one committed insert batch", ["component"])
+DB_ERRORS = metrics.counter("ingest_db_errors_total", "Failed database writes (each retry counts)", ["component"])
+COMPONENT = "backfill"
+
+
+class ChunkTask(NamedTuple):
+    symbol: str
+    product_id: str
+    index: int
+    total: int
+    start: datetime
+    end: datetime
+
+
+def iso_z(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def candles_to_ticks(symbol: str, candles: List[List[Any]]) -> List[Tuple[datetime, str, float, float]]:
+    """Coinbase candle [time, low, high, open, close, volume] -> (ts, symbol, close, volume)."""
+    rows = []
+    for c in candles:
+        ts = datetime.fromtimestamp(c[0], tz=timezone.utc).replace(microsecond=0)
+        rows.append((ts, symbol, float(c[4]), float(c[5])))
+    return rows
+
+
+def interleave(jobs: List[Job]) -> List[ChunkTask]:
+    """Round-robin chunks across products so every product makes progress at once."""
+    per_job = [
+        [ChunkTask(symbol, product_id, i, len(chunks), t1, t2) for i, (t1, t2) in enumerate(chunks, start=1)]
+        for symbol, product_id, chunks in jobs
+    ]
+    tasks: List[ChunkTask] = []
+    for i in range(max((len(p) for p in per_job), default=0)):
+        for p in per_job:
+            if i < len(p):
+                tasks.append(p[i])
+    return tasks
+
+
+def run_backfill(
+    conn,
+    jobs: List[Job],
+    granularity: int,
+    fetch_fn: FetchFn,
+    insert_fn: InsertFn,
+    workers: int = 4,
+    limiter: Optional[TokenBucket] = None,
+    max_attempts: int = 5,
+    write_queue_size: Optional[int] = None,
+    to_rows: Callable[[str, List[List[Any]]], List[Any]] = candles_to_ticks,
+) -> Dict[str, LoadResult]:
+    """
+    Fetch every chunk of every job on a thread pool, rate limited by one shared
+    token bucket, while a single writer thread inserts finished chunks on conn.
+    The write queue is bounded so a slow database throttles the fetchers.
+
+    Returns {symbol: LoadResult}. Raises RuntimeError after all other chunks have
+    been processed if any chunk could not be fetched or written.
+    """
+    tasks = interleave(jobs)
+    limiter = limiter or TokenBucket(rate=5, burst=5)
+    workers = max(1, workers)
+    write_q: "queue.Queue[Any]" = queue.Queue(maxsize=write_queue_size or workers * 4)
+
+    totals: Dict[str, LoadResult] = {symbol: LoadResult(0, 0) for symbol, _, _ in jobs}
+    failures: List[str] = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def fetch(task: ChunkTask) -> None:
+        label = f"{task.symbol} chunk {task.index}/{task.total}"
+        attempt = 0
+        throttled = 0
+        while True:
+            limiter.acquire()
+            try:
+                t0 = time.perf_counter()
+                candles = fetch_fn(task.product_id, task.start, task.end, granularity, session())
+                FETCH_SECONDS.observe(time.perf_counter() - t0)
+                CANDLES_FETCHED.labels(symbol=task.symbol).inc(len(candles))
+                fetched_at = freshness.now()
+                break
+            except requests.HTTPError as e:
+                resp = e.response
+                if resp is not None and resp.status_code == 429 and throttled < MAX_THROTTLED_RETRIES:
+                    wait = parse_retry_after(resp.headers.get("Retry-After"))
+                    limiter.penalize(wait)
+                    throttled += 1
+                    HTTP_RETRIES.labels(reason="throttled").inc()
+                    print(f"  {label} throttled (429). Pausing all workers {wait:.1f}s...")
+                    continue
+                err: Exception = e
+            except Exception as e:
+                err = e
+
+            attempt += 1
+            if attempt >= max_attempts:
+                with lock:
+                    failures.append(f"{label}: {err}")
+                FETCH_FAILURES.inc()
+                print(f"  {label} failed after {attempt} attempts ({err})")
+                return
+            sleep_s = 1.5 * attempt
+            HTTP_RETRIES.labels(reason="error").inc()
+            print(f"  {label} failed ({err}). Retrying in {sleep_s:.1f}s...")
+            time.sleep(sleep_s)
+
+        write_q.put((task, candles, fetched_at))
+
+    def write() -> None:
+        while True:
+            item = write_q.get()
+            if item is _STOP:
+                return
+            task, candles, fetched_at = item
+            label = f"{task.symbol} chunk {task.index}/{task.total}"
+            try:
+                t0 = time.perf_counter()
+                res = insert_fn(conn, to_rows(task.symbol, candles), received_at=fetched_at)
+                INSERT_SECONDS.labels(component=COMPONENT).observe(time.perf_counter() - t0)
+                freshness.observe("backfill", freshness.lag_seconds(freshness.now(), fetched_at))
+            except Exception as e:
+                DB_ERRORS.labels(component=COMPONENT).inc()
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                with lock:
+                    failures.append(f"{label}: DB error {e}")
+                print(f"  {label} DB error: {e}")
+                continue
+            with lock:
+                t = totals[task.symbol]
+                totals[task.symbol] = LoadResult(t.attempted + res.attempted, t.inserted + res.inserted)
+            ROWS_WRITTEN.labels(component=COMPONENT).inc(res.inserted)
+            print(
+                f"  {label} {iso_z(task.start)} → {iso_z(task.end)} | "
+                f"candles={len(candles)} | inserted={res.inserted} skipped={res.skipped}"
+            )
+
+    print(
+        f"Backfill plan: {len(tasks)} chunk(s) across {len(jobs)} product(s) | "
+        f"workers={workers} rate={limiter.rate:g}/s burst={limiter.capacity:g}"
+    )
+
+    writer = threading.Thread(target=write, name="backfill-writer", daemon=True)
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill-fetch") as pool:
+            for f in [pool.submit(fetch, t) for t in tasks]:
+                f.result()
+    finally:
+        write_q.put(_STOP)
+        writer.join()
+
+    for symbol, total in totals.items():
+        print(
+            f"Done {symbol}: attempted={total.attempted} "
+            f"inserted={total.inserted} skipped={total.skipped}"
+        )
+    if limiter.throttled:
+        print(f"Rate limiter: throttled {limiter.throttled} time(s) by 429 responses")
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} chunk(s) failed:\n  " + "\n  ".join(failures))
+    return totals
@@ -0,0 +1,85 @@
+"""
+Benchmark: execute_values (previous insert_ticks) vs COPY + staging merge.
+
+Writes into a temp copy of public.ticks (same columns and unique indexes), so
+it never touches real data.
+
+Usage:
+  set DATABASE_URL (or BENCH_DATABASE_URL) to a Postgres you can write to
+  python ingest/bench_insert_ticks.py [ROWS] [BATCH]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from bulk_load import copy_ticks
+
+BENCH_TABLE = "bench_ticks"
+
+
+def synth_rows(n: int, symbols=("BTCUSD", "ETHUSD", "SOLUSD")) -> List[Tuple[datetime, str, float, float]]:
+    t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(n):
+        s = symbols[i % len(symbols)]
+        rows.append((t0 + timedelta(minutes=i // len(symbols)), s, 100.0 + (i % 997) * 0.01, 1.0 + (i % 13)))
+    return rows
+
+
+def insert_execute_values(conn, rows) -> int:
+    """The pre-COPY implementation, kept here as the baseline."""
+    sql = f"""
+    INSERT INTO {BENCH_TABLE} (event_time, symbol, price, volume, source)
+    VALUES %s
+    ON CONFLICT DO NOTHING;
+    """
+    with conn.cursor() as cur:
+        execute_values(cur, sql, [(t, s, p, v, "coinbase") for (t, s, p, v) in rows], page_size=1000)
+    conn.commit()
+    return len(rows)
+
+
+def insert_copy(conn, rows) -> int:
+    return copy_ticks(conn, rows, source="coinbase", table=BENCH_TABLE).inserted
+
+
+def reset(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cur.execute(f"CREATE TEMP TABLE {BENCH_TABLE} (LIKE public.ticks INCLUDING ALL)")
+    conn.commit()
+
+
+def run(conn, name: str, fn: Callable, rows, batch: int) -> None:
+    reset(conn)
+    for label in ("fresh", "duplicate"):
+        t0 = time.perf_counter()
+        for i in range(0, len(rows), batch):
+            fn(conn, rows[i : i + batch])
+        dt = time.perf_counter() - t0
+        print(f"{name:<15} {label:<10} rows={len(rows):>8} batch={batch:>6} {dt:8.3f}s {len(rows) / dt:>12,.0f} rows/s")
+
+
+def main():
+    load_dotenv()
+    db_url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not db_url:
+        raise RuntimeError("Missing BENCH_DATABASE_URL (or DATABASE_URL)")
+
+    n = int(sys.argv[1]) if len(sys.argv) >= 2 else 100_000
+    batch = int(sys.argv[2]) if len(sys.argv) >= 3 else 5_000
+    rows = synth_rows(n)
+
+    with psycopg2.connect(db_url) as conn:
+        run(conn, "execute_values", insert_execute_values, rows, batch)
+        run(conn, "copy+merge", insert_copy, rows, batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import csv
+import io
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.freshness import track_freshness
+
+# Session-private staging table. Temp tables are never WAL-logged (same as
+# UNLOGGED) and cannot collide between concurrent loaders.
+STAGING_TABLE = "ticks_staging"
+
+STAGING_DDL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+    event_time timestamptz NOT NULL,
+    symbol     text        NOT NULL,
+    price      numeric,
+    volume     numeric,
+    source     text
+) ON COMMIT DELETE ROWS;
+"""
+
+COPY_SQL = f"""
+COPY {STAGING_TABLE} (event_time, symbol, price, volume, source)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# ON CONFLICT without a target dedupes against whatever unique index the
+# table has (e.g. (symbol, event_time, price)) and is a plain insert otherwise.
+MERGE_SQL = """
+INSERT INTO {table} (event_time, symbol, price, volume, source)
+SELECT event_time, symbol, price, volume, source
+FROM {staging}
+ON CONFLICT DO NOTHING
+"""
+
+# TRACK_FRESHNESS=1 (sql/freshness.sql): one received_at for the whole load;
+# committed_at is the column default
+MERGE_TRACED_SQL = """
+INSERT INTO {table} (event_time, symbol, price, volume, source, received_at)
+SELECT event_time, symbol, price, volume, source, %s
+FROM {staging}
+ON CONFLICT DO NOTHING
+"""
+
+
+class LoadResult(NamedTuple):
+    attempted: int
+    inserted: int
+
+    @property
+    def skipped(self) -> int:
+        return self.attempted - self.inserted
+
+
+def _rows_to_csv(rows: Iterable[Tuple[datetime, str, Optional[float], Optional[float]]], source: str) -> Tuple[io.StringIO, int]:
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for t, s, p, v in rows:
+        # None -> empty unquoted field, which COPY csv reads as NULL
+        w.writerow((t.isoformat(), s, p, v, source))
+        n += 1
+    buf.seek(0)
+    return buf, n
+
+
+def copy_ticks(
+    conn,
+    rows: Iterable[Tuple[datetime, str, Optional[float], Optional[float]]],
+    source: str = "coinbase",
+    table: str = "public.ticks",
+    received_at: Optional[datetime] = None,
+) -> LoadResult:
+    """
+    rows: (event_time, symbol, price, volume)
+
+    Streams rows with COPY ... FROM STDIN (csv) into a temp staging table, then
+    merges into `table` with one INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    Commits, which also empties the staging table. received_at is stored only
+    with TRACK_FRESHNESS.
+    """
+    buf, n = _rows_to_csv(rows, source)
+    if n == 0:
+        return LoadResult(0, 0)
+
+    with conn.cursor() as cur:
+        cur.execute(STAGING_DDL)
+        cur.copy_expert(COPY_SQL, buf)
+        if track_freshness():
+            cur.execute(MERGE_TRACED_SQL.format(table=table, staging=STAGING_TABLE), (received_at,))
+        else:
+            cur.execute(MERGE_SQL.format(table=table, staging=STAGING_TABLE))
+        inserted = cur.rowcount
+    conn.commit()
+    return LoadResult(n, inserted)
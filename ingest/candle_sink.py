@@ -0,0 +1,155 @@
+import csv
+import io
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from bulk_load import LoadResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.freshness import track_freshness
+
+# Schema: sql/candles.sql
+
+# (bucket, symbol, open, high, low, close, volume)
+CandleRow = Tuple[datetime, str, float, float, float, float, Optional[float]]
+
+SINKS = ("ticks", "candles", "both")
+
+STAGING_TABLE = "candles_staging"
+
+STAGING_DDL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+    seq         bigint GENERATED ALWAYS AS IDENTITY,
+    bucket      timestamptz NOT NULL,
+    symbol      text        NOT NULL,
+    granularity integer     NOT NULL,
+    open        numeric     NOT NULL,
+    high        numeric     NOT NULL,
+    low         numeric     NOT NULL,
+    close       numeric     NOT NULL,
+    volume      numeric,
+    source      text        NOT NULL
+) ON COMMIT DELETE ROWS;
+"""
+
+COPY_SQL = f"""
+COPY {STAGING_TABLE} (bucket, symbol, granularity, open, high, low, close, volume, source)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# DISTINCT ON keeps the last copy of a key within the batch (DO UPDATE may not
+# touch the same row twice); the WHERE skips rows whose values did not change.
+UPSERT_SQL = f"""
+INSERT INTO {{table}} (symbol, granularity, bucket, open, high, low, close, volume, source, updated_at)
+SELECT DISTINCT ON (symbol, granularity, bucket)
+       symbol, granularity, bucket, open, high, low, close, volume, source, now()
+FROM {STAGING_TABLE}
+ORDER BY symbol, granularity, bucket, seq DESC
+ON CONFLICT (symbol, granularity, bucket) DO UPDATE
+SET open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    volume = EXCLUDED.volume,
+    source = EXCLUDED.source,
+    updated_at = EXCLUDED.updated_at
+WHERE ({{table}}.open, {{table}}.high, {{table}}.low, {{table}}.close, {{table}}.volume)
+      IS DISTINCT FROM
+      (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+"""
+
+# TRACK_FRESHNESS=1 (sql/freshness.sql): a changed candle also records when it
+# was received and committed
+UPSERT_TRACED_SQL = f"""
+INSERT INTO {{table}} (symbol, granularity, bucket, open, high, low, close, volume, source, updated_at, received_at, committed_at)
+SELECT DISTINCT ON (symbol, granularity, bucket)
+       symbol, granularity, bucket, open, high, low, close, volume, source, now(), %s, clock_timestamp()
+FROM {STAGING_TABLE}
+ORDER BY symbol, granularity, bucket, seq DESC
+ON CONFLICT (symbol, granularity, bucket) DO UPDATE
+SET open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    volume = EXCLUDED.volume,
+    source = EXCLUDED.source,
+    updated_at = EXCLUDED.updated_at,
+    received_at = EXCLUDED.received_at,
+    committed_at = EXCLUDED.committed_at
+WHERE ({{table}}.open, {{table}}.high, {{table}}.low, {{table}}.close, {{table}}.volume)
+      IS DISTINCT FROM
+      (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+"""
+
+
+def coinbase_to_candles(symbol: str, candles: List[List[Any]]) -> List[CandleRow]:
+    """Coinbase [time, low, high, open, close, volume] -> (bucket, symbol, o, h, l, c, v)."""
+    rows = []
+    for c in candles:
+        ts = datetime.fromtimestamp(c[0], tz=timezone.utc).replace(microsecond=0)
+        rows.append((ts, symbol, float(c[3]), float(c[2]), float(c[1]), float(c[4]), float(c[5])))
+    return rows
+
+
+def upsert_candles(
+    conn,
+    rows: Iterable[CandleRow],
+    granularity: int,
+    source: str = "coinbase",
+    table: str = "public.candles",
+    received_at: Optional[datetime] = None,
+) -> LoadResult:
+    """
+    Bulk upsert full candles keyed by (symbol, granularity, bucket).
+    COPY into a temp staging table, then one INSERT ... ON CONFLICT DO UPDATE.
+    inserted counts new or changed candles; unchanged ones are skipped.
+    received_at is stored only with TRACK_FRESHNESS.
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for t, s, o, h, l, c, v in rows:
+        w.writerow((t.isoformat(), s, granularity, o, h, l, c, v, source))
+        n += 1
+    if n == 0:
+        return LoadResult(0, 0)
+    buf.seek(0)
+
+    with conn.cursor() as cur:
+        cur.execute(STAGING_DDL)
+        cur.copy_expert(COPY_SQL, buf)
+        if track_freshness():
+            cur.execute(UPSERT_TRACED_SQL.format(table=table), (received_at,))
+        else:
+            cur.execute(UPSERT_SQL.format(table=table))
+        written = cur.rowcount
+    conn.commit()
+    return LoadResult(n, written)
+
+
+def make_sink_writer(
+    sink: str,
+    granularity: int,
+    insert_ticks: Callable[..., LoadResult],
+    source: str = "coinbase",
+) -> Callable[..., LoadResult]:
+    """
+    insert_fn for backfill_engine.run_backfill(to_rows=coinbase_to_candles).
+      ticks    close/volume into public.ticks (legacy path)
+      candles  full candles into public.candles
+      both     both; the returned result is the candle one
+    """
+    if sink not in SINKS:
+        raise ValueError(f"SINK must be one of {SINKS}. Got {sink}")
+
+    def write(conn, rows: List[CandleRow], received_at: Optional[datetime] = None) -> LoadResult:
+        res = LoadResult(0, 0)
+        if sink in ("ticks", "both"):
+            res = insert_ticks(conn, [(t, s, c, v) for (t, s, _o, _h, _l, c, v) in rows], received_at=received_at)
+        if sink in ("candles", "both"):
+            res = upsert_candles(conn, rows, granularity, source=source, received_at=received_at)
+        return res
+
+    return write
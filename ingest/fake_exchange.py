@@ -0,0 +1,412 @@
+"""
+Local fake exchange for load-testing the ingesters offline: a Binance-style
+combined websocket stream and Coinbase-style REST candles on one port.
+
+  python ingest/fake_exchange.py --replay binance.jsonl.gz coinbase.jsonl.gz --speed 100 --loop
+  python ingest/fake_exchange.py --synth 200 --rate 50000
+
+then point the ingesters at it:
+
+  BINANCE_WS_URL=ws://127.0.0.1:9443 METRICS_PORT=9101 python ingest/ws_stream.py
+  COINBASE_BASE=http://127.0.0.1:9443 COINBASE_RPS=500 python ingest/backfill_coinbase.py
+
+Websocket (GET /stream?streams=..., or any path with Upgrade: websocket):
+  --replay  the recorded frames (ingest/recorder.py) with their recorded
+            spacing divided by --speed (1-1000); event times (`E`) are
+            moved to the time of sending unless --no-retime.
+  --synth N miniTicker frames for N symbols, the requested streams first
+            and then SYN0001USDT, ...; --rate frames/s in total (0 = as
+            fast as the client reads).
+
+REST (GET /products/{id}/candles?start&end&granularity): recorded candles
+when the recording has that product and granularity, shifted so the newest
+recorded candle is the current bucket; synthetic candles otherwise. As on
+Coinbase: newest first, at most 300 per request. --error-rate answers that
+share of requests with 429 + Retry-After to exercise the backfill retries.
+
+A client that cannot keep up blocks the sender (TCP backpressure), so the
+`behind` column of the stats line is how far the ingester lags the
+schedule; the highest --rate with `behind` staying near 0 is its sustainable
+throughput. Compare `sent` with ingest_messages_received_total and
+ingest_rows_written_total on the ingester's /metrics.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from recorder import read_recording
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+GRANULARITIES = (60, 300, 900, 3600, 21600, 86400)
+MAX_CANDLES_PER_REQUEST = 300
+SEND_BUFFER = 64 * 1024  # bytes of frames written per sendall() when behind schedule
+
+Candle = List[float]  # [time, low, high, open, close, volume], as Coinbase returns them
+
+
+# ---------------- RECORDINGS ---------------- #
+
+class Recording:
+    def __init__(self):
+        self.frames: List[Tuple[float, str]] = []
+        self.candles: Dict[Tuple[str, int], Dict[int, Candle]] = {}
+
+    @classmethod
+    def load(cls, paths: List[Path]) -> "Recording":
+        rec = cls()
+        for path in paths:
+            frames = []
+            for r in read_recording(path):
+                if r["kind"] == "ws":
+                    frames.append((r["t"], r["frame"]))
+                elif r["kind"] == "rest" and r["status"] == 200:
+                    by_time = rec.candles.setdefault((r["product"], int(r["granularity"])), {})
+                    for c in json.loads(r["body"]):
+                        by_time[int(c[0])] = c
+            if frames:
+                # several ws recordings play one after another
+                offset = rec.frames[-1][0] if rec.frames else 0.0
+                t0 = frames[0][0]
+                rec.frames.extend((offset + t - t0, f) for t, f in frames)
+        return rec
+
+
+# ---------------- WEBSOCKET FRAMES ---------------- #
+
+def encode_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """One unmasked, unfragmented server frame (RFC 6455 §5.2)."""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def read_frame(rfile) -> Tuple[int, bytes]:
+    """(opcode, payload) of one client frame; client frames are always masked."""
+    head = rfile.read(2)
+    if len(head) < 2:
+        raise ConnectionError("client went away")
+    opcode, n = head[0] & 0x0F, head[1] & 0x7F
+    if n == 126:
+        n = struct.unpack("!H", rfile.read(2))[0]
+    elif n == 127:
+        n = struct.unpack("!Q", rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+    data = rfile.read(n)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+def retime(frame: str, now_ms: int) -> str:
+    msg = json.loads(frame)
+    data = msg.get("data", msg)
+    if isinstance(data, dict) and "E" in data:
+        data["E"] = now_ms
+        return json.dumps(msg, separators=(",", ":"))
+    return frame
+
+
+def replay_frames(rec: Recording, speed: float, loop: bool) -> Iterator[Tuple[float, str]]:
+    """(due seconds after connect, frame) for the recorded frames."""
+    if not rec.frames:
+        return
+    span = rec.frames[-1][0] + 1e-3
+    offset = 0.0
+    while True:
+        for t, frame in rec.frames:
+            yield (offset + t) / speed, frame
+        if not loop:
+            return
+        offset += span
+
+
+def synth_frames(symbols: List[str], rate: float, seed: int = 0) -> Iterator[Tuple[Optional[float], str]]:
+    """Round-robin miniTicker frames with a random-walk close per symbol; due is None when unthrottled."""
+    rng = random.Random(seed)
+    price = {s: 100.0 * (1 + rng.random()) for s in symbols}
+    streams = {s: f"{s.lower()}@miniTicker" for s in symbols}
+    i = 0
+    while True:
+        s = symbols[i % len(symbols)]
+        p = price[s] = price[s] * (1 + rng.gauss(0, 1e-4))
+        v = rng.random() * 10
+        yield (i / rate if rate > 0 else None), (
+            f'{{"stream":"{streams[s]}","data":{{"e":"24hrMiniTicker","E":{int(time.time() * 1000)},"s":"{s}",'
+            f'"c":"{p:.8f}","o":"{p:.8f}","h":"{p:.8f}","l":"{p:.8f}","v":"{v:.8f}","q":"{v * p:.8f}"}}}}'
+        )
+        i += 1
+
+
+# ---------------- CANDLES ---------------- #
+
+def synth_candle(product: str, t: int, granularity: int) -> Candle:
+    """Deterministic candle for (product, bucket): a daily sine plus noise."""
+    rng = random.Random(f"{product}:{granularity}:{t}")
+    base = 100.0 * (1 + 0.05 * math.sin(2 * math.pi * t / 86400))
+    o = base * (1 + rng.gauss(0, 1e-3))
+    c = base * (1 + rng.gauss(0, 1e-3))
+    return [t, min(o, c) * (1 - rng.random() * 1e-3), max(o, c) * (1 + rng.random() * 1e-3), o, c, rng.random() * 50]
+
+
+def parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+# ---------------- SERVER ---------------- #
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = 0
+        self.frames = 0
+        self.behind = 0.0
+        self.rest = 0
+        self.throttled = 0
+
+    def add(self, **kw) -> None:
+        with self.lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+
+class FakeExchange(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, rec: Recording, args):
+        super().__init__(addr, Handler)
+        self.rec = rec
+        self.args = args
+        self.stats = Stats()
+        self.started = time.time()
+        # recorded candles are shifted so the newest one lands on the current bucket
+        self.candle_shift = {}
+        for (product, g), by_time in rec.candles.items():
+            self.candle_shift[product, g] = 0 if args.no_retime else int(self.started) // g * g - max(by_time)
+
+    def frames_for(self, requested: List[str]) -> Iterator[Tuple[Optional[float], str]]:
+        if self.args.synth:
+            symbols = requested + [f"SYN{i:04d}USDT" for i in range(1, self.args.synth - len(requested) + 1)]
+            return synth_frames(symbols[: self.args.synth], self.args.rate)
+        return replay_frames(self.rec, self.args.speed, self.args.loop)
+
+    def candles(self, product: str, start: int, end: int, granularity: int) -> List[Candle]:
+        key = (product, granularity)
+        first = -(-start // granularity) * granularity
+        if key in self.rec.candles:
+            shift = self.candle_shift[key]
+            by_time = self.rec.candles[key]
+            out = []
+            for t in range(first, end + 1, granularity):
+                c = by_time.get(t - shift)
+                if c is not None:
+                    out.append([t] + list(c[1:]))
+        else:
+            out = [synth_candle(product, t, granularity) for t in range(first, min(end, int(time.time())) + 1, granularity)]
+        return out[::-1]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeExchange
+
+    def do_GET(self):
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self.websocket()
+            return
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "products" and parts[2] == "candles":
+            self.candles(parts[1], parse_qs(url.query))
+        else:
+            self.reply(404, {"message": "NotFound"})
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def reply(self, status: int, body, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    # ---- REST ---- #
+
+    def candles(self, product: str, query: Dict[str, List[str]]) -> None:
+        args = self.server.args
+        self.server.stats.add(rest=1)
+        if args.rest_latency_ms:
+            time.sleep(args.rest_latency_ms / 1000)
+        if args.error_rate and random.random() < args.error_rate:
+            self.server.stats.add(throttled=1)
+            self.reply(429, {"message": "Public rate limit exceeded"}, {"Retry-After": "1"})
+            return
+        try:
+            granularity = int(query.get("granularity", ["60"])[0])
+            end = int(parse_iso(query["end"][0]).timestamp()) if "end" in query else int(time.time())
+            start = int(parse_iso(query["start"][0]).timestamp()) if "start" in query else end - granularity * MAX_CANDLES_PER_REQUEST
+        except (KeyError, ValueError):
+            self.reply(400, {"message": "Invalid start / end / granularity"})
+            return
+        if granularity not in GRANULARITIES:
+            self.reply(400, {"message": "Unsupported granularity"})
+            return
+        if (end - start) // granularity > MAX_CANDLES_PER_REQUEST:
+            self.reply(400, {"message": "granularity too small for the requested time range. Count of aggregations requested exceeds 300"})
+            return
+        self.reply(200, self.server.candles(product.upper(), start, end, granularity))
+
+    # ---- WEBSOCKET ---- #
+
+    def websocket(self) -> None:
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.close_connection = True
+
+        streams = parse_qs(urlparse(self.path).query).get("streams", [""])[0]
+        requested = [s.split("@")[0].upper() for s in streams.split("/") if s]
+        sock = self.connection
+        send_lock = threading.Lock()
+        closed = threading.Event()
+
+        def send(data: bytes) -> None:
+            with send_lock:
+                sock.sendall(data)
+
+        def reader():
+            # answers pings and the closing handshake while the handler thread streams
+            try:
+                while not closed.is_set():
+                    opcode, payload = read_frame(self.rfile)
+                    if opcode == 0x9:
+                        send(encode_frame(payload, 0xA))
+                    elif opcode == 0x8:
+                        send(encode_frame(payload[:2], 0x8))
+                        break
+            except (OSError, ConnectionError, struct.error):
+                pass
+            closed.set()
+
+        threading.Thread(target=reader, daemon=True).start()
+        stats = self.server.stats
+        stats.add(clients=1)
+        retime_frames = not self.server.args.synth and not self.server.args.no_retime
+        t0 = time.monotonic()
+        buf, pending = bytearray(), 0
+
+        def flush() -> None:
+            nonlocal pending
+            send(bytes(buf))
+            stats.add(frames=pending)
+            buf.clear()
+            pending = 0
+
+        try:
+            for due, frame in self.server.frames_for(requested):
+                if closed.is_set():
+                    break
+                if due is not None:
+                    lag = time.monotonic() - t0 - due
+                    if lag < 0:
+                        if buf:
+                            flush()
+                        time.sleep(-lag)
+                    stats.behind = max(0.0, lag)
+                if retime_frames:
+                    frame = retime(frame, int(time.time() * 1000))
+                buf += encode_frame(frame.encode())
+                pending += 1
+                if len(buf) >= SEND_BUFFER:
+                    flush()
+            if not closed.is_set():
+                if buf:
+                    flush()
+                send(encode_frame(struct.pack("!H", 1000), 0x8))
+        except OSError:
+            pass
+        finally:
+            closed.set()
+            stats.add(clients=-1)
+
+
+# ---------------- MAIN ---------------- #
+
+def report(server: FakeExchange, every: float = 5.0) -> None:
+    stats = server.stats
+    last_frames, last_rest, last = 0, 0, time.monotonic()
+    while True:
+        time.sleep(every)
+        now = time.monotonic()
+        dt, last = now - last, now
+        frames, rest = stats.frames, stats.rest
+        print(
+            f"  clients={stats.clients} sent={frames} ({(frames - last_frames) / dt:,.0f} frames/s) "
+            f"behind={stats.behind:.2f}s rest={rest} ({(rest - last_rest) / dt:,.1f} req/s) 429s={stats.throttled}"
+        )
+        last_frames, last_rest = frames, rest
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--replay", type=Path, nargs="+", help="recordings from ingest/recorder.py")
+    source.add_argument("--synth", type=int, help="number of synthetic symbols")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up, 1-1000")
+    parser.add_argument("--loop", action="store_true", help="replay the frames forever")
+    parser.add_argument("--no-retime", action="store_true", help="keep the recorded event and candle times")
+    parser.add_argument("--rate", type=float, default=1000.0, help="synthetic frames/s over all symbols (0 = unthrottled)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of REST requests answered with 429")
+    parser.add_argument("--rest-latency-ms", type=float, default=0.0, help="added to every REST response")
+    args = parser.parse_args(argv)
+    if not 1 <= args.speed <= 1000:
+        parser.error("--speed must be between 1 and 1000")
+    if args.synth is not None and args.synth < 1:
+        parser.error("--synth needs at least one symbol")
+    return args
+
+
+def main():
+    args = parse_args()
+    rec = Recording.load(args.replay) if args.replay else Recording()
+    server = FakeExchange((args.host, args.port), rec, args)
+    if args.replay:
+        span = rec.frames[-1][0] if rec.frames else 0.0
+        print(f"📼 {len(rec.frames)} frames over {span:.0f}s at {args.speed:g}x, candles for {sorted(rec.candles)}")
+    else:
+        print(f"🧪 {args.synth} synthetic symbols at {args.rate:g} frames/s" if args.rate else f"🧪 {args.synth} synthetic symbols, unthrottled")
+    print(f"🚀 Fake exchange on ws://{args.host}:{server.server_address[1]}/stream and http://{args.host}:{server.server_address[1]}/products/{{id}}/candles")
+    threading.Thread(target=report, args=(server,), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Record exchange traffic for ingest/fake_exchange.py.
+
+  python ingest/recorder.py ws  binance.jsonl.gz --seconds 600
+  python ingest/recorder.py rest coinbase.jsonl.gz --products BTC-USD,ETH-USD --days 2 --granularity 60
+
+`ws` captures the raw Binance miniTicker frames ws_stream.py subscribes to
+(BINANCE_WS_URL / BINANCE_SYMBOLS, same defaults). `rest` captures the raw
+Coinbase /products/{id}/candles responses for a time range, paged the way
+the backfills page it (COINBASE_BASE, COINBASE_RPS).
+
+Recordings are gzipped JSON lines; the first line describes the recording,
+every other line is one frame or response with `t`, seconds since the
+recording started:
+
+  {"kind": "meta", "source": "binance-ws", "recorded_at": "...", "url": "..."}
+  {"kind": "ws", "t": 0.412, "frame": "{\"stream\":\"btcusdt@miniTicker\",...}"}
+  {"kind": "rest", "t": 1.03, "product": "BTC-USD", "granularity": 60,
+   "start": "...", "end": "...", "status": 200, "body": "[[...]]"}
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Union
+
+import requests
+import websocket
+
+from backfill_coinbase import COINBASE_BASE, chunk_range, iso_z
+from rate_limit import TokenBucket
+
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443").rstrip("/")
+BINANCE_SYMBOLS = os.getenv("BINANCE_SYMBOLS", "btcusdt,ethusdt,solusdt")
+
+
+# ---------------- FILE FORMAT ---------------- #
+
+class RecordingWriter:
+    """Thread-safe appender of recording lines (websocket callbacks run on their own thread)."""
+
+    def __init__(self, path: Union[str, Path], **meta):
+        self.path = Path(path)
+        self._f = gzip.open(self.path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        self.count = 0
+        self._write({"kind": "meta", "recorded_at": datetime.now(timezone.utc).isoformat(), **meta})
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._f.write(line)
+
+    def add(self, kind: str, **fields) -> None:
+        self._write({"kind": kind, "t": round(time.monotonic() - self._t0, 6), **fields})
+        self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+def read_recording(path: Union[str, Path]) -> Iterator[dict]:
+    """Every line of a recording, the meta line included."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# ---------------- WEBSOCKET ---------------- #
+
+def stream_url(symbols: List[str]) -> str:
+    return f"{BINANCE_WS_URL}/stream?streams=" + "/".join(f"{s}@miniTicker" for s in symbols)
+
+
+def record_ws(out: Path, symbols: List[str], seconds: float, max_frames: int) -> int:
+    url = stream_url(symbols)
+    rec = RecordingWriter(out, source="binance-ws", url=url, symbols=symbols)
+    done = threading.Event()
+
+    def on_message(ws, message):
+        rec.add("ws", frame=message)
+        if max_frames and rec.count >= max_frames:
+            done.set()
+
+    def on_error(ws, error):
+        print("WebSocket error:", error)
+
+    ws = websocket.WebSocketApp(url, on_message=on_message, on_error=on_error, on_close=lambda *_: done.set())
+    threading.Thread(target=ws.run_forever, kwargs={"ping_interval": 20, "ping_timeout": 10}, daemon=True).start()
+    print(f"🎙️  Recording {url} -> {out}")
+    t0 = time.monotonic()
+    try:
+        while not done.wait(5):
+            elapsed = time.monotonic() - t0
+            print(f"  {rec.count} frames in {elapsed:.0f}s")
+            if seconds and elapsed >= seconds:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ws.close()
+        rec.close()
+    return rec.count
+
+
+# ---------------- REST ---------------- #
+
+def record_rest(out: Path, products: List[str], days: float, granularity: int) -> int:
+    end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    rec = RecordingWriter(out, source="coinbase-rest", base=COINBASE_BASE, products=products, granularity=granularity)
+    limiter = TokenBucket(rate=float(os.getenv("COINBASE_RPS", "8")), burst=int(os.getenv("COINBASE_BURST", "8")))
+    session = requests.Session()
+    try:
+        chunks = chunk_range(start, end, granularity)
+        for product in products:
+            for a, b in chunks:
+                limiter.acquire()
+                params = {"start": iso_z(a), "end": iso_z(b), "granularity": granularity}
+                r = session.get(f"{COINBASE_BASE}/products/{product}/candles", params=params, timeout=30)
+                rec.add("rest", product=product, granularity=granularity, start=params["start"], end=params["end"], status=r.status_code, body=r.text)
+                if r.status_code == 429:
+                    print(f"  {product} {params['start']}: throttled, not retried")
+            print(f"  {product}: {len(chunks)} responses")
+    finally:
+        rec.close()
+    return rec.count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="what", required=True)
+    ws = sub.add_parser("ws", help="raw Binance miniTicker frames")
+    ws.add_argument("out", type=Path)
+    ws.add_argument("--symbols", default=BINANCE_SYMBOLS, help="comma separated, e.g. btcusdt,ethusdt")
+    ws.add_argument("--seconds", type=float, default=0, help="stop after this long (0 = until Ctrl-C)")
+    ws.add_argument("--frames", type=int, default=0, help="stop after this many frames")
+    rest = sub.add_parser("rest", help="raw Coinbase candle responses")
+    rest.add_argument("out", type=Path)
+    rest.add_argument("--products", default="BTC-USD,ETH-USD,SOL-USD")
+    rest.add_argument("--days", type=float, default=1.0)
+    rest.add_argument("--granularity", type=int, default=60)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    t0 = time.perf_counter()
+    if args.what == "ws":
+        symbols = [s.strip().lower() for s in args.symbols.split(",") if s.strip()]
+        n = record_ws(args.out, symbols, args.seconds, args.frames)
+    else:
+        products = [p.strip().upper() for p in args.products.split(",") if p.strip()]
+        n = record_rest(args.out, products, args.days, args.granularity)
+    size = args.out.stat().st_size / 1024
+    print(f"✅ {n} records in {time.perf_counter() - t0:.1f}s -> {args.out} ({size:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import psycopg2
+
+from candle_sink import CandleRow, upsert_candles
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import metrics
+
+# 1m, 5m, 15m, 1h, 1d; the `granularity` column of public.candles (sql/candles.sql)
+GRANULARITIES = (60, 300, 900, 3600, 86400)
+
+ROWS_WRITTEN = metrics.counter("ingest_rows_written_total", "Rows committed to the database", ["component"])
+INSERT_SECONDS = metrics.histogram("ingest_insert_batch_seconds", "Latency of one committed insert batch", ["component"])
+DB_ERRORS = metrics.counter("ingest_db_errors_total", "Failed database writes (each retry counts)", ["component"])
+LATE_TICKS = metrics.counter("rollup_late_ticks_total", "Ticks older than the open bar of the finest granularity, not folded into any bar")
+OPEN_BARS = metrics.gauge("rollup_open_bars", "Bars being aggregated in memory")
+COMPONENT = "rollup"
+
+# bars stored for buckets that are still open in memory, e.g. by the process
+# this one replaced
+STORED_BARS_SQL = """
+SELECT symbol, granularity, bucket, open, high, low, volume
+FROM public.candles
+WHERE symbol = ANY(%s) AND granularity = ANY(%s) AND bucket >= %s
+"""
+
+
+class Bar:
+    __slots__ = ("bucket", "open", "high", "low", "close", "volume", "first_ts", "last_ts", "dirty", "final")
+
+    def __init__(self, bucket: int, ts: float, price: float, volume: Optional[float]):
+        self.bucket = bucket
+        self.open = self.high = self.low = self.close = price
+        self.volume = volume
+        self.first_ts = self.last_ts = ts  # event times of the current open / close
+        self.dirty = True   # changed since it was last written
+        self.final = False  # closed and written for the last time
+
+    def add(self, ts: float, price: float, volume: Optional[float]) -> None:
+        """Fold a tick of this bucket; out-of-order ticks move open / close only if they are older / newer."""
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        if ts < self.first_ts:
+            self.open, self.first_ts = price, ts
+        if ts >= self.last_ts:
+            self.close, self.last_ts = price, ts
+        # one tick without a volume makes the bar's volume unknown
+        self.volume = self.volume + volume if self.volume is not None and volume is not None else None
+        self.dirty = True
+
+    def merge_stored(self, o: float, h: float, l: float, volume: Optional[float]) -> None:
+        """Fold in the stored bar of the same bucket, built from earlier ticks; close stays ours."""
+        self.open = o
+        self.high = max(self.high, h)
+        self.low = min(self.low, l)
+        self.volume = self.volume + volume if self.volume is not None and volume is not None else None
+        self.dirty = True
+
+    def row(self, symbol: str) -> CandleRow:
+        t = datetime.fromtimestamp(self.bucket, tz=timezone.utc)
+        return (t, symbol, self.open, self.high, self.low, self.close, self.volume)
+
+
+class Rollup:
+    """
+    Open OHLCV bars per (symbol, granularity), folded tick by tick.
+
+    add() is called from the websocket callback; a background thread upserts
+    into public.candles through candle_sink.upsert_candles:
+
+      closed bars      once, on the first flush after they close, i.e. when a
+                       tick of a later bucket arrives or grace_seconds after
+                       the bucket ended (symbols that went quiet)
+      the open bar     every open_flush_seconds while it keeps changing
+
+    Volume is the sum of the tick volumes passed to add(), or NULL when they
+    are not per-trade volumes: ws_stream.py passes none, because Binance
+    miniTicker `v` is the rolling 24h volume and summing it means nothing.
+
+    A restarted ingester picks up buckets that are already stored: before the
+    first write of a symbol's bars, the writer thread reads the stored bars of
+    the same buckets and merges them in (open from the stored bar, high / low
+    across both, volumes summed), so the upsert does not replace them with
+    bars of the post-restart ticks only. Until that read succeeds the
+    symbol's bars are held back.
+
+    Whether a tick is late is decided once, on the finest bar: a tick older
+    than its open bar, or for a bar already written as final,
+    is left out of every resolution and counted in rollup_late_ticks_total,
+    so the bars of all granularities always cover the same ticks.
+    grace_seconds covers the usual delay. Ticks out of order within the
+    open bar still count towards high / low / volume.
+    """
+
+    def __init__(
+        self,
+        db_url: str,
+        granularities: Sequence[int] = GRANULARITIES,
+        source: str = "binance",
+        open_flush_seconds: float = 5.0,
+        grace_seconds: float = 2.0,
+        max_retries: int = 3,
+    ):
+        self.db_url = db_url
+        self.granularities = tuple(sorted(set(int(g) for g in granularities)))
+        self.source = source
+        self.open_flush_seconds = max(0.1, open_flush_seconds)
+        self.grace_seconds = max(0.0, grace_seconds)
+        self.max_retries = max_retries
+
+        self._bars: Dict[Tuple[str, int], Bar] = {}
+        self._closed: Dict[int, List[Tuple[str, Bar]]] = {g: [] for g in self.granularities}
+        self._unseeded: Set[str] = set()  # symbols whose stored bars were not merged yet
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+        self._late = 0
+        self._written = 0
+        self._failed = 0
+
+        OPEN_BARS.set_function(lambda: len(self._bars))
+
+    @classmethod
+    def from_env(cls, db_url: str, source: str = "binance") -> "Rollup":
+        return cls(
+            db_url,
+            granularities=[int(g) for g in os.getenv("ROLLUP_GRANULARITIES", ",".join(map(str, GRANULARITIES))).split(",") if g.strip()],
+            source=source,
+            open_flush_seconds=float(os.getenv("ROLLUP_FLUSH_SECONDS", "5")),
+            grace_seconds=float(os.getenv("ROLLUP_GRACE_SECONDS", "2")),
+        )
+
+    # ---------------- PRODUCER SIDE ---------------- #
+
+    def add(self, symbol: str, event_time: datetime, price: float, volume: Optional[float] = None) -> None:
+        """Fold one tick into the open bar of every granularity, or into none if it is late."""
+        ts = event_time.timestamp()
+        sec = int(ts)
+        with self._lock:
+            finest = self.granularities[0]
+            bar = self._bars.get((symbol, finest))
+            if bar is None:
+                self._unseeded.add(symbol)
+            elif sec - sec % finest < bar.bucket or (sec - sec % finest == bar.bucket and bar.final):
+                self._late += 1
+                LATE_TICKS.inc()
+                return
+            for g in self.granularities:
+                bucket = sec - sec % g
+                bar = self._bars.get((symbol, g))
+                if bar is None or bucket > bar.bucket:
+                    if bar is not None and not bar.final:
+                        self._closed[g].append((symbol, bar))
+                    self._bars[symbol, g] = Bar(bucket, ts, price, volume)
+                elif bucket == bar.bucket and not bar.final:
+                    bar.add(ts, price, volume)
+                # coarser bars close no earlier than the finest one, so a tick
+                # that is on time for the finest bar is on time for all of them
+
+    # ---------------- LIFECYCLE ---------------- #
+
+    def start(self) -> "Rollup":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="rollup-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Write the closed bars and the current state of the open ones, then close the connection."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ---------------- WRITER THREAD ---------------- #
+
+    def _run(self) -> None:
+        next_open = time.monotonic() + self.open_flush_seconds
+        # closed bars go out within a second; open ones every open_flush_seconds
+        while not self._stop.wait(min(1.0, self.open_flush_seconds)):
+            with_open = time.monotonic() >= next_open
+            self._seed()
+            self._write(self.take(time.time(), with_open))
+            if with_open:
+                next_open = time.monotonic() + self.open_flush_seconds
+        self._seed()
+        self._write(self.take(time.time(), True))
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+
+    def _connect(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self.db_url)
+        return self._conn
+
+    def _drop_conn(self) -> None:
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+    def _seed(self) -> None:
+        """Merge the stored bars of newly seen symbols into theirs (see the class docstring)."""
+        with self._lock:
+            symbols = sorted(self._unseeded)
+            if not symbols:
+                return
+            buckets = [bar.bucket for (s, _), bar in self._bars.items() if s in self._unseeded]
+            buckets += [bar.bucket for closed in self._closed.values() for s, bar in closed if s in self._unseeded]
+        since = datetime.fromtimestamp(min(buckets), tz=timezone.utc)
+        try:
+            conn = self._connect()
+            with conn.cursor() as cur:
+                cur.execute(STORED_BARS_SQL, (symbols, list(self.granularities), since))
+                stored = {(s, g, int(b.timestamp())): (o, h, l, v) for s, g, b, o, h, l, v in cur.fetchall()}
+            conn.rollback()
+        except Exception as e:
+            print(f"Rollup DB error (reading stored bars of {len(symbols)} symbols):", e)
+            DB_ERRORS.labels(component=COMPONENT).inc()
+            self._drop_conn()
+            return
+        with self._lock:
+            bars = [(s, g, bar) for (s, g), bar in self._bars.items() if s in symbols]
+            bars += [(s, g, bar) for g, closed in self._closed.items() for s, bar in closed if s in symbols]
+            for s, g, bar in bars:
+                hit = stored.get((s, g, bar.bucket))
+                if hit is not None:
+                    o, h, l, v = hit
+                    bar.merge_stored(float(o), float(h), float(l), None if v is None else float(v))
+            self._unseeded.difference_update(symbols)
+
+    def take(self, now: float, with_open: bool) -> Dict[int, List[CandleRow]]:
+        """Rows to upsert per granularity: bars closed since the last call, plus the changed open bars."""
+        with self._lock:
+            out: Dict[int, List[CandleRow]] = {g: [] for g in self.granularities}
+            held = {g: [] for g in self.granularities}
+            for g, closed in self._closed.items():
+                for symbol, bar in closed:
+                    if symbol in self._unseeded:
+                        held[g].append((symbol, bar))
+                    else:
+                        out[g].append(bar.row(symbol))
+            self._closed = held
+            for (symbol, g), bar in self._bars.items():
+                if bar.final or symbol in self._unseeded:
+                    continue
+                if now >= bar.bucket + g + self.grace_seconds:
+                    out[g].append(bar.row(symbol))
+                    bar.final = True
+                elif with_open and bar.dirty:
+                    out[g].append(bar.row(symbol))
+                    bar.dirty = False
+        return out
+
+    def _write(self, rows_by_g: Dict[int, List[CandleRow]]) -> None:
+        for g, rows in rows_by_g.items():
+            if not rows:
+                continue
+            t0 = time.perf_counter()
+            for attempt in range(self.max_retries):
+                try:
+                    res = upsert_candles(self._connect(), rows, g, source=self.source)
+                    break
+                except Exception as e:
+                    print(f"Rollup DB error (granularity={g}, bars={len(rows)}, attempt {attempt + 1}/{self.max_retries}):", e)
+                    DB_ERRORS.labels(component=COMPONENT).inc()
+                    self._drop_conn()
+                    if attempt < self.max_retries - 1:
+                        time.sleep(0.5 * (attempt + 1))
+            else:
+                self._failed += len(rows)
+                continue
+            INSERT_SECONDS.labels(component=COMPONENT).observe(time.perf_counter() - t0)
+            ROWS_WRITTEN.labels(component=COMPONENT).inc(res.inserted)
+            self._written += res.inserted
+
+    # ---------------- COUNTERS ---------------- #
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open_bars": len(self._bars), "written": self._written, "late_ticks": self._late, "failed": self._failed}
@@ -0,0 +1,359 @@
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import freshness, metrics
+
+# (symbol, event_time, price, volume[, received_at])
+TickRow = Tuple[Any, ...]
+
+INSERT_SQL = """
+insert into public.ticks (symbol, event_time, price, volume)
+values %s
+on conflict do nothing;
+"""
+
+# TRACK_FRESHNESS=1 (sql/freshness.sql); committed_at is the column default
+INSERT_TRACED_SQL = """
+insert into public.ticks (symbol, event_time, price, volume, received_at)
+values %s
+on conflict do nothing;
+"""
+
+BACKPRESSURE_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+# Default Postgres channel the API's live feed LISTENs on (api/app/live.py);
+# both sides read LIVE_CHANNEL to change it.
+NOTIFY_CHANNEL = "ticks"
+
+_STOP = object()
+
+# Shared with backfill_engine.py, told apart by `component`.
+ROWS_WRITTEN = metrics.counter("ingest_rows_written_total", "Rows committed to the database", ["component"])
+ROWS_DROPPED = metrics.counter("ingest_rows_dropped_total", "Rows dropped by backpressure or failed batches", ["component"])
+INSERT_SECONDS = metrics.histogram("ingest_insert_batch_seconds", "Latency of one committed insert batch", ["component"])
+INSERT_ROWS = metrics.histogram("ingest_insert_batch_rows", "Rows per insert batch", ["component"], buckets=metrics.ROW_BUCKETS)
+DB_ERRORS = metrics.counter("ingest_db_errors_total", "Failed database writes (each retry counts)", ["component"])
+QUEUE_DEPTH = metrics.gauge("ingest_queue_depth", "Rows waiting in the write queue", ["component"])
+COMPONENT = "tick_writer"
+
+
+def get_env_int(name: str, default: int) -> int:
+    v = os.getenv(name)
+    if not v:
+        return default
+    try:
+        return int(v)
+    except ValueError:
+        return default
+
+
+NOTIFY_MAX_BYTES = 7500  # Postgres rejects payloads of 8000 bytes or more
+
+
+def notify_payloads(batch: List[TickRow]) -> List[str]:
+    """Newest tick per symbol in the batch as compact JSON arrays, split to fit NOTIFY."""
+    latest: Dict[str, TickRow] = {}
+    for row in batch:
+        prev = latest.get(row[0])
+        if prev is None or row[1] >= prev[1]:
+            latest[row[0]] = row
+
+    payloads: List[str] = []
+    items: List[str] = []
+    size = 2
+    for s, t, p, v in (row[:4] for row in latest.values()):
+        item = json.dumps({"s": s, "t": t.isoformat(), "p": p, "v": v}, separators=(",", ":"))
+        if items and size + len(item) + 1 > NOTIFY_MAX_BYTES:
+            payloads.append("[" + ",".join(items) + "]")
+            items, size = [], 2
+        items.append(item)
+        size += len(item) + 1
+    if items:
+        payloads.append("[" + ",".join(items) + "]")
+    return payloads
+
+
+class TickWriter:
+    """
+    Drains decoded ticks from a bounded queue into public.ticks.
+
+    Producers (the websocket callback) only call submit(); a single background
+    thread owns one persistent connection and flushes micro-batches when either
+    batch_size rows are buffered or flush_ms has passed since the first row of
+    the batch arrived.
+
+    Backpressure when the queue is full:
+      block        wait up to put_timeout_ms, then drop the new row
+      drop_newest  drop the new row immediately
+      drop_oldest  evict the oldest queued row to make room
+    """
+
+    def __init__(
+        self,
+        db_url: str,
+        batch_size: int = 500,
+        flush_ms: int = 200,
+        max_queue: int = 10_000,
+        backpressure: str = "block",
+        put_timeout_ms: int = 1000,
+        stats_seconds: int = 30,
+        max_retries: int = 3,
+        notify: bool = True,
+        channel: str = NOTIFY_CHANNEL,
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(
+                f"backpressure must be one of {BACKPRESSURE_POLICIES}. Got {backpressure}"
+            )
+
+        self.db_url = db_url
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_ms) / 1000.0
+        self.backpressure = backpressure
+        self.put_timeout = max(0, put_timeout_ms) / 1000.0
+        self.stats_seconds = stats_seconds
+        self.max_retries = max_retries
+        self.notify = notify
+        self.channel = channel
+
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queue))
+        self._conn = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._enqueued = 0
+        self._dropped = 0
+        self._written = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._max_queue_depth = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+        QUEUE_DEPTH.labels(component=COMPONENT).set_function(self._q.qsize)
+
+    @classmethod
+    def from_env(cls, db_url: str) -> "TickWriter":
+        return cls(
+            db_url,
+            batch_size=get_env_int("WRITER_BATCH_SIZE", 500),
+            flush_ms=get_env_int("WRITER_FLUSH_MS", 200),
+            max_queue=get_env_int("WRITER_QUEUE_MAX", 10_000),
+            backpressure=os.getenv("WRITER_BACKPRESSURE", "block"),
+            put_timeout_ms=get_env_int("WRITER_PUT_TIMEOUT_MS", 1000),
+            stats_seconds=get_env_int("WRITER_STATS_SECONDS", 30),
+            notify=os.getenv("WRITER_NOTIFY", "1").strip().lower() not in ("0", "false", "no"),
+            channel=os.getenv("LIVE_CHANNEL", NOTIFY_CHANNEL),
+        )
+
+    # ---------------- PRODUCER SIDE ---------------- #
+
+    def submit(self, row: TickRow) -> bool:
+        """Enqueue one tick. Returns False if it was dropped by backpressure."""
+        try:
+            if self.backpressure == "block":
+                self._q.put(row, timeout=self.put_timeout)
+            else:
+                self._q.put_nowait(row)
+        except queue.Full:
+            if self.backpressure != "drop_oldest":
+                self._count_drop()
+                return False
+            try:
+                self._q.get_nowait()
+                self._count_drop()
+            except queue.Empty:
+                pass
+            try:
+                self._q.put_nowait(row)
+            except queue.Full:
+                self._count_drop()
+                return False
+
+        depth = self._q.qsize()
+        with self._lock:
+            self._enqueued += 1
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return True
+
+    def _count_drop(self) -> None:
+        with self._lock:
+            self._dropped += 1
+        ROWS_DROPPED.labels(component=COMPONENT).inc()
+
+    # ---------------- LIFECYCLE ---------------- #
+
+    def start(self) -> "TickWriter":
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="tick-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush whatever is queued and close the connection."""
+        if self._thread is None:
+            return
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ---------------- WRITER THREAD ---------------- #
+
+    def _run(self) -> None:
+        batch: List[TickRow] = []
+        deadline = 0.0
+        next_stats = time.monotonic() + self.stats_seconds if self.stats_seconds > 0 else None
+        stopping = False
+
+        while not stopping:
+            timeout = self.flush_interval if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+            if next_stats is not None and time.monotonic() >= next_stats:
+                self._print_stats()
+                next_stats = time.monotonic() + self.stats_seconds
+
+        # drain anything that was queued behind the stop marker
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        self._close()
+
+    def _connect(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self.db_url)
+        return self._conn
+
+    def _close(self) -> None:
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+    def _flush(self, batch: List[TickRow]) -> None:
+        t0 = time.perf_counter()
+        picked_up = freshness.now()
+        if freshness.track_freshness():
+            sql, values = INSERT_TRACED_SQL, [(*row[:4], row[4] if len(row) > 4 else None) for row in batch]
+        else:
+            sql, values = INSERT_SQL, [row[:4] for row in batch]
+        for attempt in range(self.max_retries):
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    execute_values(cur, sql, values, page_size=len(values))
+                    if self.notify:
+                        # delivered to listeners only when the batch commits
+                        for payload in notify_payloads(batch):
+                            cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                conn.commit()
+                break
+            except Exception as e:
+                print(f"DB error (batch={len(batch)}, attempt {attempt + 1}/{self.max_retries}):", e)
+                DB_ERRORS.labels(component=COMPONENT).inc()
+                self._close()
+                if attempt == self.max_retries - 1:
+                    with self._lock:
+                        self._failed_batches += 1
+                        self._dropped += len(batch)
+                    ROWS_DROPPED.labels(component=COMPONENT).inc(len(batch))
+                    return
+                time.sleep(0.5 * (attempt + 1))
+
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        self._observe_lag(batch, picked_up)
+        ROWS_WRITTEN.labels(component=COMPONENT).inc(len(batch))
+        INSERT_SECONDS.labels(component=COMPONENT).observe(elapsed_ms / 1000.0)
+        INSERT_ROWS.labels(component=COMPONENT).observe(len(batch))
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+            self._last_batch_size = len(batch)
+            self._max_batch_size = max(self._max_batch_size, len(batch))
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    @staticmethod
+    def _observe_lag(batch: List[TickRow], picked_up: datetime) -> None:
+        committed = freshness.now()
+        commit_s = (committed - picked_up).total_seconds()
+        for row in batch:
+            if len(row) > 4:
+                freshness.observe("queue", freshness.lag_seconds(picked_up, row[4]))
+            freshness.observe("commit", commit_s)
+
+    # ---------------- COUNTERS ---------------- #
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = self._batches
+            return {
+                "queue_depth": self._q.qsize(),
+                "queue_capacity": self._q.maxsize,
+                "max_queue_depth": self._max_queue_depth,
+                "enqueued": self._enqueued,
+                "dropped": self._dropped,
+                "written": self._written,
+                "batches": batches,
+                "failed_batches": self._failed_batches,
+                "last_batch_size": self._last_batch_size,
+                "avg_batch_size": (self._written / batches) if batches else 0.0,
+                "max_batch_size": self._max_batch_size,
+                "last_flush_ms": self._last_flush_ms,
+                "avg_flush_ms": (self._total_flush_ms / batches) if batches else 0.0,
+                "max_flush_ms": self._max_flush_ms,
+            }
+
+    def _print_stats(self) -> None:
+        s = self.stats()
+        print(
+            f"💾 writer queue={s['queue_depth']}/{s['queue_capacity']} "
+            f"written={s['written']} dropped={s['dropped']} batches={s['batches']} "
+            f"avg_batch={s['avg_batch_size']:.1f} last_flush={s['last_flush_ms']:.1f}ms "
+            f"max_flush={s['max_flush_ms']:.1f}ms"
+        )
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+import psycopg2
+
+# Schema: sql/ingest_watermarks.sql
+
+READ_SQL = """
+SELECT high_water
+FROM public.ingest_watermarks
+WHERE symbol = %s AND granularity = %s AND source = %s;
+"""
+
+FALLBACK_SQL = """
+SELECT max(event_time)
+FROM public.ticks
+WHERE symbol = %s AND source = %s;
+"""
+
+FALLBACK_CANDLES_SQL = """
+SELECT max(bucket)
+FROM public.candles
+WHERE symbol = %s AND source = %s AND granularity = %s;
+"""
+
+SAVE_SQL = """
+INSERT INTO public.ingest_watermarks (symbol, granularity, source, high_water, updated_at)
+VALUES (%s, %s, %s, %s, now())
+ON CONFLICT (symbol, granularity, source) DO UPDATE
+SET high_water = GREATEST(public.ingest_watermarks.high_water, EXCLUDED.high_water),
+    updated_at = now();
+"""
+
+
+def read_watermark(
+    conn,
+    symbol: str,
+    granularity: int,
+    source: str = "coinbase",
+    sink: str = "ticks",
+) -> Optional[datetime]:
+    """
+    Newest candle time already loaded for (symbol, granularity, source).
+    Uses the checkpoint table when it exists and has a row, else max(event_time)
+    from public.ticks (or max(bucket) from public.candles when sink="candles").
+    """
+    with conn.cursor() as cur:
+        try:
+            cur.execute(READ_SQL, (symbol, granularity, source))
+            row = cur.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+            row = None
+        if row and row[0] is not None:
+            return row[0]
+
+        if sink == "candles":
+            cur.execute(FALLBACK_CANDLES_SQL, (symbol, source, granularity))
+        else:
+            cur.execute(FALLBACK_SQL, (symbol, source))
+        row = cur.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+
+def save_watermark(conn, symbol: str, granularity: int, high_water: datetime, source: str = "coinbase") -> bool:
+    """Advance the checkpoint (never moves backwards). Returns False if the table is missing."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute(SAVE_SQL, (symbol, granularity, source, high_water))
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+            return False
+    conn.commit()
+    return True
+
+
+def incremental_start(
+    watermark: Optional[datetime],
+    end: datetime,
+    max_days: int,
+    granularity: int,
+    overlap_candles: int = 3,
+) -> datetime:
+    """
+    Start of the fetch window: the watermark minus a few candles of overlap
+    (late corrections), but never earlier than end - max_days.
+    """
+    floor = end - timedelta(days=max_days)
+    if watermark is None:
+        return floor
+    return max(floor, watermark - timedelta(seconds=granularity * overlap_candles))
@@ -1,46 +1,80 @@
 import os
+import sys
 import json
 import time
 from datetime import datetime, timezone
+from pathlib import Path
 
-import psycopg2
 import websocket
 from dotenv import load_dotenv
 
+from rollup import Rollup
+from tick_writer import TickWriter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import freshness, metrics
+from common.shm_ring import RingWriter
+
 load_dotenv()
 
 DB_URL = os.environ["DATABASE_URL"]
 
-SYMBOLS = ["btcusdt", "ethusdt", "solusdt"]
+# Point BINANCE_WS_URL at ingest/fake_exchange.py (ws://127.0.0.1:9443) to
+# replay a recording or load-test with synthetic symbols.
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443").rstrip("/")
+SYMBOLS = [s.strip().lower() for s in os.getenv("BINANCE_SYMBOLS", "btcusdt,ethusdt,solusdt").split(",") if s.strip()]
 STREAM_URL = (
-    "wss://stream.binance.com:9443/stream?streams="
+    f"{BINANCE_WS_URL}/stream?streams="
     + "/".join(f"{s}@miniTicker" for s in SYMBOLS)
 )
 
-INSERT_SQL = """
-insert into public.ticks (symbol, event_time, price, volume)
-values (%s, %s, %s, %s)
-on conflict do nothing;
-"""
+# Batches are flushed by a background thread on one persistent connection.
+# Tune with WRITER_BATCH_SIZE / WRITER_FLUSH_MS / WRITER_QUEUE_MAX / WRITER_BACKPRESSURE.
+writer = TickWriter.from_env(DB_URL)
+
+# Optional shared-memory ring of recent ticks / 1m candles for the API
+# (common/shm_ring.py). Point SHM_RING_PATH at tmpfs, e.g. /dev/shm/cryptopulse.ring.
+SHM_RING_PATH = os.getenv("SHM_RING_PATH")
+ring = (
+    RingWriter(
+        SHM_RING_PATH,
+        tick_capacity=int(os.getenv("SHM_RING_TICKS", "4096")),
+        candle_capacity=int(os.getenv("SHM_RING_CANDLES", "1440")),
+        source="binance",
+    )
+    if SHM_RING_PATH
+    else None
+)
+
+# ROLLUP=1: keep 1m/5m/15m/1h/1d bars in memory and upsert them into
+# public.candles (ingest/rollup.py, sql/candles.sql). Tune with
+# ROLLUP_GRANULARITIES / ROLLUP_FLUSH_SECONDS / ROLLUP_GRACE_SECONDS.
+rollup = (
+    Rollup.from_env(DB_URL, source="binance")
+    if os.getenv("ROLLUP", "0").strip().lower() in ("1", "true", "yes")
+    else None
+)
+
+MESSAGES_RECEIVED = metrics.counter("ingest_messages_received_total", "Websocket messages received", ["source"]).labels(source="binance")
 
 def on_message(ws, message):
+    MESSAGES_RECEIVED.inc()
     data = json.loads(message)["data"]
     symbol = data["s"]
     price = float(data["c"])
     volume = float(data["v"])
     event_time = datetime.fromtimestamp(data["E"] / 1000, tz=timezone.utc)
+    received_at = freshness.now()
+    freshness.observe("exchange", (received_at - event_time).total_seconds())
 
-    try:
-        with psycopg2.connect(DB_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    INSERT_SQL,
-                    (symbol, event_time, price, volume),
-                )
-            conn.commit()
-        print(f"📈 {symbol} {price}")
-    except Exception as e:
-        print("DB error:", e)
+    # dropped rows (backpressure) are counted in writer.stats()
+    writer.submit((symbol, event_time, price, volume, received_at))
+    # `v` is the rolling 24h volume, not this trade's: the ring and the
+    # rollups keep no volume (NaN / NULL)
+    if ring is not None:
+        ring.add_tick(symbol, event_time, price)
+    if rollup is not None:
+        rollup.add(symbol, event_time, price)
 
 def on_error(ws, error):
     print("WebSocket error:", error)
@@ -61,4 +95,13 @@ def start():
 
 if __name__ == "__main__":
     print("🚀 Starting crypto stream...")
-    start()
+    metrics.serve_from_env()
+    writer.start()
+    if rollup is not None:
+        rollup.start()
+    try:
+        start()
+    finally:
+        if rollup is not None:
+            rollup.stop()
+        writer.stop()
@@ -1,15 +1,26 @@
 import os
-import time
+import sys
 from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from typing import List, Tuple, Dict, Any, Optional
 
 import requests
 import psycopg2
-from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+from backfill_engine import run_backfill
+from bulk_load import LoadResult, copy_ticks
+from candle_sink import coinbase_to_candles, make_sink_writer
+from rate_limit import TokenBucket
 
-COINBASE_BASE = "https://api.exchange.coinbase.com"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import metrics
+
+# before the module-level config below reads the environment
+load_dotenv()
+
+# COINBASE_BASE=http://127.0.0.1:9443 for ingest/fake_exchange.py
+COINBASE_BASE = os.getenv("COINBASE_BASE", "https://api.exchange.coinbase.com").rstrip("/")
 USER_AGENT = "cryptopulse-backfill/1.0"
 
 # Map of our symbol -> Coinbase product_id
@@ -96,27 +107,20 @@ def chunk_range(start: datetime, end: datetime, granularity: int) -> List[Tuple[
     return chunks
 
 
-def insert_ticks(conn, rows: List[Tuple[datetime, str, float, float]]) -> int:
+def insert_ticks(conn, rows: List[Tuple[datetime, str, float, float]], received_at: Optional[datetime] = None) -> LoadResult:
     """
     rows: (event_time, symbol, price, volume)
-    Inserts into public.ticks with source='coinbase'
-    """
-    if not rows:
-        return 0
-
-    sql = """
-        INSERT INTO public.ticks (event_time, symbol, price, volume, source)
-        VALUES %s
+    Bulk loads into public.ticks with source='coinbase' (COPY + staging merge).
+    Rows that hit an existing unique constraint are skipped, not errors.
     """
+    return copy_ticks(conn, rows, source="coinbase", received_at=received_at)
 
-    # If you have a unique constraint like (source, symbol, event_time),
-    # you can add: ON CONFLICT DO NOTHING
-    # Keeping it plain here to avoid failing if constraint doesn't exist.
 
-    with conn.cursor() as cur:
-        execute_values(cur, sql, [(t, s, p, v, "coinbase") for (t, s, p, v) in rows])
-    conn.commit()
-    return len(rows)
+def make_limiter() -> TokenBucket:
+    """One limiter per process; Coinbase public endpoints allow ~10 req/s per IP."""
+    rate = float(os.getenv("COINBASE_RPS", "8"))
+    burst = get_env_int("COINBASE_BURST", 8)
+    return TokenBucket(rate=rate, burst=burst)
 
 
 def backfill_product(conn, symbol: str, product_id: str, days: int, granularity: int) -> None:
@@ -128,46 +132,20 @@ def backfill_product(conn, symbol: str, product_id: str, days: int, granularity:
     print(f"Backfilling {symbol} ({product_id}) for {days} day(s) @ {granularity}s candles")
     print(f"Total chunks: {len(chunks)} (max {MAX_CANDLES_PER_REQUEST} candles per chunk)")
 
-    sess = requests.Session()
-
-    total_inserted = 0
-    for i, (t1, t2) in enumerate(chunks, start=1):
-        # retry with small backoff
-        for attempt in range(5):
-            try:
-                candles = fetch_candles(product_id, t1, t2, granularity, session=sess)
-                break
-            except Exception as e:
-                if attempt == 4:
-                    raise
-                sleep_s = 1.5 * (attempt + 1)
-                print(f"  Chunk {i}/{len(chunks)} failed ({e}). Retrying in {sleep_s:.1f}s...")
-                time.sleep(sleep_s)
-
-        # Convert candles -> ticks using close price at candle timestamp
-        rows = []
-        for c in candles:
-            # [ time, low, high, open, close, volume ]
-            ts = datetime.fromtimestamp(c[0], tz=timezone.utc).replace(microsecond=0)
-            close = float(c[4])
-            vol = float(c[5])
-            rows.append((ts, symbol, close, vol))
-
-        inserted = insert_ticks(conn, rows)
-        total_inserted += inserted
-
-        print(
-            f"  Chunk {i}/{len(chunks)} {iso_z(t1)} → {iso_z(t2)} | candles={len(candles)} | inserted={inserted}"
-        )
-
-        # Be nice to the API
-        time.sleep(0.2)
-
-    print(f"Done {symbol}: total_inserted={total_inserted}")
+    run_backfill(
+        conn,
+        [(symbol, product_id, chunks)],
+        granularity,
+        fetch_fn=fetch_candles,
+        insert_fn=make_sink_writer(os.getenv("SINK", "ticks").strip().lower(), granularity, insert_ticks),
+        workers=get_env_int("BACKFILL_WORKERS", 4),
+        limiter=make_limiter(),
+        to_rows=coinbase_to_candles,
+    )
 
 
 def main():
-    load_dotenv()
+    metrics.serve_from_env()
 
     days = get_env_int("BACKFILL_DAYS", 1)
     granularity = get_env_int("GRANULARITY", 60)
@@ -181,9 +159,28 @@ def main():
     if granularity not in allowed:
         raise ValueError(f"GRANULARITY must be one of {sorted(allowed)}. Got {granularity}")
 
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    start = (now - timedelta(days=days)).replace(microsecond=0)
+    jobs = [
+        (symbol, product_id, chunk_range(start, now, granularity=granularity))
+        for symbol, product_id in PRODUCTS.items()
+    ]
+
+    print(f"Backfilling {len(jobs)} product(s) for {days} day(s) @ {granularity}s candles")
+
+    # All products share one rate limiter; fetches run on BACKFILL_WORKERS
+    # threads while a single writer thread inserts finished chunks.
     with psycopg2.connect(db_url) as conn:
-        for symbol, product_id in PRODUCTS.items():
-            backfill_product(conn, symbol, product_id, days=days, granularity=granularity)
+        run_backfill(
+            conn,
+            jobs,
+            granularity,
+            fetch_fn=fetch_candles,
+            insert_fn=make_sink_writer(os.getenv("SINK", "ticks").strip().lower(), granularity, insert_ticks),
+            workers=get_env_int("BACKFILL_WORKERS", 4),
+            limiter=make_limiter(),
+            to_rows=coinbase_to_candles,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+"""
+Backtest the saved models as trading signals.
+
+  python ml/backtest.py                      every model in ml/models
+  python ml/backtest.py BTCUSD ETHUSD --fee-bps 10 --short --json out.json
+  python ml/backtest.py --walk-forward       refit each model on expanding folds
+
+Each symbol's history is loaded and featured once. The probabilities of
+every model for that symbol come out of one stacked pass over all rows
+(the same arithmetic predict_server.py uses for /predict/batch).
+
+Trades: a signal at bar t (STRONG_UP for mode D, UP for mode A, and DOWN
+as a short with --short) enters at that bar's close and exits H bars later
+at the close; one position per model at a time, signals while it is open
+are ignored. Every trade pays --fee-bps on entry and on exit.
+
+Per model: trades, hit rate, average and compounded return, max drawdown
+of the trade-by-trade equity curve, exposure, and buy & hold over the
+same bars for reference. Saved models have usually seen most of the
+history they are tested on; `oos_bars` counts the bars after their
+trained_until. --walk-forward instead scores each bar with a model fitted
+only on earlier bars (TimeSeriesSplit folds, as in train_forecast.py).
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+from sklearn.model_selection import TimeSeriesSplit
+
+from features import add_features
+from model_store import MODELS_DIR, ModelCache, stack_models, stackable
+from ohlcv_data import has_data, load_ohlcv
+from train_forecast import CV_SPLITS, make_target, new_model
+from train_grid import future_returns
+
+DEFAULT_FEE_BPS = 10.0
+
+
+# ---------------- SCORING ---------------- #
+
+def batch_proba(stack, X: np.ndarray) -> np.ndarray:
+    """(rows, models) P(y=1) of stacked models over every row of X."""
+    mean, scale, coef, intercept = stack
+    z = (X[:, None, :] - mean[None, :, :]) / scale[None, :, :]
+    return expit(np.einsum("nmf,mf->nm", z, coef) + intercept)
+
+
+def score_models(X: np.ndarray, payloads: List[dict]) -> np.ndarray:
+    """(rows, models) probabilities; NaN where a row lacks features."""
+    P = np.full((len(X), len(payloads)), np.nan)
+    ok = ~np.isnan(X).any(axis=1)
+    stacked = [j for j, p in enumerate(payloads) if stackable(p["model"])]
+    if stacked:
+        P[np.ix_(ok, stacked)] = batch_proba(stack_models([payloads[j]["model"] for j in stacked]), X[ok])
+    for j, p in enumerate(payloads):
+        if j not in stacked:
+            P[ok, j] = p["model"].predict_proba(X[ok])[:, 1]
+    return P
+
+
+def walk_forward_proba(df: pd.DataFrame, X: np.ndarray, payload: dict) -> np.ndarray:
+    """Probabilities where each test fold is scored by a model fitted on the rows before it."""
+    target = make_target(df, horizon=payload["horizon"], mode=payload["mode"], thr=payload["thr"])
+    rows = np.flatnonzero(df.index.isin(target.index) & ~np.isnan(X).any(axis=1))
+    y = target.loc[df.index[rows], "y"].to_numpy()
+    proba = np.full(len(X), np.nan)
+    for train_idx, test_idx in TimeSeriesSplit(n_splits=CV_SPLITS).split(rows):
+        model = new_model().fit(X[rows[train_idx]], y[train_idx])
+        proba[rows[test_idx]] = model.predict_proba(X[rows[test_idx]])[:, 1]
+    return proba
+
+
+# ---------------- TRADING ---------------- #
+
+def next_signal(signal: np.ndarray) -> np.ndarray:
+    """For every bar, the first bar at or after it with a signal (len(signal) if none)."""
+    n = len(signal)
+    idx = np.where(signal, np.arange(n), n)
+    out = np.minimum.accumulate(idx[::-1])[::-1]
+    return np.append(out, n)  # so next_signal[n] is valid
+
+
+def trade_entries(signal: np.ndarray, horizon: int) -> np.ndarray:
+    """Entry bars of non-overlapping trades: the next signal once the previous trade has exited."""
+    nxt = next_signal(signal)
+    n = len(signal)
+    out = []
+    i = nxt[0]
+    while i < n:
+        out.append(i)
+        i = nxt[min(i + horizon, n)]
+    return np.asarray(out, dtype=np.int64)
+
+
+def trade_stats(trade_ret: np.ndarray) -> Dict[str, Optional[float]]:
+    if len(trade_ret) == 0:
+        return {"trades": 0, "hit_rate": None, "avg_ret": None, "total_ret": 0.0, "max_drawdown": 0.0}
+    equity = np.cumprod(1.0 + trade_ret)
+    peak = np.maximum.accumulate(np.append(1.0, equity))[1:]
+    return {
+        "trades": int(len(trade_ret)),
+        "hit_rate": float(np.mean(trade_ret > 0)),
+        "avg_ret": float(np.mean(trade_ret)),
+        "total_ret": float(equity[-1] - 1.0),
+        "max_drawdown": float(np.max(1.0 - equity / peak)),
+    }
+
+
+def simulate(close: np.ndarray, P: np.ndarray, horizons: List[int], modes: List[str], fee: float, short: bool) -> List[dict]:
+    """Trade stats per model column of P."""
+    fwd = future_returns(close, sorted(set(horizons)))
+    col = {h: j for j, h in enumerate(sorted(set(horizons)))}
+    out = []
+    for j, (h, mode) in enumerate(zip(horizons, modes)):
+        ret = fwd[:, col[h]]
+        tradable = ~np.isnan(P[:, j]) & ~np.isnan(ret)
+        direction = np.zeros(len(close))
+        direction[tradable & (P[:, j] >= 0.5)] = 1.0
+        if short and mode == "A":
+            direction[tradable & (P[:, j] < 0.5)] = -1.0
+        taken = trade_entries(direction != 0, h)
+        trade_ret = direction[taken] * ret[taken] - 2 * fee
+        stats = trade_stats(trade_ret)
+        stats["long_trades"] = int(np.sum(direction[taken] > 0))
+        stats["exposure"] = float(len(taken) * h / max(tradable.sum(), 1))
+        out.append(stats)
+    return out
+
+
+# ---------------- DRIVER ---------------- #
+
+def backtest_symbol(symbol: str, models: List[dict], fee: float, short: bool, walk_forward: bool) -> List[dict]:
+    df = add_features(load_ohlcv(symbol))
+    close = df["close"].to_numpy(dtype=np.float64)
+    buckets = df["bucket"]
+
+    payloads = [joblib.load(MODELS_DIR / e["file"]) for e in models]
+    results = []
+    # models with the same feature list are scored together
+    by_cols: Dict[tuple, List[int]] = {}
+    for j, p in enumerate(payloads):
+        by_cols.setdefault(tuple(p["feature_cols"]), []).append(j)
+
+    for cols, idx in by_cols.items():
+        X = df[list(cols)].to_numpy(dtype=np.float64)
+        group = [payloads[j] for j in idx]
+        if walk_forward:
+            P = np.column_stack([walk_forward_proba(df, X, p) for p in group])
+        else:
+            P = score_models(X, group)
+        horizons = [int(p["horizon"]) for p in group]
+        modes = [p["mode"] for p in group]
+        stats = simulate(close, P, horizons, modes, fee, short)
+
+        for k, (j, p, s) in enumerate(zip(idx, group, stats)):
+            tested = ~np.isnan(P[:, k])
+            first = int(np.argmax(tested)) if tested.any() else len(close) - 1
+            # walk-forward scores are out-of-sample by construction
+            oos = tested if walk_forward else tested & (buckets > pd.Timestamp(p["trained_until"])).to_numpy()
+            results.append(
+                {
+                    "model": models[j]["file"],
+                    "symbol": symbol,
+                    "horizon_minutes": int(p["horizon"]),
+                    "mode": p["mode"],
+                    "thr": p["thr"] if p["mode"] == "D" else None,
+                    **s,
+                    "buy_hold_ret": float(close[-1] / close[first] - 1.0),
+                    "bars": int(tested.sum()),
+                    "oos_bars": int(oos.sum()),
+                }
+            )
+    return results
+
+
+def backtest(symbols: Optional[List[str]] = None, fee_bps: float = DEFAULT_FEE_BPS, short: bool = False, walk_forward: bool = False) -> List[dict]:
+    manifest = ModelCache().manifest()
+    wanted = {s.upper() for s in symbols} if symbols else None
+    by_symbol: Dict[str, List[dict]] = {}
+    for e in manifest:
+        if wanted is None or e["symbol"] in wanted:
+            by_symbol.setdefault(e["symbol"], []).append(e)
+
+    results = []
+    for symbol, models in sorted(by_symbol.items()):
+        if not has_data(symbol):
+            print(f"⚠️  {symbol}: no OHLCV data, skipping {len(models)} models")
+            continue
+        t0 = time.perf_counter()
+        results.extend(backtest_symbol(symbol, models, fee_bps / 10_000, short, walk_forward))
+        print(f"{symbol}: {len(models)} models in {time.perf_counter() - t0:.2f}s")
+    return results
+
+
+def print_table(results: List[dict]) -> None:
+    print(f"{'model':34} {'trades':>6} {'hit':>6} {'avg':>8} {'total':>8} {'maxDD':>7} {'b&h':>8} {'oos':>6}")
+    for r in sorted(results, key=lambda r: r["total_ret"], reverse=True):
+        hit = f"{r['hit_rate']:.3f}" if r["hit_rate"] is not None else "-"
+        avg = f"{r['avg_ret'] * 100:.3f}%" if r["avg_ret"] is not None else "-"
+        print(
+            f"{r['model']:34} {r['trades']:>6} {hit:>6} {avg:>8} {r['total_ret'] * 100:>7.2f}% "
+            f"{r['max_drawdown'] * 100:>6.2f}% {r['buy_hold_ret'] * 100:>7.2f}% {r['oos_bars']:>6}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbols", nargs="*", help="default: every symbol with a model")
+    parser.add_argument("--fee-bps", type=float, default=DEFAULT_FEE_BPS, help="per side, in basis points")
+    parser.add_argument("--short", action="store_true", help="mode A models also short on DOWN")
+    parser.add_argument("--walk-forward", action="store_true", help="refit on expanding folds instead of using the saved fit")
+    parser.add_argument("--json", type=str, default=None, help="write the results here")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    t0 = time.perf_counter()
+    results = backtest(args.symbols, args.fee_bps, args.short, args.walk_forward)
+    print_table(results)
+    print(f"{len(results)} models in {time.perf_counter() - t0:.2f}s")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
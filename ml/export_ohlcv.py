@@ -7,26 +7,97 @@ ENV_PATH = Path(__file__).resolve().parents[1] / "cryptopulse-dashboard" / ".env
 load_dotenv(ENV_PATH, override=False)
 
 import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List
+
+import numpy as np
 import pandas as pd
 import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import freshness
+
+from ohlcv_data import (
+    ROW_GROUP_ROWS,
+    dataset_dir,
+    legacy_path,
+    load_ohlcv,
+    partition_files,
+    partitions,
+    read_tail,
+)
 
 
 # Usage:
 #   set DATABASE_URL env var (same as your Next app)
-#   python ml/export_ohlcv.py BTCUSD
+#   python ml/export_ohlcv.py BTCUSD [DAYS] [--full] [--compact] [--stream] [--migrate]
+#   python ml/export_ohlcv.py BTCUSD,ETHUSD,SOLUSD [DAYS] --stream
+#
+# Output (day-partitioned dataset, read with ml/ohlcv_data.py):
+#   ml/data/BTCUSD_ohlcv_1m/date=YYYY-MM-DD/part-<first>-<last>.parquet
 #
-# Output:
-#   ml/data/BTCUSD_ohlcv_1m.parquet
+# Each run only fetches buckets newer than the last exported one and adds
+# them as new files; the first run (or --full) pulls the last DAYS days.
+# Partitions older than DAYS are dropped. A day is compacted back into one
+# file once it has COMPACT_MIN_FILES files, or always with --compact.
+#
+# Every file is sorted by bucket, in row groups of ROW_GROUP_ROWS with
+# min/max statistics, so readers can open just the newest row groups.
+# --migrate seeds a missing dataset from the old single-file export.
 
-def export_symbol(symbol: str, out_path: str, lookback_days: int = 14):
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        raise RuntimeError("DATABASE_URL env var not set")
+COMPACT_MIN_FILES = int(os.getenv("COMPACT_MIN_FILES", "24"))
 
-    conn = psycopg2.connect(db_url)
+# --stream: rows go from a server-side cursor straight into parquet, one
+# record batch of EXPORT_BATCH_ROWS at a time, so memory does not grow
+# with the window. Several symbols export on EXPORT_WORKERS processes.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "4"))
+
+# Postgres casts every column to its final type, so batches are built
+# straight from the fetched tuples without a coercion pass.
+ARROW_SCHEMA = pa.schema(
+    [
+        ("bucket", pa.timestamp("us", tz="UTC")),
+        ("open", pa.float64()),
+        ("high", pa.float64()),
+        ("low", pa.float64()),
+        ("close", pa.float64()),
+        ("volume", pa.float64()),
+    ]
+)
+DAY_US = 86_400_000_000
+SORTED_BY_BUCKET = [pq.SortingColumn(0)]
+
+
+def ohlcv_source():
+    # OHLCV_SOURCE=candles reads native exchange candles (public.candles)
+    # instead of the tick-aggregated public.ohlcv_1m.
+    if os.getenv("OHLCV_SOURCE", "ohlcv_1m").strip().lower() == "candles":
+        return "public.candles", "AND granularity = 60"
+    return "public.ohlcv_1m", ""
+
+
+def last_exported_bucket(symbol: str):
+    """Newest bucket in the dataset; only the newest partition is opened."""
+    dates = partitions(symbol)
+    if not dates:
+        return None
+    files = partition_files(dataset_dir(symbol) / f"date={dates[-1]}")
+    last = max(read_tail(f, 1, ["bucket"])["bucket"].max() for f in files)
+    return pd.Timestamp(last).tz_convert("UTC").to_pydatetime()
 
-    # Pull last N days of 1m candles for one symbol
-    q = """
+
+def fetch_new_rows(conn, symbol: str, since: datetime) -> pd.DataFrame:
+    table, granularity_filter = ohlcv_source()
+
+    # Closed buckets only: the current minute is still changing and would be
+    # frozen half-built by an incremental export.
+    q = f"""
         SELECT
           bucket,
           open,
@@ -34,17 +105,15 @@ def export_symbol(symbol: str, out_path: str, lookback_days: int = 14):
           low,
           close,
           volume
-        FROM public.ohlcv_1m
+        FROM {table}
         WHERE symbol = %s
-          AND bucket >= now() - (%s || ' days')::interval
+          {granularity_filter}
+          AND bucket > %s
+          AND bucket < date_trunc('minute', now())
         ORDER BY bucket ASC;
     """
 
-    df = pd.read_sql(q, conn, params=(symbol, lookback_days))
-    conn.close()
-
-    if df.empty:
-        raise RuntimeError(f"No rows found for symbol={symbol} in public.ohlcv_1m")
+    df = pd.read_sql(q, conn, params=(symbol, since))
 
     # Make sure types are clean
     df["bucket"] = pd.to_datetime(df["bucket"], utc=True)
@@ -52,22 +121,226 @@ def export_symbol(symbol: str, out_path: str, lookback_days: int = 14):
         df[c] = pd.to_numeric(df[c], errors="coerce")
 
     # Drop any bad rows
-    df = df.dropna(subset=["close"])
+    return df.dropna(subset=["close"])
+
+
+def stream_new_rows(conn, symbol: str, since: datetime, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """fetch_new_rows as ARROW_SCHEMA record batches from a named cursor."""
+    table, granularity_filter = ohlcv_source()
+    q = f"""
+        SELECT
+          (extract(epoch FROM bucket) * 1000000)::int8,
+          open::float8,
+          high::float8,
+          low::float8,
+          close::float8,
+          volume::float8
+        FROM {table}
+        WHERE symbol = %s
+          {granularity_filter}
+          AND bucket > %s
+          AND bucket < date_trunc('minute', now())
+          AND close IS NOT NULL
+        ORDER BY bucket ASC;
+    """
+    with conn.cursor(name=f"export_{symbol.lower()}") as cur:
+        cur.itersize = batch_rows
+        cur.execute(q, (symbol, since))
+        while True:
+            rows = cur.fetchmany(batch_rows)
+            if not rows:
+                break
+            yield pa.record_batch(
+                [pa.array(col, type=f.type) for col, f in zip(zip(*rows), ARROW_SCHEMA)],
+                schema=ARROW_SCHEMA,
+            )
 
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    df.to_parquet(out_path, index=False)
-    print(f"Saved {len(df)} rows -> {out_path}")
 
+def write_stream(symbol: str, batches: Iterator[pa.RecordBatch]) -> int:
+    """
+    Write ascending batches as one new file per UTC day (same layout as
+    append_partitions). Returns rows written.
+    """
+    out = dataset_dir(symbol)
+    writer = tmp = None
+    day = first = last = None
+    total = 0
+
+    def close():
+        if writer is None:
+            return
+        writer.close()
+        os.replace(tmp, tmp.with_name(f"part-{first // 1_000_000}-{last // 1_000_000}.parquet"))
+
+    for batch in batches:
+        ts = batch.column(0).cast(pa.int64()).to_numpy()
+        days = ts // DAY_US
+        cuts = [0, *(np.flatnonzero(np.diff(days)) + 1), len(ts)]
+        for a, b in zip(cuts, cuts[1:]):
+            if days[a] != day:
+                close()
+                day = days[a]
+                part_dir = out / f"date={datetime.fromtimestamp(int(day) * 86400, tz=timezone.utc):%Y-%m-%d}"
+                part_dir.mkdir(parents=True, exist_ok=True)
+                tmp = part_dir / f"_part-{os.getpid()}.tmp"
+                writer = pq.ParquetWriter(tmp, ARROW_SCHEMA, sorting_columns=SORTED_BY_BUCKET)
+                first = int(ts[a])
+            writer.write_batch(batch.slice(a, b - a), row_group_size=ROW_GROUP_ROWS)
+            last = int(ts[b - 1])
+            total += b - a
+    close()
+    return total
 
-if __name__ == "__main__":
-    import sys
 
-    if len(sys.argv) < 2:
-        print("Usage: python ml/export_ohlcv.py <SYMBOL> [DAYS]")
+def write_atomic(df: pd.DataFrame, path) -> None:
+    # "_"-prefixed files are skipped by readers until renamed into place
+    tmp = path.with_name(f"_{path.name}.tmp")
+    df.to_parquet(tmp, index=False, row_group_size=ROW_GROUP_ROWS, sorting_columns=SORTED_BY_BUCKET)
+    os.replace(tmp, path)
+
+
+def part_name(df: pd.DataFrame) -> str:
+    first = int(df["bucket"].iloc[0].timestamp())
+    last = int(df["bucket"].iloc[-1].timestamp())
+    return f"part-{first}-{last}.parquet"
+
+
+def append_partitions(symbol: str, df: pd.DataFrame) -> int:
+    """Write df as one new file per UTC day; returns files written."""
+    out = dataset_dir(symbol)
+    written = 0
+    for day, part in df.groupby(df["bucket"].dt.strftime("%Y-%m-%d"), sort=True):
+        part_dir = out / f"date={day}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        write_atomic(part.reset_index(drop=True), part_dir / part_name(part))
+        written += 1
+    return written
+
+
+def compact(symbol: str, min_files: int = 2) -> int:
+    """Merge each day with >= min_files files into one; returns days compacted."""
+    compacted = 0
+    for day in partitions(symbol):
+        part_dir = dataset_dir(symbol) / f"date={day}"
+        files = partition_files(part_dir)
+        if len(files) < max(2, min_files):
+            continue
+        df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+        df = df.drop_duplicates(subset=["bucket"], keep="last").sort_values("bucket").reset_index(drop=True)
+        target = part_dir / part_name(df)
+        write_atomic(df, target)
+        for f in files:
+            if f != target:
+                f.unlink()
+        compacted += 1
+    return compacted
+
+
+def migrate_legacy(symbol: str) -> int:
+    """Seed an empty dataset from ml/data/<SYMBOL>_ohlcv_1m.parquet; returns rows copied."""
+    if partitions(symbol) or not legacy_path(symbol).exists():
+        return 0
+    df = load_ohlcv(symbol)  # no dataset yet, so this reads the legacy file
+    append_partitions(symbol, df)
+    return len(df)
+
+
+def drop_old_partitions(symbol: str, keep_days: int) -> int:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    old = [d for d in partitions(symbol) if d < cutoff]
+    for day in old:
+        shutil.rmtree(dataset_dir(symbol) / f"date={day}")
+    return len(old)
+
+
+def export_symbol(
+    symbol: str,
+    lookback_days: int = 14,
+    full: bool = False,
+    force_compact: bool = False,
+    stream: bool = False,
+    migrate: bool = False,
+) -> int:
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        raise RuntimeError("DATABASE_URL env var not set")
+
+    if full and dataset_dir(symbol).exists():
+        shutil.rmtree(dataset_dir(symbol))
+    if migrate and not full:
+        migrated = migrate_legacy(symbol)
+        if migrated:
+            print(f"Migrated {migrated} rows for {symbol} from {legacy_path(symbol)}")
+
+    since = last_exported_bucket(symbol)
+    if since is None:
+        since = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+
+    conn = psycopg2.connect(db_url)
+    try:
+        if stream:
+            rows = write_stream(symbol, stream_new_rows(conn, symbol, since))
+        else:
+            df = fetch_new_rows(conn, symbol, since)
+            rows = len(df)
+    finally:
+        conn.close()
+
+    if rows == 0 and not partitions(symbol):
+        table, _ = ohlcv_source()
+        raise RuntimeError(f"No rows found for symbol={symbol} in {table}")
+
+    if not stream and rows:
+        append_partitions(symbol, df)
+    dropped = drop_old_partitions(symbol, lookback_days)
+    compacted = compact(symbol, 2 if force_compact else COMPACT_MIN_FILES)
+
+    # freshness "export" stage: newest 1m bucket closed -> on disk
+    newest = last_exported_bucket(symbol)
+    lag = freshness.lag_seconds(freshness.now(), freshness.bucket_close(newest)) if newest is not None else None
+    print(
+        f"Saved {rows} new rows for {symbol} (after {since.isoformat()}) -> {dataset_dir(symbol)}"
+        f"  compacted={compacted} dropped_days={dropped}"
+        + (f"  newest={newest.isoformat()} export_lag={lag:.1f}s" if lag is not None else "")
+    )
+    return rows
+
+
+def export_many(symbols: List[str], workers: int = EXPORT_WORKERS, **kwargs) -> None:
+    """export_symbol for each symbol on a process pool (one DB connection each)."""
+    if len(symbols) == 1 or workers <= 1:
+        for symbol in symbols:
+            export_symbol(symbol, **kwargs)
+        return
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(symbols))) as pool:
+        futures = {pool.submit(export_symbol, symbol, **kwargs): symbol for symbol in symbols}
+        for fut in as_completed(futures):
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"❌ {futures[fut]}: {e}")
+                failed.append(futures[fut])
+    if failed:
+        raise RuntimeError(f"Export failed for {', '.join(sorted(failed))}")
+
+
+if __name__ == "__main__":
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(args) < 1:
+        print("Usage: python ml/export_ohlcv.py <SYMBOL>[,<SYMBOL>...] [DAYS] [--full] [--compact] [--stream] [--migrate]")
         raise SystemExit(1)
 
-    symbol = sys.argv[1]
-    days = int(sys.argv[2]) if len(sys.argv) >= 3 else 14
+    symbols = [s.strip() for s in args[0].split(",") if s.strip()]
+    days = int(args[1]) if len(args) >= 2 else 14
 
-    out = f"ml/data/{symbol}_ohlcv_1m.parquet"
-    export_symbol(symbol, out, lookback_days=days)
+    export_many(
+        symbols,
+        lookback_days=days,
+        full="--full" in flags,
+        force_compact="--compact" in flags,
+        stream="--stream" in flags,
+        migrate="--migrate" in flags,
+    )
@@ -0,0 +1,230 @@
+"""
+Feature engine shared by train_forecast.py, predict.py and predict_server.py.
+
+Two engines over the same arithmetic:
+
+  add_features(df)   batch, vectorized over the whole frame (training)
+  FeatureStream      one candle at a time, constant work per update (serving)
+
+Every feature of row i depends only on the last WARMUP_ROWS closes and the
+last 30 volumes, and both engines run the same IEEE float operations in
+the same order (window sums left to right, two-pass std). So they give
+bit-for-bit identical values, whatever row the stream started from.
+
+NaN handling follows pandas' defaults: a rolling window with any NaN (or
+fewer rows than the window, i.e. min_periods = window) yields NaN, and
+returns need `periods` earlier closes.
+"""
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+FEATURE_COLS = [
+    "ret_1",
+    "ret_5",
+    "ret_15",
+    "ma_ratio_10_30",
+    "vol_30",
+    "vol_60",
+    "vol_ratio",
+]
+
+# Every column add_features() adds, helpers included.
+ALL_COLS = [
+    "ret_1",
+    "ret_5",
+    "ret_15",
+    "ma_10",
+    "ma_30",
+    "ma_ratio_10_30",
+    "vol_30",
+    "vol_60",
+    "vol_ma_30",
+    "vol_ratio",
+]
+
+# vol_60 is a 60-window over ret_1, which itself needs one earlier close.
+WARMUP_ROWS = 61
+
+
+# ---------------- BATCH ---------------- #
+#
+# Window statistics add up left to right, one shifted slice at a time; the
+# streaming engine below does the same float operations in the same order.
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    m = len(x) - window + 1
+    s = x[0:m].copy()
+    for j in range(1, window):
+        s += x[j:j + m]
+    return s
+
+
+def _rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    """Sample std (ddof=1), two-pass per window."""
+    m = len(x) - window + 1
+    mean = _rolling_sum(x, window) / window
+    d = x[0:m] - mean
+    s = d * d
+    for j in range(1, window):
+        d = x[j:j + m] - mean
+        s += d * d
+    return np.sqrt(s / (window - 1))
+
+
+def _rolling(x: np.ndarray, window: int, std: bool = False) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = _rolling_std(x, window) if std else _rolling_sum(x, window) / window
+    return out
+
+
+def _pct_change(x: np.ndarray, periods: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) > periods:
+        out[periods:] = x[periods:] / x[:-periods] - 1
+    return out
+
+
+def compute_features(close: np.ndarray, volume: np.ndarray) -> Dict[str, np.ndarray]:
+    """Every column in ALL_COLS for float64 close / volume arrays (bucket order)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret_1 = _pct_change(close, 1)
+        ma_10 = _rolling(close, 10)
+        ma_30 = _rolling(close, 30)
+        vol_ma_30 = _rolling(volume, 30)
+        return {
+            "ret_1": ret_1,
+            "ret_5": _pct_change(close, 5),
+            "ret_15": _pct_change(close, 15),
+            "ma_10": ma_10,
+            "ma_30": ma_30,
+            "ma_ratio_10_30": ma_10 / ma_30 - 1,
+            "vol_30": _rolling(ret_1, 30, std=True),
+            "vol_60": _rolling(ret_1, 60, std=True),
+            "vol_ma_30": vol_ma_30,
+            "vol_ratio": volume / vol_ma_30 - 1,
+        }
+
+
+def add_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Simple, stable feature set (works best so far)."""
+    df = df.sort_values("bucket")
+    df = df.assign(
+        close=pd.to_numeric(df["close"], errors="coerce"),
+        volume=pd.to_numeric(df["volume"], errors="coerce"),
+    )
+    df = df.dropna(subset=["close"])
+
+    feats = compute_features(
+        df["close"].to_numpy(dtype=np.float64),
+        df["volume"].to_numpy(dtype=np.float64),
+    )
+    return df.assign(**feats)
+
+
+# ---------------- STREAMING ---------------- #
+
+def _div(a: float, b: float) -> float:
+    # float division with numpy's inf / nan instead of ZeroDivisionError
+    if b == 0:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return float(np.float64(a) / np.float64(b))
+    return a / b
+
+
+def _sum(values: List[float]) -> float:
+    s = values[0]
+    for v in values[1:]:
+        s += v
+    return s
+
+
+def _mean(values: List[float]) -> float:
+    return _sum(values) / len(values)
+
+
+def _std(values: List[float]) -> float:
+    mean = _mean(values)
+    d = values[0] - mean
+    s = d * d
+    for v in values[1:]:
+        d = v - mean
+        s += d * d
+    return math.sqrt(s / (len(values) - 1))
+
+
+class FeatureStream:
+    """
+    Incremental engine: update() takes the next candle and returns its
+    features. State is the last WARMUP_ROWS closes, 30 volumes and 60
+    one-step returns, so an update costs the same however long the stream
+    has run, and its result does not depend on where the stream started.
+    """
+
+    def __init__(self):
+        self._close = deque(maxlen=WARMUP_ROWS)
+        self._volume = deque(maxlen=30)
+        self._ret_1 = deque(maxlen=60)
+        self.latest: Optional[Dict[str, float]] = None
+        self.bucket = None
+        self.close = math.nan
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FeatureStream":
+        """Warm up from the tail of a bucket-ordered OHLCV frame."""
+        stream = cls()
+        stream.feed(df.tail(WARMUP_ROWS))
+        return stream
+
+    def feed(self, df: pd.DataFrame) -> None:
+        """update() with every row of a bucket-ordered OHLCV frame, skipping rows add_features() drops."""
+        close = pd.to_numeric(df["close"], errors="coerce").tolist()
+        volume = pd.to_numeric(df["volume"], errors="coerce").tolist()
+        for bucket, c, v in zip(df["bucket"], close, volume):
+            if math.isnan(c):
+                continue
+            self.update(c, v)
+            self.bucket, self.close = bucket, c
+
+    @staticmethod
+    def _last(values: deque, window: int, stat) -> float:
+        if len(values) < window:
+            return math.nan
+        return stat(list(values)[-window:])
+
+    def _ret(self, periods: int) -> float:
+        if len(self._close) <= periods:
+            return math.nan
+        return _div(self._close[-1], self._close[-1 - periods]) - 1
+
+    def update(self, close: float, volume: float) -> Dict[str, float]:
+        volume = float(volume)
+        self._close.append(float(close))
+        self._volume.append(volume)
+
+        ret_1 = self._ret(1)
+        self._ret_1.append(ret_1)
+        ma_10 = self._last(self._close, 10, _mean)
+        ma_30 = self._last(self._close, 30, _mean)
+        vol_ma_30 = self._last(self._volume, 30, _mean)
+        self.latest = {
+            "ret_1": ret_1,
+            "ret_5": self._ret(5),
+            "ret_15": self._ret(15),
+            "ma_10": ma_10,
+            "ma_30": ma_30,
+            "ma_ratio_10_30": _div(ma_10, ma_30) - 1,
+            "vol_30": self._last(self._ret_1, 30, _std),
+            "vol_60": self._last(self._ret_1, 60, _std),
+            "vol_ma_30": vol_ma_30,
+            "vol_ratio": _div(volume, vol_ma_30) - 1,
+        }
+        return self.latest
+
+    def row(self, cols: List[str]) -> np.ndarray:
+        """Latest features as a (1, len(cols)) float array."""
+        return np.array([[self.latest[c] for c in cols]], dtype=np.float64)
@@ -0,0 +1,99 @@
+"""
+Saved forecast models (ml/models/*.joblib): the file-name scheme, an LRU of
+loaded payloads, and the stacked evaluation of scaler + logistic regression
+pipelines that predict_server.py and backtest.py share.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import joblib
+import numpy as np
+from scipy.special import expit
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+MODELS_DIR = Path(__file__).resolve().parent / "models"
+MODEL_CACHE_SIZE = int(os.getenv("PREDICT_MODEL_CACHE", "128"))
+
+# <SYMBOL>_h<H>_A.joblib | <SYMBOL>_h<H>_D_thr<0p0035>.joblib (see predict.model_path_for)
+MODEL_NAME = re.compile(r"^(?P<symbol>[A-Za-z0-9]+)_h(?P<horizon>\d+)_(?P<mode>[AD])(?:_thr(?P<thr>[0-9p]+))?\.joblib$")
+
+
+class ModelCache:
+    """LRU of loaded model payloads keyed by path; a changed mtime forces a reload."""
+
+    def __init__(self, models_dir: Path = MODELS_DIR, max_models: int = MODEL_CACHE_SIZE):
+        self.models_dir = models_dir
+        self.max_models = max_models
+        self._models: "OrderedDict[Path, Tuple[int, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def manifest(self) -> List[Dict[str, Any]]:
+        out = []
+        for path in sorted(self.models_dir.glob("*.joblib")):
+            m = MODEL_NAME.match(path.name)
+            if m is None:
+                continue
+            out.append(
+                {
+                    "file": path.name,
+                    "symbol": m["symbol"],
+                    "horizon_minutes": int(m["horizon"]),
+                    "mode": m["mode"],
+                    "thr": float(m["thr"].replace("p", ".")) if m["thr"] else None,
+                    "mtime": path.stat().st_mtime,
+                    "loaded": path in self._models,
+                }
+            )
+        return out
+
+    def get(self, path: Path) -> dict:
+        mtime = path.stat().st_mtime_ns
+        with self._lock:
+            hit = self._models.get(path)
+            if hit is not None and hit[0] == mtime:
+                self._models.move_to_end(path)
+                return hit[1]
+            payload = joblib.load(path)
+            self.loads += 1
+            self._models[path] = (mtime, payload)
+            self._models.move_to_end(path)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return payload
+
+
+def stackable(model) -> bool:
+    """A StandardScaler + binary LogisticRegression pipeline, which stack_models can batch."""
+    return (
+        isinstance(model, Pipeline)
+        and len(model.steps) == 2
+        and isinstance(model.steps[0][1], StandardScaler)
+        and isinstance(model.steps[1][1], LogisticRegression)
+        and model.steps[1][1].coef_.shape[0] == 1
+    )
+
+
+def stack_models(models: List[Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Per-model scaler mean / scale and LR coef / intercept as (M, F) / (M,) arrays."""
+    scalers = [m.steps[0][1] for m in models]
+    clfs = [m.steps[1][1] for m in models]
+    return (
+        np.vstack([s.mean_ for s in scalers]),
+        np.vstack([s.scale_ for s in scalers]),
+        np.vstack([c.coef_[0] for c in clfs]),
+        np.array([c.intercept_[0] for c in clfs]),
+    )
+
+
+def stacked_proba(stack, x: np.ndarray) -> np.ndarray:
+    """P(y=1) of every stacked model for one feature row, in one pass."""
+    mean, scale, coef, intercept = stack
+    z = (x[None, :] - mean) / scale
+    return expit(np.einsum("mf,mf->m", z, coef) + intercept)
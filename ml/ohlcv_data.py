@@ -0,0 +1,181 @@
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Layout written by ml/export_ohlcv.py:
+#
+#   ml/data/<SYMBOL>_ohlcv_1m/date=YYYY-MM-DD/part-<first>-<last>.parquet
+#
+# one hive partition per UTC day, one file per export run (until the day is
+# compacted). Files starting with "_" or "." are in-progress writes and are
+# ignored by readers. The older single-file export
+# ml/data/<SYMBOL>_ohlcv_1m.parquet is still read when no dataset exists.
+#
+# Files are written sorted by bucket in row groups of ~ROW_GROUP_ROWS with
+# min/max statistics, so load_tail() only opens the trailing row groups of
+# the newest files instead of the whole history.
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+COLUMNS = ["bucket", "open", "high", "low", "close", "volume"]
+# all add_features() needs
+TAIL_COLUMNS = ["bucket", "close", "volume"]
+ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "240"))  # 4h of 1m candles
+
+
+def dataset_dir(symbol: str) -> Path:
+    return DATA_DIR / f"{symbol}_ohlcv_1m"
+
+
+def legacy_path(symbol: str) -> Path:
+    return DATA_DIR / f"{symbol}_ohlcv_1m.parquet"
+
+
+def has_data(symbol: str) -> bool:
+    return bool(partitions(symbol)) or legacy_path(symbol).exists()
+
+
+def partitions(symbol: str) -> List[str]:
+    """Dates (YYYY-MM-DD) that have a partition, oldest first."""
+    d = dataset_dir(symbol)
+    if not d.is_dir():
+        return []
+    return sorted(
+        p.name[len("date="):]
+        for p in d.iterdir()
+        if p.is_dir() and p.name.startswith("date=") and any(partition_files(p))
+    )
+
+
+def partition_files(part_dir: Path) -> List[Path]:
+    return sorted(f for f in part_dir.glob("*.parquet") if not f.name.startswith(("_", ".")))
+
+
+def data_files(symbol: str) -> List[Path]:
+    """Every readable file of the symbol, oldest first (the legacy file if there is no dataset)."""
+    files = [f for day in partitions(symbol) for f in partition_files(dataset_dir(symbol) / f"date={day}")]
+    if not files and legacy_path(symbol).exists():
+        files = [legacy_path(symbol)]
+    return files
+
+
+def exported_at(symbol: str) -> Optional[datetime]:
+    """When the symbol's newest file was written (mtime), or None without data."""
+    mtimes = [f.stat().st_mtime for f in data_files(symbol)]
+    return datetime.fromtimestamp(max(mtimes), tz=timezone.utc) if mtimes else None
+
+
+def data_version(symbol: str) -> tuple:
+    """Changes whenever an export, compaction or drop touches the symbol's files."""
+    files = data_files(symbol)
+    return tuple((f.name, f.stat().st_mtime_ns, f.stat().st_size) for f in files)
+
+
+def _bucket_ranges(pf: pq.ParquetFile) -> Optional[List[tuple]]:
+    """(min, max) bucket of each row group, or None without statistics."""
+    idx = pf.schema_arrow.get_field_index("bucket")
+    if idx < 0:
+        return None
+    ranges = []
+    for i in range(pf.metadata.num_row_groups):
+        stats = pf.metadata.row_group(i).column(idx).statistics
+        if stats is None or not stats.has_min_max:
+            return None
+        ranges.append((stats.min, stats.max))
+    return ranges
+
+
+def read_tail(path: Path, rows: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    At least the last `rows` rows of one file (all of it if shorter). When
+    the bucket statistics show the row groups in order, only the trailing
+    groups are read; otherwise the whole file is.
+    """
+    pf = pq.ParquetFile(path)
+    ranges = _bucket_ranges(pf)
+    if ranges is None or any(a[1] > b[0] for a, b in zip(ranges, ranges[1:])):
+        return pf.read(columns=columns).to_pandas()
+
+    groups, have = [], 0
+    for i in reversed(range(pf.metadata.num_row_groups)):
+        groups.append(i)
+        have += pf.metadata.row_group(i).num_rows
+        if have >= rows:
+            break
+    return pf.read_row_groups(groups[::-1], columns=columns).to_pandas()
+
+
+def _clean(df: pd.DataFrame) -> pd.DataFrame:
+    df["bucket"] = pd.to_datetime(df["bucket"], utc=True, errors="coerce")
+    df = df.dropna(subset=["bucket"])
+    # a bucket exported twice (before compaction) keeps its newest copy
+    df = df.drop_duplicates(subset=["bucket"], keep="last")
+    return df.sort_values("bucket").reset_index(drop=True)
+
+
+def _read_dates(symbol: str, dates: List[str], columns: List[str]) -> pd.DataFrame:
+    files = [f for day in dates for f in partition_files(dataset_dir(symbol) / f"date={day}")]
+    if not files:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([pd.read_parquet(f, columns=columns) for f in files], ignore_index=True)
+
+
+def load_ohlcv(symbol: str, since: Optional[datetime] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    1m OHLCV for `symbol`, bucket ascending and unique. With `since`, only
+    partitions from that UTC day on are opened.
+    """
+    columns = columns or COLUMNS
+    dates = partitions(symbol)
+    if dates:
+        if since is not None:
+            first = since.astimezone(timezone.utc).strftime("%Y-%m-%d")
+            dates = [d for d in dates if d >= first]
+        df = _read_dates(symbol, dates, columns)
+    elif legacy_path(symbol).exists():
+        df = pd.read_parquet(legacy_path(symbol), columns=columns)
+    else:
+        raise FileNotFoundError(f"No OHLCV data for {symbol} under {DATA_DIR}. Run export_ohlcv first.")
+
+    df = _clean(df)
+    if since is not None:
+        df = df[df["bucket"] >= pd.Timestamp(since)].reset_index(drop=True)
+    return df
+
+
+def _files_newest_first(symbol: str) -> Iterator[Path]:
+    # lazy, so a tail read lists only the newest partitions it needs
+    d = dataset_dir(symbol)
+    days = sorted((p for p in d.iterdir() if p.is_dir() and p.name.startswith("date=")), reverse=True) if d.is_dir() else []
+    found = False
+    for day in days:
+        for f in reversed(partition_files(day)):
+            found = True
+            yield f
+    if not found and legacy_path(symbol).exists():
+        yield legacy_path(symbol)
+
+
+def load_tail(symbol: str, rows: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Last `rows` rows, reading the trailing row groups of the newest files until there are enough."""
+    columns = columns or COLUMNS
+    frames, have, df = [], 0, None
+    for f in _files_newest_first(symbol):
+        frames.append(read_tail(f, rows - have, columns))
+        have += len(frames[-1])
+        if have < rows:
+            continue
+        # a bucket exported twice shrinks the count, so re-check after cleaning
+        df = _clean(pd.concat(frames[::-1], ignore_index=True))
+        have = len(df)
+        if have >= rows:
+            break
+
+    if df is None or have < rows:
+        if not frames:
+            raise FileNotFoundError(f"No OHLCV data for {symbol} under {DATA_DIR}. Run export_ohlcv first.")
+        df = _clean(pd.concat(frames[::-1], ignore_index=True))
+    return df.tail(rows).reset_index(drop=True)
@@ -1,73 +1,36 @@
 import json
 import argparse
+import sys
 from pathlib import Path
 import pandas as pd
 import numpy as np
 import joblib
+from typing import Optional
 
+from features import add_features
+from ohlcv_data import TAIL_COLUMNS, dataset_dir, exported_at, has_data, load_tail
 
-parser = argparse.ArgumentParser()
-parser.add_argument("symbol", type=str)
-parser.add_argument("horizon_minutes", type=int)
-parser.add_argument(
-    "--mode",
-    type=str,
-    default="D",
-    choices=["A", "D"],
-    help="A=direction (UP/DOWN), D=strong UP move signal",
-)
-parser.add_argument(
-    "--thr",
-    type=float,
-    default=0.0035,
-    help="Threshold for mode D as decimal return. Example: 0.0035 = 0.35%%",
-)
-parser.add_argument(
-    "--asof_rows",
-    type=int,
-    default=250,
-    help="How many latest rows to load to compute features safely",
-)
-args = parser.parse_args()
-
-symbol = args.symbol
-H = args.horizon_minutes
-mode = args.mode
-thr = args.thr
-asof_rows = args.asof_rows
-
-
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.sort_values("bucket").copy()
-    df["close"] = pd.to_numeric(df["close"], errors="coerce")
-    df["volume"] = pd.to_numeric(df["volume"], errors="coerce")
-    df = df.dropna(subset=["close"])
-
-    df["ret_1"] = df["close"].pct_change()
-    df["ret_5"] = df["close"].pct_change(5)
-    df["ret_15"] = df["close"].pct_change(15)
-
-    df["ma_10"] = df["close"].rolling(10).mean()
-    df["ma_30"] = df["close"].rolling(30).mean()
-    df["ma_ratio_10_30"] = df["ma_10"] / df["ma_30"] - 1
-
-    df["vol_30"] = df["ret_1"].rolling(30).std()
-    df["vol_60"] = df["ret_1"].rolling(60).std()
-
-    df["vol_ma_30"] = df["volume"].rolling(30).mean()
-    df["vol_ratio"] = df["volume"] / df["vol_ma_30"] - 1
-
-    return df
-
-
-def load_latest_feature_row(data_path: Path, feature_cols: list[str], asof_rows: int):
-    df = pd.read_parquet(data_path)
-    df["bucket"] = pd.to_datetime(df["bucket"], utc=True, errors="coerce")
-    df = df.dropna(subset=["bucket"]).sort_values("bucket")
-
-    df_tail = df.tail(asof_rows).copy()
-    df_tail = add_features(df_tail)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import freshness, metrics
 
+# Also fed by predict_server.py; engine is "batch" (add_features over the
+# tail) or "stream" (the server's FeatureStream).
+LOAD_SECONDS = metrics.histogram("predict_load_seconds", "Time to read the candle tail")
+FEATURE_SECONDS = metrics.histogram("predict_feature_seconds", "Time to compute the latest feature row", ["engine"])
+INFERENCE_SECONDS = metrics.histogram("predict_inference_seconds", "Time in predict_proba", ["kind"])
+PREDICTIONS = metrics.counter("predictions_total", "Prediction responses by outcome", ["status"])
+
+
+def load_latest_feature_row(symbol: str, feature_cols: list[str], asof_rows: int):
+    # only the last row groups of the newest file(s), and only these columns
+    with LOAD_SECONDS.time():
+        tail = load_tail(symbol, asof_rows, TAIL_COLUMNS)
+    with FEATURE_SECONDS.labels(engine="batch").time():
+        return latest_feature_row(add_features(tail), feature_cols)
+
+
+def latest_feature_row(df_tail: pd.DataFrame, feature_cols: list[str]):
+    """(asof_bucket, asof_close, X) from the last complete row of a featured tail."""
     df_tail = df_tail.dropna(subset=feature_cols)
     if df_tail.empty:
         raise RuntimeError("Not enough recent data to compute features. Increase --asof_rows.")
@@ -79,103 +42,168 @@ def load_latest_feature_row(data_path: Path, feature_cols: list[str], asof_rows:
     return asof_bucket, asof_close, X
 
 
-def main():
-    root = Path(__file__).resolve().parents[1]
-    data_path = root / "ml" / "data" / f"{symbol}_ohlcv_1m.parquet"
-    if not data_path.exists():
-        out = {
-            "ok": False,
-            "error": "Missing data file for this symbol",
-            "symbol": symbol,
-            "expected_data_path": str(data_path),
-            "hint": f"Run: python ml/export_ohlcv.py {symbol} 14",
-        }
-        print(json.dumps(out))
-        return
-
-    models_dir = root / "ml" / "models"
-
+def model_path_for(models_dir: Path, symbol: str, H: int, mode: str, thr: float) -> Path:
     # ✅ IMPORTANT CHANGE:
     # Mode A models should NOT use thr in the filename.
     if mode == "A":
-        model_path = models_dir / f"{symbol}_h{H}_A.joblib"
-    else:
-        thr_tag = str(thr).replace(".", "p")
-        model_path = models_dir / f"{symbol}_h{H}_D_thr{thr_tag}.joblib"
-
-    if not model_path.exists():
-        out = {
-            "ok": False,
-            "error": "Model not trained for this selection",
-            "symbol": symbol,
-            "horizon_minutes": H,
-            "mode": mode,
-            "thr": thr if mode == "D" else None,
-            "expected_model_path": str(model_path),
-            "train_command": (
-                f"python ml/train_forecast.py {symbol} {H} --mode {mode}"
-                + (f" --thr {thr}" if mode == "D" else "")
-            ),
-        }
-        print(json.dumps(out))
-        return
-
-    payload = joblib.load(model_path)
-    model = payload["model"]
-    feature_cols = payload["feature_cols"]
-    metrics = payload.get("metrics", {})
-
-    asof_bucket, asof_close, X = load_latest_feature_row(data_path, feature_cols, asof_rows)
-
-    prob = float(model.predict_proba(X)[:, 1][0])
-
+        return models_dir / f"{symbol}_h{H}_A.joblib"
+    thr_tag = str(thr).replace(".", "p")
+    return models_dir / f"{symbol}_h{H}_D_thr{thr_tag}.joblib"
+
+
+def missing_data_response(symbol: str) -> dict:
+    return {
+        "ok": False,
+        "error": "Missing data file for this symbol",
+        "symbol": symbol,
+        "expected_data_path": str(dataset_dir(symbol)),
+        "hint": f"Run: python ml/export_ohlcv.py {symbol} 14",
+    }
+
+
+def missing_model_response(symbol: str, H: int, mode: str, thr: float, model_path: Path) -> dict:
+    return {
+        "ok": False,
+        "error": "Model not trained for this selection",
+        "symbol": symbol,
+        "horizon_minutes": H,
+        "mode": mode,
+        "thr": thr if mode == "D" else None,
+        "expected_model_path": str(model_path),
+        "train_command": (
+            f"python ml/train_forecast.py {symbol} {H} --mode {mode}"
+            + (f" --thr {thr}" if mode == "D" else "")
+        ),
+    }
+
+
+def confidence(prob: float) -> str:
     # confidence bands for dashboard
     if prob >= 0.70 or prob <= 0.30:
-        conf = "HIGH"
-    elif prob >= 0.60 or prob <= 0.40:
-        conf = "MED"
-    else:
-        conf = "LOW"
+        return "HIGH"
+    if prob >= 0.60 or prob <= 0.40:
+        return "MED"
+    return "LOW"
+
+
+def freshness_report(symbol: str, asof_bucket) -> dict:
+    """Lag of the candle a prediction is made from: bucket close -> parquet export -> now (seconds)."""
+    closed = freshness.bucket_close(pd.Timestamp(asof_bucket).to_pydatetime())
+    exported = exported_at(symbol)
+    age = freshness.lag_seconds(freshness.now(), closed)
+    freshness.observe("predict", age)
+    return {
+        "bucket_closed_at": closed.isoformat(),
+        "exported_at": exported.isoformat() if exported is not None else None,
+        "export_lag_s": freshness.lag_seconds(exported, closed),
+        "asof_age_s": age,
+    }
+
+
+def prediction_response(
+    payload: dict, symbol: str, H: int, mode: str, thr: float, asof_bucket, asof_close: float, prob: float, fresh: Optional[dict] = None
+) -> dict:
+    """fresh: freshness_report() of asof_bucket, when the caller already has it (batches)."""
+    model_metrics = payload.get("metrics", {})
+    conf = confidence(prob)
+    if fresh is None:
+        fresh = freshness_report(symbol, asof_bucket)
 
     if mode == "A":
-        out = {
+        return {
             "ok": True,
             "symbol": symbol,
             "horizon_minutes": H,
             "mode": "A",
             "asof_bucket": asof_bucket.isoformat(),
             "asof_close": asof_close,
+            "freshness": fresh,
             "prob_up": prob,
             "direction": "UP" if prob >= 0.5 else "DOWN",
             "confidence": conf,
             "model_metrics": {
-                "auc_mean": metrics.get("auc_mean"),
-                "prauc_mean": metrics.get("prauc_mean"),
-                "prauc_baseline": metrics.get("prauc_baseline"),
-            },
-        }
-    else:
-        out = {
-            "ok": True,
-            "symbol": symbol,
-            "horizon_minutes": H,
-            "mode": "D",
-            "thr": thr,
-            "asof_bucket": asof_bucket.isoformat(),
-            "asof_close": asof_close,
-            "prob_strong_up": prob,
-            "signal": "STRONG_UP" if prob >= 0.5 else "NO_SIGNAL",
-            "confidence": conf,
-            "model_metrics": {
-                "auc_mean": metrics.get("auc_mean"),
-                "prauc_mean": metrics.get("prauc_mean"),
-                "prauc_baseline": metrics.get("prauc_baseline"),
-                "positive_rate": payload.get("positive_rate"),
+                "auc_mean": model_metrics.get("auc_mean"),
+                "prauc_mean": model_metrics.get("prauc_mean"),
+                "prauc_baseline": model_metrics.get("prauc_baseline"),
             },
         }
+    return {
+        "ok": True,
+        "symbol": symbol,
+        "horizon_minutes": H,
+        "mode": "D",
+        "thr": thr,
+        "asof_bucket": asof_bucket.isoformat(),
+        "asof_close": asof_close,
+        "freshness": fresh,
+        "prob_strong_up": prob,
+        "signal": "STRONG_UP" if prob >= 0.5 else "NO_SIGNAL",
+        "confidence": conf,
+        "model_metrics": {
+            "auc_mean": model_metrics.get("auc_mean"),
+            "prauc_mean": model_metrics.get("prauc_mean"),
+            "prauc_baseline": model_metrics.get("prauc_baseline"),
+            "positive_rate": payload.get("positive_rate"),
+        },
+    }
+
+
+def predict(symbol: str, H: int, mode: str = "D", thr: float = 0.0035, asof_rows: int = 250) -> dict:
+    root = Path(__file__).resolve().parents[1]
+    if not has_data(symbol):
+        PREDICTIONS.labels(status="missing_data").inc()
+        return missing_data_response(symbol)
+
+    model_path = model_path_for(root / "ml" / "models", symbol, H, mode, thr)
+    if not model_path.exists():
+        PREDICTIONS.labels(status="missing_model").inc()
+        return missing_model_response(symbol, H, mode, thr, model_path)
+
+    payload = joblib.load(model_path)
+    model = payload["model"]
+    feature_cols = payload["feature_cols"]
+
+    asof_bucket, asof_close, X = load_latest_feature_row(symbol, feature_cols, asof_rows)
+
+    with INFERENCE_SECONDS.labels(kind="single").time():
+        prob = float(model.predict_proba(X)[:, 1][0])
+    PREDICTIONS.labels(status="ok").inc()
+    return prediction_response(payload, symbol, H, mode, thr, asof_bucket, asof_close, prob)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbol", type=str)
+    parser.add_argument("horizon_minutes", type=int)
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="D",
+        choices=["A", "D"],
+        help="A=direction (UP/DOWN), D=strong UP move signal",
+    )
+    parser.add_argument(
+        "--thr",
+        type=float,
+        default=0.0035,
+        help="Threshold for mode D as decimal return. Example: 0.0035 = 0.35%%",
+    )
+    parser.add_argument(
+        "--asof_rows",
+        type=int,
+        default=250,
+        help="How many latest rows to load to compute features safely",
+    )
+    parser.add_argument("--metrics", action="store_true", help="print load / feature / inference timings (Prometheus text) to stderr")
+    return parser.parse_args(argv)
 
-    print(json.dumps(out))
+
+def main():
+    args = parse_args()
+    print(json.dumps(predict(args.symbol, args.horizon_minutes, args.mode, args.thr, args.asof_rows)))
+    if args.metrics:
+        sys.stderr.write(metrics.render())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
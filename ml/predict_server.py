@@ -0,0 +1,349 @@
+"""
+Long-running prediction service. Models and each symbol's recent candles
+stay in memory, so a prediction is a cache lookup plus one predict_proba.
+
+  python ml/predict_server.py            HTTP on PREDICT_HOST:PREDICT_PORT
+  python ml/predict_server.py --stdio    JSON lines on stdin / stdout
+  python ml/predict_server.py --batch [SYMBOL[:H[:MODE[:THR]]] ...]
+                                         one batch document, then exit
+
+HTTP:
+  GET /predict?symbol=BTCUSD&horizon=60&mode=D&thr=0.0035[&asof_rows=250]
+  GET /predict/batch?select=BTCUSD:60:D:*&select=ETHUSD   (default: every model)
+  GET /models     manifest of ml/models/*.joblib
+  GET /metrics    Prometheus text: request, feature and inference timings
+  GET /health
+
+stdio: one request per line, e.g.
+  {"symbol": "BTCUSD", "horizon_minutes": 60, "mode": "D", "thr": 0.0035}
+and one response per line. {"select": ["*"]} runs a batch.
+
+Responses are exactly what `python ml/predict.py ...` prints for the same
+selection (bar freshness.asof_age_s, measured when the response is made). Models are reloaded when their file's mtime changes; candles
+when an export touches the symbol's dataset.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from features import WARMUP_ROWS, FeatureStream
+from model_store import MODELS_DIR, ModelCache, stack_models, stackable, stacked_proba
+from ohlcv_data import TAIL_COLUMNS, data_version, has_data, load_ohlcv, load_tail
+from predict import (
+    FEATURE_SECONDS,
+    INFERENCE_SECONDS,
+    PREDICTIONS,
+    freshness_report,
+    load_latest_feature_row,
+    missing_data_response,
+    missing_model_response,
+    model_path_for,
+    prediction_response,
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import metrics
+
+REQUEST_SECONDS = metrics.histogram("predict_request_seconds", "HTTP request latency", ["path", "status"])
+
+PREDICT_HOST = os.getenv("PREDICT_HOST", "127.0.0.1")
+PREDICT_PORT = int(os.getenv("PREDICT_PORT", "8001"))
+
+
+class CandleCache:
+    """
+    One FeatureStream per symbol, kept current with the exported candles:
+    when data_version() changes only candles newer than the stream's last
+    bucket are read and fed in. Features depend on the last WARMUP_ROWS
+    candles only, so the newest row is the one predict.py computes for any
+    asof_rows >= WARMUP_ROWS. Shorter tails, and a newest row with missing
+    features, go through predict.py's path instead.
+    """
+
+    def __init__(self):
+        self._streams: Dict[str, Tuple[tuple, FeatureStream]] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _stream(self, symbol: str) -> FeatureStream:
+        version = data_version(symbol)
+        entry = self._streams.get(symbol)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        stream = entry[1] if entry is not None else None
+        new = None
+        if stream is not None and stream.bucket is not None:
+            new = load_ohlcv(symbol, since=stream.bucket.to_pydatetime(), columns=TAIL_COLUMNS)
+            if new.empty or new["bucket"].iloc[-1] < stream.bucket:
+                new = None  # dataset was rebuilt under us
+            else:
+                new = new[new["bucket"] > stream.bucket]
+        if new is None:
+            stream = FeatureStream.from_frame(load_tail(symbol, WARMUP_ROWS, TAIL_COLUMNS))
+        else:
+            stream.feed(new)
+        self._streams[symbol] = (version, stream)
+        self.loads += 1
+        return stream
+
+    def latest_row(self, symbol: str, asof_rows: int, feature_cols: List[str]):
+        if asof_rows >= WARMUP_ROWS:
+            with self._lock, FEATURE_SECONDS.labels(engine="stream").time():
+                stream = self._stream(symbol)
+                if stream.latest is not None:
+                    X = stream.row(feature_cols)
+                    if not np.isnan(X).any():
+                        return stream.bucket, stream.close, X
+        return load_latest_feature_row(symbol, feature_cols, asof_rows)
+
+
+# (symbol, horizon, mode, thr); any field may be "*"
+Selection = Tuple[str, Any, Any, Any]
+
+
+def parse_selection(text: str) -> Selection:
+    """"SYMBOL[:H[:MODE[:THR]]]" with "*" wildcards; missing fields are "*"."""
+    parts = (text.split(":") + ["*"] * 4)[:4]
+    symbol, h, mode, thr = (p.strip() or "*" for p in parts)
+    return (
+        symbol,
+        h if h == "*" else int(h),
+        mode if mode == "*" else mode.upper(),
+        thr if thr == "*" else float(thr),
+    )
+
+
+class PredictionService:
+    def __init__(self, models_dir: Path = MODELS_DIR):
+        self.models = ModelCache(models_dir)
+        self.candles = CandleCache()
+        self._stacks: Dict[tuple, tuple] = {}
+
+    def predict(self, symbol: str, H: int, mode: str = "D", thr: float = 0.0035, asof_rows: int = 250) -> dict:
+        if not has_data(symbol):
+            PREDICTIONS.labels(status="missing_data").inc()
+            return missing_data_response(symbol)
+
+        model_path = model_path_for(self.models.models_dir, symbol, H, mode, thr)
+        if not model_path.exists():
+            PREDICTIONS.labels(status="missing_model").inc()
+            return missing_model_response(symbol, H, mode, thr, model_path)
+
+        payload = self.models.get(model_path)
+        asof_bucket, asof_close, X = self.candles.latest_row(symbol, asof_rows, payload["feature_cols"])
+        with INFERENCE_SECONDS.labels(kind="single").time():
+            prob = float(payload["model"].predict_proba(X)[:, 1][0])
+        PREDICTIONS.labels(status="ok").inc()
+        return prediction_response(payload, symbol, H, mode, thr, asof_bucket, asof_close, prob)
+
+    def resolve(self, selections: List[Selection]) -> List[Tuple[str, int, str, float]]:
+        """Expand wildcards against the manifest; exact selections pass through as-is."""
+        manifest = self.models.manifest()
+        out: List[Tuple[str, int, str, float]] = []
+        for symbol, h, mode, thr in selections:
+            if "*" not in (symbol, h, mode, thr):
+                out.append((symbol, h, mode, thr))
+                continue
+            for m in manifest:
+                sel = (m["symbol"], m["horizon_minutes"], m["mode"], m["thr"] if m["thr"] is not None else 0.0035)
+                # files predict.py would never open (e.g. *_A_thr*.joblib) are skipped
+                if model_path_for(self.models.models_dir, *sel).name != m["file"]:
+                    continue
+                # mode A models have no threshold, so any thr matches them
+                if all(want == "*" or want == got for want, got in zip((symbol, h, mode), sel)) and (
+                    thr == "*" or sel[2] == "A" or thr == sel[3]
+                ):
+                    out.append(sel)
+        return list(dict.fromkeys(out))
+
+    def _stack(self, paths: List[Path], payloads: List[dict]):
+        key = tuple((p, p.stat().st_mtime_ns) for p in paths)
+        stack = self._stacks.get(key)
+        if stack is None:
+            if len(self._stacks) >= 64:
+                self._stacks.clear()
+            stack = self._stacks[key] = stack_models([pl["model"] for pl in payloads])
+        return stack
+
+    def predict_batch(self, selections: List[Selection], asof_rows: int = 250) -> dict:
+        """
+        Every selection in one document. Features are computed once per
+        symbol and all of a symbol's scaler+LR models are evaluated as one
+        stacked matrix product instead of model by model.
+        """
+        resolved = self.resolve(selections)
+        results: Dict[tuple, dict] = {}
+
+        by_symbol: Dict[str, List[tuple]] = {}
+        for sel in resolved:
+            by_symbol.setdefault(sel[0], []).append(sel)
+
+        for symbol, sels in by_symbol.items():
+            if not has_data(symbol):
+                for sel in sels:
+                    results[sel] = missing_data_response(symbol)
+                continue
+
+            groups: Dict[tuple, List[Tuple[tuple, Path, dict]]] = {}
+            for sel in sels:
+                path = model_path_for(self.models.models_dir, *sel)
+                if not path.exists():
+                    results[sel] = missing_model_response(*sel, path)
+                    continue
+                payload = self.models.get(path)
+                can_stack = stackable(payload["model"])
+                groups.setdefault((tuple(payload["feature_cols"]), can_stack), []).append((sel, path, payload))
+
+            for (feature_cols, can_stack), items in groups.items():
+                try:
+                    asof_bucket, asof_close, X = self.candles.latest_row(symbol, asof_rows, list(feature_cols))
+                except Exception as e:
+                    for sel, _, _ in items:
+                        results[sel] = {"ok": False, "error": str(e), "symbol": symbol}
+                    continue
+                with INFERENCE_SECONDS.labels(kind="stacked" if can_stack else "batch").time():
+                    if can_stack:
+                        probs = stacked_proba(self._stack([p for _, p, _ in items], [pl for _, _, pl in items]), X[0])
+                    else:
+                        probs = [pl["model"].predict_proba(X)[:, 1][0] for _, _, pl in items]
+                PREDICTIONS.labels(status="ok").inc(len(items))
+                fresh = freshness_report(symbol, asof_bucket)
+                for (sel, _, payload), prob in zip(items, probs):
+                    results[sel] = prediction_response(payload, *sel, asof_bucket, asof_close, float(prob), fresh)
+
+        return {"ok": True, "count": len(resolved), "results": [results[sel] for sel in resolved]}
+
+
+def parse_request(req: Dict[str, Any]) -> Tuple[str, int, str, float, int]:
+    """(symbol, H, mode, thr, asof_rows) from a request; ValueError if malformed."""
+    try:
+        symbol = str(req["symbol"])
+        H = int(req.get("horizon_minutes", req.get("horizon")))
+        mode = str(req.get("mode", "D")).upper()
+        thr = float(req.get("thr", 0.0035))
+        asof_rows = int(req.get("asof_rows", 250))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"bad request: {e!r}")
+    if mode not in ("A", "D"):
+        raise ValueError("mode must be A or D")
+    return symbol, H, mode, thr, asof_rows
+
+
+def handle(service: PredictionService, req: Dict[str, Any]) -> Tuple[int, dict]:
+    try:
+        args = parse_request(req)
+    except ValueError as e:
+        return 400, {"ok": False, "error": str(e)}
+    try:
+        return 200, service.predict(*args)
+    except Exception as e:
+        return 500, {"ok": False, "error": str(e), "symbol": args[0]}
+
+
+def handle_batch(service: PredictionService, select: Any, asof_rows: Any = 250) -> Tuple[int, dict]:
+    if isinstance(select, str):
+        select = [select]
+    try:
+        selections = [parse_selection(s) for s in (select or ["*"])]
+        asof_rows = int(asof_rows)
+    except (AttributeError, TypeError, ValueError) as e:
+        return 400, {"ok": False, "error": f"bad selection: {e}"}
+    try:
+        return 200, service.predict_batch(selections, asof_rows)
+    except Exception as e:
+        return 500, {"ok": False, "error": str(e)}
+
+
+def serve_stdio(service: PredictionService) -> None:
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            out = {"ok": False, "error": f"bad json: {e}"}
+        else:
+            if not isinstance(req, dict):
+                out = {"ok": False, "error": "request must be a JSON object"}
+            elif "select" in req:
+                _, out = handle_batch(service, req["select"], req.get("asof_rows", 250))
+            else:
+                _, out = handle(service, req)
+        sys.stdout.write(json.dumps(out) + "\n")
+        sys.stdout.flush()
+
+
+ROUTES = ("/health", "/models", "/metrics", "/predict", "/predict/batch")
+
+
+def make_handler(service: PredictionService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Any, content_type: str = "application/json") -> None:
+            data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            path = self._path if self._path in ROUTES else "unmatched"
+            REQUEST_SECONDS.labels(path=path, status=str(status)).observe(time.perf_counter() - self._t0)
+
+        def do_GET(self):
+            self._t0 = time.perf_counter()
+            url = urlparse(self.path)
+            self._path = url.path
+            if url.path == "/health":
+                return self._send(200, {"status": "ok"})
+            if url.path == "/models":
+                return self._send(200, {"models": service.models.manifest()})
+            if url.path == "/metrics":
+                return self._send(200, metrics.render(), metrics.CONTENT_TYPE)
+            if url.path == "/predict/batch":
+                q = parse_qs(url.query)
+                return self._send(*handle_batch(service, q.get("select", []), q.get("asof_rows", [250])[-1]))
+            if url.path != "/predict":
+                return self._send(404, {"ok": False, "error": "not found"})
+
+            req = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            self._send(*handle(service, req))
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    service = PredictionService()
+    if "--batch" in argv:
+        select = [a for a in argv if not a.startswith("--")]
+        status, out = handle_batch(service, select)
+        print(json.dumps(out))
+        raise SystemExit(0 if status == 200 else 1)
+    if "--stdio" in argv:
+        serve_stdio(service)
+        return
+
+    server = ThreadingHTTPServer((PREDICT_HOST, PREDICT_PORT), make_handler(service))
+    print(f"🚀 Prediction server on http://{PREDICT_HOST}:{PREDICT_PORT} ({len(service.models.manifest())} models)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,57 +11,11 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 
+from features import FEATURE_COLS, add_features
+from ohlcv_data import load_ohlcv
 
-parser = argparse.ArgumentParser()
-parser.add_argument("symbol", type=str)
-parser.add_argument("horizon_minutes", type=int)
-parser.add_argument(
-    "--mode",
-    type=str,
-    default="A",
-    choices=["A", "D"],
-    help="A=direction (UP/DOWN), D=strong UP move signal",
-)
-parser.add_argument(
-    "--thr",
-    type=float,
-    default=0.0025,
-    help="Threshold for mode D as decimal return. 0.0025 = 0.25%%",
-)
-args = parser.parse_args()
-
-symbol = args.symbol
-H = args.horizon_minutes
-mode = args.mode
-thr = args.thr
-
-
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
-    """Simple, stable feature set (works best so far)."""
-    df = df.sort_values("bucket").copy()
-    df["close"] = pd.to_numeric(df["close"], errors="coerce")
-    df["volume"] = pd.to_numeric(df["volume"], errors="coerce")
-    df = df.dropna(subset=["close"])
-
-    # returns
-    df["ret_1"] = df["close"].pct_change()
-    df["ret_5"] = df["close"].pct_change(5)
-    df["ret_15"] = df["close"].pct_change(15)
-
-    # moving averages
-    df["ma_10"] = df["close"].rolling(10).mean()
-    df["ma_30"] = df["close"].rolling(30).mean()
-    df["ma_ratio_10_30"] = df["ma_10"] / df["ma_30"] - 1
-
-    # volatility
-    df["vol_30"] = df["ret_1"].rolling(30).std()
-    df["vol_60"] = df["ret_1"].rolling(60).std()
-
-    # volume features
-    df["vol_ma_30"] = df["volume"].rolling(30).mean()
-    df["vol_ratio"] = df["volume"] / df["vol_ma_30"] - 1
-
-    return df
+CV_SPLITS = 5
+DEFAULT_THR = 0.0025
 
 
 def make_target(df: pd.DataFrame, horizon: int, mode: str, thr: float) -> pd.DataFrame:
@@ -83,68 +37,37 @@ def make_target(df: pd.DataFrame, horizon: int, mode: str, thr: float) -> pd.Dat
     return df
 
 
-def train(symbol: str, horizon: int, mode: str, thr: float):
-    root = Path(__file__).resolve().parents[1]
-    data_path = root / "ml" / "data" / f"{symbol}_ohlcv_1m.parquet"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Missing {data_path}. Run export_ohlcv first.")
-
-    df = pd.read_parquet(data_path)
-    df["bucket"] = pd.to_datetime(df["bucket"], utc=True, errors="coerce")
-    df = df.dropna(subset=["bucket"])
-
-    df = add_features(df)
-    df = make_target(df, horizon=horizon, mode=mode, thr=thr)
-
-    feature_cols = [
-        "ret_1",
-        "ret_5",
-        "ret_15",
-        "ma_ratio_10_30",
-        "vol_30",
-        "vol_60",
-        "vol_ratio",
-    ]
-
-    df = df.dropna(subset=feature_cols + ["y"])
-    X = df[feature_cols].values
-    y = df["y"].values
-
-    print(f"[DEBUG] mode={mode} thr={thr} positive_rate={np.mean(y):.4f}")
-
+def new_model() -> Pipeline:
     # Winning baseline: LogisticRegression + scaling
-    model = Pipeline(
+    return Pipeline(
         [
             ("scaler", StandardScaler()),
             ("clf", LogisticRegression(max_iter=2000)),
         ]
     )
 
-    # Time-series CV
-    tscv = TimeSeriesSplit(n_splits=5)
-    aucs, accs, praucs = [], [], []
-    for train_idx, test_idx in tscv.split(X):
-        model.fit(X[train_idx], y[train_idx])
-        proba = model.predict_proba(X[test_idx])[:, 1]
-        pred = (proba >= 0.5).astype(int)
 
-        aucs.append(roc_auc_score(y[test_idx], proba))
-        accs.append(accuracy_score(y[test_idx], pred))
-        praucs.append(average_precision_score(y[test_idx], proba))
+def fold_scores(model, X: np.ndarray, y: np.ndarray, train_idx: np.ndarray, test_idx: np.ndarray):
+    """Fit on one TimeSeriesSplit fold; (auc, acc, prauc) on its test rows."""
+    model.fit(X[train_idx], y[train_idx])
+    proba = model.predict_proba(X[test_idx])[:, 1]
+    pred = (proba >= 0.5).astype(int)
+    return (
+        roc_auc_score(y[test_idx], proba),
+        accuracy_score(y[test_idx], pred),
+        average_precision_score(y[test_idx], proba),
+    )
 
-    # Fit final model
-    model.fit(X, y)
-
-    out_dir = root / "ml" / "models"
-    out_dir.mkdir(parents=True, exist_ok=True)
 
+def model_out_path(out_dir: Path, symbol: str, horizon: int, mode: str, thr: float) -> Path:
     if mode == "A":
-        out_path = out_dir / f"{symbol}_h{horizon}_A.joblib"
-    else:
-        thr_tag = str(thr).replace(".", "p")
-        out_path = out_dir / f"{symbol}_h{horizon}_D_thr{thr_tag}.joblib"
-   
-    payload = {
+        return out_dir / f"{symbol}_h{horizon}_A.joblib"
+    thr_tag = str(thr).replace(".", "p")
+    return out_dir / f"{symbol}_h{horizon}_D_thr{thr_tag}.joblib"
+
+
+def model_payload(symbol, horizon, mode, thr, feature_cols, model, aucs, accs, praucs, y, trained_until) -> dict:
+    return {
         "symbol": symbol,
         "horizon": horizon,
         "mode": mode,
@@ -157,21 +80,84 @@ def train(symbol: str, horizon: int, mode: str, thr: float):
             "prauc_mean": float(np.mean(praucs)),
             "prauc_baseline": float(np.mean(y)),
         },
-        "trained_rows": int(len(df)),
-        "trained_until": df["bucket"].max().isoformat(),
+        "trained_rows": int(len(y)),
+        "trained_until": trained_until.isoformat(),
         "positive_rate": float(np.mean(y)) if len(y) else None,
     }
 
-    joblib.dump(payload, out_path)
 
+def report(out_path: Path, mode: str, thr: float, aucs, accs, praucs, y) -> None:
     print(f"Saved model -> {out_path}")
     print(
         f"mode={mode} thr={thr}  "
         f"AUC(mean)={np.mean(aucs):.3f}  "
         f"PR-AUC(mean)={np.mean(praucs):.3f}  baseline={np.mean(y):.3f}  "
-        f"ACC(mean)={np.mean(accs):.3f}  rows={len(df)}"
+        f"ACC(mean)={np.mean(accs):.3f}  rows={len(y)}"
+    )
+
+
+def train(symbol: str, horizon: int, mode: str, thr: float):
+    root = Path(__file__).resolve().parents[1]
+    df = load_ohlcv(symbol)
+
+    df = add_features(df)
+    df = make_target(df, horizon=horizon, mode=mode, thr=thr)
+
+    feature_cols = list(FEATURE_COLS)
+
+    df = df.dropna(subset=feature_cols + ["y"])
+    X = df[feature_cols].values
+    y = df["y"].values
+
+    print(f"[DEBUG] mode={mode} thr={thr} positive_rate={np.mean(y):.4f}")
+
+    model = new_model()
+
+    # Time-series CV
+    tscv = TimeSeriesSplit(n_splits=CV_SPLITS)
+    aucs, accs, praucs = [], [], []
+    for train_idx, test_idx in tscv.split(X):
+        auc, acc, prauc = fold_scores(model, X, y, train_idx, test_idx)
+        aucs.append(auc)
+        accs.append(acc)
+        praucs.append(prauc)
+
+    # Fit final model
+    model.fit(X, y)
+
+    out_dir = root / "ml" / "models"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = model_out_path(out_dir, symbol, horizon, mode, thr)
+
+    payload = model_payload(symbol, horizon, mode, thr, feature_cols, model, aucs, accs, praucs, y, df["bucket"].max())
+    joblib.dump(payload, out_path)
+    report(out_path, mode, thr, aucs, accs, praucs, y)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbol", type=str)
+    parser.add_argument("horizon_minutes", type=int)
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="A",
+        choices=["A", "D"],
+        help="A=direction (UP/DOWN), D=strong UP move signal",
     )
+    parser.add_argument(
+        "--thr",
+        type=float,
+        default=DEFAULT_THR,
+        help="Threshold for mode D as decimal return. 0.0025 = 0.25%%",
+    )
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    train(args.symbol, horizon=args.horizon_minutes, mode=args.mode, thr=args.thr)
 
 
 if __name__ == "__main__":
-    train(symbol, horizon=H, mode=mode, thr=thr)
\ No newline at end of file
+    main()
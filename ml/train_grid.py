@@ -0,0 +1,217 @@
+"""
+Train the whole model sweep in one go:
+
+  python ml/train_grid.py BTCUSD,ETHUSD,SOLUSD [--horizons 15,30,60,120]
+                          [--thrs 0.0025,0.0035,0.004,0.005] [--no-direction] [--workers N]
+
+For every symbol, horizon and threshold this writes the same file and
+payload as `train_forecast.py SYMBOL H --mode D --thr THR`, plus one
+`--mode A` model per horizon. Unlike one train_forecast.py process per
+model, each symbol is read and featured once, every target comes out of a
+single vectorized pass, and the (model x fold) fits run on a process pool.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import joblib
+import numpy as np
+from sklearn.model_selection import TimeSeriesSplit
+
+from features import FEATURE_COLS, add_features
+from ohlcv_data import load_ohlcv
+from train_forecast import (
+    CV_SPLITS,
+    DEFAULT_THR,
+    fold_scores,
+    model_out_path,
+    model_payload,
+    new_model,
+    report,
+)
+
+MODELS_DIR = Path(__file__).resolve().parent / "models"
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_HORIZONS = [15, 30, 60, 120]
+DEFAULT_THRS = [0.0025, 0.0035, 0.004, 0.005]
+
+FINAL = -1  # fold index of the fit on all rows
+
+# (symbol, horizon, mode, thr)
+ModelKey = Tuple[str, int, str, float]
+
+
+def future_returns(close: np.ndarray, horizons: List[int]) -> np.ndarray:
+    """(rows, horizons) of close[t + h] / close[t] - 1; NaN where t + h is past the end."""
+    n = len(close)
+    ahead = np.arange(n)[:, None] + np.asarray(horizons)[None, :]
+    future_close = close[np.minimum(ahead, n - 1)]
+    future_close[ahead >= n] = np.nan
+    return future_close / close[:, None] - 1.0
+
+
+def make_targets(close: np.ndarray, horizons: List[int], thrs: List[float]):
+    """
+    Every target of make_target() at once: up (rows, horizons) for mode A,
+    strong (rows, horizons, thrs) for mode D, and has_future (rows, horizons).
+    """
+    with np.errstate(invalid="ignore"):
+        fut = future_returns(close, horizons)
+        up = fut > 0
+        strong = fut[:, :, None] >= np.asarray(thrs)[None, None, :]
+    return up, strong, ~np.isnan(fut)
+
+
+# ---------------- WORKERS ---------------- #
+
+# Per-process copy of the training sets, set once by the pool initializer so
+# tasks only carry (model, fold) and not the arrays.
+_SETS: Dict[ModelKey, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _init_worker(sets: Dict[ModelKey, Tuple[np.ndarray, np.ndarray]]) -> None:
+    global _SETS
+    _SETS = sets
+
+
+def _fit(key: ModelKey, fold: int):
+    X, y = _SETS[key]
+    model = new_model()
+    if fold == FINAL:
+        return key, fold, model.fit(X, y)
+    train_idx, test_idx = list(TimeSeriesSplit(n_splits=CV_SPLITS).split(X))[fold]
+    return key, fold, fold_scores(model, X, y, train_idx, test_idx)
+
+
+# ---------------- GRID ---------------- #
+
+class Stages:
+    """Wall-clock time per stage, printed as each one finishes."""
+
+    def __init__(self):
+        self.t0 = self.last = time.perf_counter()
+        self.times: Dict[str, float] = {}
+
+    def done(self, name: str) -> None:
+        now = time.perf_counter()
+        self.times[name] = self.times.get(name, 0.0) + now - self.last
+        print(f"⏱  {name} +{now - self.last:.2f}s ({now - self.t0:.2f}s)")
+        self.last = now
+
+    def summary(self) -> None:
+        parts = "  ".join(f"{k}={v:.2f}s" for k, v in self.times.items())
+        print(f"⏱  {parts}  wall={time.perf_counter() - self.t0:.2f}s")
+
+
+def build_sets(symbols: List[str], horizons: List[int], thrs: List[float], direction: bool, stages: Stages):
+    """Training set of every model, plus each model's trained_until."""
+    sets: Dict[ModelKey, Tuple[np.ndarray, np.ndarray]] = {}
+    until = {}
+    feature_cols = list(FEATURE_COLS)
+    for symbol in symbols:
+        df = load_ohlcv(symbol)
+        stages.done("load")
+
+        df = add_features(df)
+        X_all = df[feature_cols].to_numpy(dtype=np.float64)
+        has_features = ~np.isnan(X_all).any(axis=1)
+        stages.done("features")
+
+        up, strong, has_future = make_targets(df["close"].to_numpy(dtype=np.float64), horizons, thrs)
+        for j, h in enumerate(horizons):
+            rows = has_features & has_future[:, j]
+            X = np.asfortranarray(X_all[rows])  # same layout as train_forecast.py: identical fits
+            last = df["bucket"].iloc[np.flatnonzero(rows)[-1]] if rows.any() else None
+            targets = [((symbol, h, "D", thr), strong[:, j, k]) for k, thr in enumerate(thrs)]
+            if direction:
+                targets.insert(0, ((symbol, h, "A", DEFAULT_THR), up[:, j]))
+            for key, y in targets:
+                sets[key] = (X, y[rows].astype(int))
+                until[key] = last
+        stages.done("targets")
+    return sets, until
+
+
+def _collect(key: ModelKey, fold: int, result, scores, models) -> None:
+    if fold == FINAL:
+        models[key] = result
+    else:
+        scores[key][fold] = result
+
+
+def train_grid(
+    symbols: List[str],
+    horizons: List[int] = DEFAULT_HORIZONS,
+    thrs: List[float] = DEFAULT_THRS,
+    direction: bool = True,
+    workers: int = TRAIN_WORKERS,
+    out_dir: Path = MODELS_DIR,
+) -> List[Path]:
+    stages = Stages()
+    sets, until = build_sets(symbols, horizons, thrs, direction, stages)
+
+    # biggest fits first so the pool does not end on a long straggler
+    tasks = [(key, fold) for key in sets for fold in [FINAL, *reversed(range(CV_SPLITS))]]
+    print(f"Fitting {len(sets)} models x {CV_SPLITS + 1} fits on {workers} workers")
+
+    scores: Dict[ModelKey, Dict[int, tuple]] = {key: {} for key in sets}
+    models = {}
+    if workers <= 1:
+        _init_worker(sets)
+        results = (_fit(key, fold) for key, fold in tasks)
+        for key, fold, result in results:
+            _collect(key, fold, result, scores, models)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(sets,)) as pool:
+            futures = [pool.submit(_fit, key, fold) for key, fold in tasks]
+            for fut in futures:
+                _collect(*fut.result(), scores, models)
+    stages.done("fit")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    feature_cols = list(FEATURE_COLS)
+    for key, (X, y) in sets.items():
+        symbol, horizon, mode, thr = key
+        aucs, accs, praucs = zip(*(scores[key][fold] for fold in range(CV_SPLITS)))
+        out_path = model_out_path(out_dir, symbol, horizon, mode, thr)
+        payload = model_payload(symbol, horizon, mode, thr, feature_cols, models[key], aucs, accs, praucs, y, until[key])
+        joblib.dump(payload, out_path)
+        report(out_path, mode, thr, aucs, accs, praucs, y)
+        written.append(out_path)
+    stages.done("save")
+
+    stages.summary()
+    return written
+
+
+def _csv(cast):
+    return lambda text: [cast(v) for v in text.split(",") if v.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbols", type=_csv(str), help="comma-separated, e.g. BTCUSD,ETHUSD")
+    parser.add_argument("--horizons", type=_csv(int), default=DEFAULT_HORIZONS)
+    parser.add_argument("--thrs", type=_csv(float), default=DEFAULT_THRS, help="mode D thresholds")
+    parser.add_argument("--no-direction", action="store_true", help="skip the mode A model per horizon")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    train_grid(
+        args.symbols,
+        horizons=args.horizons,
+        thrs=args.thrs,
+        direction=not args.no_direction,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
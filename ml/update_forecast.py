@@ -0,0 +1,231 @@
+"""
+Incremental model refresh: bring a saved model up to date with the candles
+whose target became known after its `trained_until`, without a retrain.
+
+  python ml/update_forecast.py BTCUSD 60 --mode D --thr 0.0035
+  python ml/update_forecast.py --all
+
+For each model:
+
+  1. the new rows are scored with the current model first, so they are
+     out-of-sample, and join a rolling window of the last ONLINE_OOS_ROWS
+     such scores; the payload's metrics are recomputed on that window
+  2. the StandardScaler takes them with partial_fit (running mean / var
+     over every row ever seen); the classifier weights are re-expressed in
+     the new scale so the decision function is unchanged by this step
+  3. the classifier takes one warm-started Newton step on the objective
+     LogisticRegression minimises over every row seen so far. The rows
+     already learned sit at its minimum, so the gradient needs only the
+     new rows; the curvature of all rows is kept as a running sum (seeded
+     from the training rows on the first update)
+
+The payload keeps its format (Pipeline(StandardScaler, LogisticRegression),
+same keys) plus an "online" entry with the rolling window and curvature, so
+predict.py and predict_server.py load updated models unchanged. A full
+train_forecast.py run resets all of it.
+"""
+import argparse
+import os
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+from sklearn.metrics import accuracy_score, average_precision_score, roc_auc_score
+
+from features import add_features
+from model_store import MODEL_NAME
+from ohlcv_data import load_ohlcv
+from train_forecast import DEFAULT_THR, make_target, model_out_path
+
+MODELS_DIR = Path(__file__).resolve().parent / "models"
+ONLINE_OOS_ROWS = int(os.getenv("ONLINE_OOS_ROWS", "5000"))
+
+# candles read before trained_until so the first new rows get full feature
+# windows even across gaps in the data
+WARMUP_LOOKBACK = timedelta(hours=6)
+
+
+def labelled_rows(symbol: str, horizon: int, mode: str, thr: float, feature_cols, since=None) -> pd.DataFrame:
+    """Featured rows with a known target, as train_forecast.train() builds them."""
+    df = load_ohlcv(symbol, since=since)
+    df = make_target(add_features(df), horizon=horizon, mode=mode, thr=thr)
+    return df.dropna(subset=list(feature_cols) + ["y"])
+
+
+def new_rows(symbol: str, horizon: int, mode: str, thr: float, feature_cols, after: pd.Timestamp) -> pd.DataFrame:
+    """Featured, labelled rows with bucket > `after` whose target is known."""
+    df = labelled_rows(symbol, horizon, mode, thr, feature_cols, since=(after - WARMUP_LOOKBACK).to_pydatetime())
+    return df[df["bucket"] > after]
+
+
+def _augmented(X: np.ndarray) -> np.ndarray:
+    return np.hstack([X, np.ones((len(X), 1))])
+
+
+def _to_scaled(scaler) -> np.ndarray:
+    """M with [z, 1] = M @ [x, 1] for the scaler's z = (x - mean) / scale."""
+    k = len(scaler.mean_)
+    m = np.eye(k + 1)
+    m[:k, :k] = np.diag(1.0 / scaler.scale_)
+    m[:k, k] = -scaler.mean_ / scaler.scale_
+    return m
+
+
+def _theta(clf) -> np.ndarray:
+    return np.append(clf.coef_[0], clf.intercept_[0])
+
+
+def _set_theta(clf, theta: np.ndarray) -> None:
+    clf.coef_[0] = theta[:-1]
+    clf.intercept_[0] = theta[-1]
+
+
+def fisher(model, X: np.ndarray) -> np.ndarray:
+    """C * sum p(1-p) [x,1][x,1]^T over rows X: the log-loss curvature, in raw feature space."""
+    p = model.predict_proba(X)[:, 1]
+    X1 = _augmented(X)
+    return model.named_steps["clf"].C * (X1.T * (p * (1 - p))) @ X1
+
+
+def rescale(clf, old: np.ndarray, new: np.ndarray) -> None:
+    """Rewrite clf's weights from scaled space old (see _to_scaled) to new; the decision function is unchanged."""
+    raw = old.T @ _theta(clf)
+    _set_theta(clf, np.linalg.solve(new.T, raw))
+
+
+def newton_step(clf, M: np.ndarray, F: np.ndarray, Z: np.ndarray, y: np.ndarray) -> None:
+    """
+    One Newton step on LogisticRegression's objective over every row seen,
+    ||w||^2 / 2 + C * sum(log-loss), from clf's current weights.
+
+    The weights minimise that objective for the rows already learned, so
+    only the new rows (Z, y) contribute to the gradient. F is the
+    curvature of every row seen, including these, in raw feature space;
+    M maps it to the scaled space the weights live in.
+    """
+    p = expit(Z @ clf.coef_[0] + clf.intercept_[0])
+    grad = clf.C * _augmented(Z).T @ (p - y)
+    ridge = np.eye(len(grad))
+    ridge[-1, -1] = 0.0  # intercept is not penalised
+    hess = ridge + M @ F @ M.T
+    _set_theta(clf, _theta(clf) - np.linalg.solve(hess, grad))
+
+
+def rolling_metrics(online: dict, payload: dict) -> None:
+    """Recompute payload["metrics"] on the out-of-sample window once it holds both classes."""
+    y = np.asarray(online["y"])
+    proba = np.asarray(online["proba"])
+    if len(np.unique(y)) < 2:
+        return
+    payload["metrics"] = {
+        "auc_mean": float(roc_auc_score(y, proba)),
+        "acc_mean": float(accuracy_score(y, (proba >= 0.5).astype(int))),
+        "prauc_mean": float(average_precision_score(y, proba)),
+        "prauc_baseline": float(np.mean(y)),
+    }
+
+
+def update_model(path: Path) -> int:
+    """Update one saved model in place; returns the number of new rows it learned from."""
+    payload = joblib.load(path)
+    symbol, horizon, mode, thr = payload["symbol"], payload["horizon"], payload["mode"], payload["thr"]
+    feature_cols = payload["feature_cols"]
+    after = pd.Timestamp(payload["trained_until"])
+
+    df = new_rows(symbol, horizon, mode, thr, feature_cols, after)
+    if df.empty:
+        print(f"{path.name}: up to date (trained_until={after.isoformat()})")
+        return 0
+
+    X = df[feature_cols].to_numpy(dtype=np.float64)
+    y = df["y"].to_numpy(dtype=np.int64)
+    model = payload["model"]
+    scaler, clf = model.named_steps["scaler"], model.named_steps["clf"]
+
+    # 1. score before learning: these predictions are out-of-sample
+    online = payload.get("online") or {"y": [], "proba": [], "updates": 0, "rows": 0}
+    online["y"] = (online["y"] + y.tolist())[-ONLINE_OOS_ROWS:]
+    online["proba"] = (online["proba"] + model.predict_proba(X)[:, 1].tolist())[-ONLINE_OOS_ROWS:]
+
+    if "fisher" not in online:
+        # first update: curvature of the rows the model was trained on
+        old = labelled_rows(symbol, horizon, mode, thr, feature_cols)
+        old = old[old["bucket"] <= after]
+        online["fisher"] = fisher(model, old[feature_cols].to_numpy(dtype=np.float64))
+
+    # 2. running scaler statistics, weights carried over to the new scale
+    before = _to_scaled(scaler)
+    scaler.partial_fit(X)
+    rescale(clf, before, _to_scaled(scaler))
+    online["fisher"] = online["fisher"] + fisher(model, X)
+
+    # 3. warm-started Newton step on the whole objective, from the new rows only
+    newton_step(clf, _to_scaled(scaler), online["fisher"], scaler.transform(X), y)
+
+    n_old = int(payload["trained_rows"])
+    positive_rate = payload.get("positive_rate") or 0.0
+    payload["positive_rate"] = float((positive_rate * n_old + y.sum()) / (n_old + len(y)))
+    payload["trained_rows"] = n_old + len(y)
+    payload["trained_until"] = df["bucket"].max().isoformat()
+    online["updates"] += 1
+    online["rows"] += len(y)
+    online["window"] = ONLINE_OOS_ROWS
+    payload["online"] = online
+    rolling_metrics(online, payload)
+
+    # the prediction server may be reading the file: swap it in atomically
+    tmp = path.with_name(f"_{path.name}.tmp")
+    joblib.dump(payload, tmp)
+    os.replace(tmp, path)
+
+    m = payload["metrics"]
+    print(
+        f"{path.name}: +{len(y)} rows until {payload['trained_until']}  "
+        f"OOS({len(online['y'])}) AUC={m['auc_mean']:.3f} PR-AUC={m['prauc_mean']:.3f} "
+        f"baseline={m['prauc_baseline']:.3f} ACC={m['acc_mean']:.3f}"
+    )
+    return len(y)
+
+
+def update_all(models_dir: Path = MODELS_DIR) -> int:
+    total = 0
+    for path in sorted(models_dir.glob("*.joblib")):
+        # same naming rule as predict_server's manifest (<SYM>_h<H>_<mode>[_thr...])
+        if MODEL_NAME.match(path.name) is None:
+            print(f"⚠️  {path.name}: not a <SYMBOL>_h<H>_<mode> model file, skipping")
+            continue
+        # one unreadable or incompatible model must not stop the others
+        try:
+            total += update_model(path)
+        except Exception as e:
+            print(f"❌ {path.name}: {type(e).__name__}: {e}")
+    return total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbol", type=str, nargs="?")
+    parser.add_argument("horizon_minutes", type=int, nargs="?")
+    parser.add_argument("--mode", type=str, default="A", choices=["A", "D"])
+    parser.add_argument("--thr", type=float, default=DEFAULT_THR)
+    parser.add_argument("--all", action="store_true", help="update every model in ml/models")
+    args = parser.parse_args(argv)
+    if not args.all and (args.symbol is None or args.horizon_minutes is None):
+        parser.error("give SYMBOL HORIZON_MINUTES or --all")
+    return args
+
+
+def main(argv: Optional[list] = None):
+    args = parse_args(argv)
+    if args.all:
+        update_all()
+    else:
+        update_model(model_out_path(MODELS_DIR, args.symbol, args.horizon_minutes, args.mode, args.thr))
+
+
+if __name__ == "__main__":
+    main()
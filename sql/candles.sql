@@ -0,0 +1,19 @@
+-- Native OHLCV candles (ingest/candle_sink.py).
+-- Keyed by (symbol, granularity, bucket); granularity is in seconds (60 = 1m).
+-- Filled straight from exchange candles, so reads need no tick aggregation.
+-- ingest/rollup.py (ROLLUP=1) also keeps 60/300/900/3600/86400 bars here,
+-- rolled up from the websocket ticks as they arrive.
+
+create table if not exists public.candles (
+    symbol      text        not null,
+    granularity integer     not null,
+    bucket      timestamptz not null,
+    open        numeric     not null,
+    high        numeric     not null,
+    low         numeric     not null,
+    close       numeric     not null,
+    volume      numeric,
+    source      text        not null default 'coinbase',
+    updated_at  timestamptz not null default now(),
+    primary key (symbol, granularity, bucket)
+);
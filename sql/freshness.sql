@@ -0,0 +1,14 @@
+-- Freshness tracing (common/freshness.py), enabled with TRACK_FRESHNESS=1.
+--   event_time / bucket  exchange time (already there)
+--   received_at          when the ingester got the tick or candle
+--   committed_at         when the row was written, stamped by the database
+-- Columns are added without a default first so existing rows are not
+-- rewritten (they stay NULL); only new rows get clock_timestamp().
+
+alter table public.ticks add column if not exists received_at timestamptz;
+alter table public.ticks add column if not exists committed_at timestamptz;
+alter table public.ticks alter column committed_at set default clock_timestamp();
+
+alter table public.candles add column if not exists received_at timestamptz;
+alter table public.candles add column if not exists committed_at timestamptz;
+alter table public.candles alter column committed_at set default clock_timestamp();
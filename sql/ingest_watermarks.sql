@@ -0,0 +1,13 @@
+-- High-water marks for incremental backfills (ingest/watermarks.py).
+-- One row per (symbol, granularity, source): the newest candle time loaded.
+-- Optional: without this table the backfill falls back to max(event_time)
+-- from public.ticks.
+
+create table if not exists public.ingest_watermarks (
+    symbol      text        not null,
+    granularity integer     not null,
+    source      text        not null,
+    high_water  timestamptz not null,
+    updated_at  timestamptz not null default now(),
+    primary key (symbol, granularity, source)
+);